@@ -0,0 +1,65 @@
+"""Benchmark operations on arrays, comparing them to doing the same arithmetic one number at a time in a loop"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import os
+import sys
+import time
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+from library.interpreter import evaluate
+from library.interpreter.parse import Parser
+from library.interpreter.variables import Array, Float, builtin_frame
+
+SAMPLES = 10_000
+
+PROGRAMS = {
+    'scale and offset': (
+        f'float x = 0.0; for (int i = 0; i < {SAMPLES}; i++) {{ x = i * 2.5 + 1.0; }}',
+        'array scaled = samples * 2.5 + 1.0;',
+    ),
+    'compare': (
+        f'bool below = false; for (int i = 0; i < {SAMPLES}; i++) {{ below = i < 5000; }}',
+        'array below = samples < 5000;',
+    ),
+    'sum': (
+        f'float total = 0.0; for (int i = 0; i < {SAMPLES}; i++) {{ total += i; }}',
+        'float total = samples.sum;',
+    ),
+}
+
+
+def new_parser() -> Parser:
+    """Create a parser with the built in types declared, and an array of samples to work on"""
+    parser = Parser(Float)
+    parser.context.push(builtin_frame())
+    parser.context.declare('samples', Array, Array(range(SAMPLES)))
+    return parser
+
+
+def time_program(code: str) -> float:
+    """Time how long it takes to run the code"""
+    parser = new_parser()
+    parser.parse_code(code)  # exclude parsing from the timings
+    start = time.perf_counter()
+    evaluate(code, parser=parser, collect=False)
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark"""
+    print(f'{"program":<20}{"loop":>12}{"array":>12}{"speed up":>10}')
+    for name, (loop_code, array_code) in PROGRAMS.items():
+        looped = time_program(loop_code)
+        vectorized = time_program(array_code)
+        print(f'{name:<20}{looped * 1000:>10.1f}ms{vectorized * 1000:>10.2f}ms{looped / vectorized:>9.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark loops in the interpreter, comparing the tree walker to the compiled closures"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import os
+import sys
+import time
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+from library.interpreter import evaluate
+from library.interpreter.parse import Parser
+from library.interpreter.variables import Variable, Type, Integer, Rational, Boolean
+
+ITERATIONS = 100_000
+REPEATS = 3  # the fastest run of each program is reported, as the slower ones mostly measure other work on the machine
+TARGET_SPEED_UP = 10  # what compiling to closures set out to reach over the tree walker; it is not reached yet
+
+PROGRAMS = {
+    'for': f'int a = 0; for (int i = 0; i < {ITERATIONS}; i++) {{ a += i; }}',
+    'for, nested blocks': f'int a = 0; for (int i = 0; i < {ITERATIONS}; i++) {{ {{ {{ a += i; }} }} }}',
+    'for, declaring': f'int a = 0; for (int i = 0; i < {ITERATIONS}; i++) {{ int b = i; a += b; }}',
+    'while': f'int a = 0; while (a < {ITERATIONS}) a++;',
+    'while, declaring': f'int a = 0; while (a < {ITERATIONS}) {{ int b = a; b++; a = b; }}',
+}
+
+
+def new_parser() -> Parser:
+    """Create a parser with the built in types declared"""
+    parser = Parser()
+    parser.context.push({
+        'int': Variable(Integer, Type, True),
+        'rational': Variable(Rational, Type, True),
+        'bool': Variable(Boolean, Type, True),
+    })
+    return parser
+
+
+def time_program(code: str, *, compiled: bool) -> float:
+    """Time how long it takes to run the code, at best"""
+    timings = []
+    for _ in range(REPEATS):
+        parser = new_parser()
+        parser.parse_code(code)  # exclude parsing from the timings
+        start = time.perf_counter()
+        evaluate(code, parser=parser, compiled=compiled)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    """Run the benchmark"""
+    print(f'{"program":<20}{"tree walker":>14}{"compiled":>14}{"speed up":>10}')
+    for name, code in PROGRAMS.items():
+        walked = time_program(code, compiled=False)
+        compiled = time_program(code, compiled=True)
+        print(f'{name:<20}{walked * 1000:>12.1f}ms{compiled * 1000:>12.1f}ms{walked / compiled:>9.2f}x')
+    print(f'{"target":<48}{TARGET_SPEED_UP:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Benchmark the memory allocated by the interpreter while it runs loop heavy programs"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import os
+import sys
+import tracemalloc
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+from library.interpreter import evaluate
+from library.interpreter.parse import Parser
+from library.interpreter.variables import builtin_frame
+
+ITERATIONS = 20_000
+STATEMENTS = 2_000
+
+PROGRAMS = {
+    'integer loop': f'int a = 0; for (int i = 0; i < {ITERATIONS}; i++) {{ int b = i * 3; a += b - 300; }}',
+    'rational loop': f'rational a = 0.5; for (int i = 0; i < {ITERATIONS}; i++) {{ a += 0.25; a -= 0.125; }}',
+    'long script': ''.join(f'int x{i} = {i}; while (x{i} < {i + 3}) {{ x{i}++; }}\n' for i in range(STATEMENTS)),
+}
+
+
+def new_parser() -> Parser:
+    """Create a parser with the built in types declared"""
+    parser = Parser()
+    parser.context.push(builtin_frame())
+    return parser
+
+
+def measure(code: str, *, compiled: bool) -> tuple[int, int, int]:
+    """Measure the peak memory, and the memory allocated, while parsing and running the code"""
+    parser = new_parser()
+    parser.cache.clear()
+    tracemalloc.start()
+    try:
+        tree = parser.parse_code(code)
+        parsed, _ = tracemalloc.get_traced_memory()
+        before = tracemalloc.take_snapshot()
+        evaluate(code, parser=parser, compiled=compiled, collect=False)
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename') if stat.size_diff > 0)
+    del tree
+    return parsed, peak, allocated
+
+
+def main():
+    """Run the benchmark"""
+    print(f'{"program":<16}{"mode":<10}{"tree":>10}{"peak":>10}{"retained":>10}')
+    for name, code in PROGRAMS.items():
+        for compiled in (False, True):
+            parsed, peak, allocated = measure(code, compiled=compiled)
+            mode = 'compiled' if compiled else 'walked'
+            print(f'{name:<16}{mode:<10}{parsed / 1024:>8.0f}KB{peak / 1024:>8.0f}KB{allocated / 1024:>8.0f}KB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark sending messages between sockets on this machine"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+from library.network._socket import FRAME_FORMATS
+from library.network.client import Client
+from library.network.message import Message
+from library.network.server import Server
+
+# the number of messages to send for each body size
+THROUGHPUT = {
+    16: 50_000,
+    1024: 20_000,
+    64 * 1024: 1_000,
+    1024 * 1024: 50,
+}
+
+ROUND_TRIPS = 2_000
+REQUESTS = 10_000
+
+
+def time_throughput(size: int, count: int, frame_format: str) -> float:
+    """Time how long it takes to receive `count` messages with bodies of `size` bytes over a socket pair"""
+    client = Client()
+    sender, receiver = socket.socketpair()
+    client.frame_formats[sender] = frame_format
+    message = Message.file('x' * size)
+
+    def _send() -> None:
+        for _ in range(count):
+            client.send(message, target=sender)
+
+    thread = threading.Thread(target=_send, daemon=True)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(count):
+        client.receive(target=receiver)
+    elapsed = time.perf_counter() - start
+    thread.join()
+    for s in (client.socket, sender, receiver):
+        s.close()
+    return elapsed
+
+
+def start_echo_server() -> Server:
+    """Start a server on the loopback interface which echoes every message back"""
+    server = Server(lambda send, message: send(message), hostname='127.0.0.1', port=0)
+    server.connect()
+    server.socket.listen()
+    threading.Thread(target=server.serve_concurrently, daemon=True).start()
+    return server
+
+
+def time_round_trips(count: int, frame_format: str) -> list[float]:
+    """Time each of `count` messages sent to a server on the loopback interface and echoed back"""
+    server = start_echo_server()
+    client = Client(hostname='127.0.0.1', port=server.socket.getsockname()[1], frame_format=frame_format)
+    client.connect()
+    message = Message.code('int x = 1;')
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        client.send(message)
+        client.receive()
+        timings.append(time.perf_counter() - start)
+    client.socket.close()
+    server.socket.close()
+    return timings
+
+
+def time_requests(count: int, *, pipelined: bool) -> float:
+    """Time `count` requests to an echoing server, either waiting for each reply in turn or all at once"""
+    server = start_echo_server()
+    client = Client(hostname='127.0.0.1', port=server.socket.getsockname()[1])
+    client.connect()
+    message = Message.code('int x = 1;')
+    start = time.perf_counter()
+    if pipelined:
+        for future in [client.request(message) for _ in range(count)]:
+            future.result()
+    else:
+        for _ in range(count):
+            client.request(message).result()
+    elapsed = time.perf_counter() - start
+    client.socket.close()
+    server.socket.close()
+    return elapsed
+
+
+def main():
+    """Run the benchmark"""
+    print(f'{"frames":<8}{"body size":>10}{"messages":>10}{"messages/s":>14}{"MB/s":>10}')
+    for frame_format in FRAME_FORMATS:
+        for size, count in THROUGHPUT.items():
+            elapsed = time_throughput(size, count, frame_format)
+            print(f'{frame_format:<8}{size:>10}{count:>10}{count / elapsed:>14.0f}{size * count / elapsed / 1e6:>10.1f}')
+    print()
+    print(f'{"frames":<8}{"median":>10}{"p99":>10}{"max":>10}')
+    for frame_format in FRAME_FORMATS:
+        timings = sorted(time_round_trips(ROUND_TRIPS, frame_format))
+        p99 = timings[int(len(timings) * 0.99)]
+        print(f'{frame_format:<8}{statistics.median(timings) * 1e6:>8.0f}us{p99 * 1e6:>8.0f}us{timings[-1] * 1e6:>8.0f}us')
+    print()
+    print(f'{"requests":<12}{"requests/s":>12}')
+    for name, pipelined in (('in turn', False), ('pipelined', True)):
+        print(f'{name:<12}{REQUESTS / time_requests(REQUESTS, pipelined=pipelined):>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
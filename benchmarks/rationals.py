@@ -0,0 +1,53 @@
+"""Benchmark sums of decimals, comparing rationals to floats"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import os
+import sys
+import time
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+from library.interpreter import evaluate
+from library.interpreter.parse import Parser
+from library.interpreter.variables import Float, Rational, Value, builtin_frame
+
+ITERATIONS = 20_000
+
+PROGRAMS = {
+    'same places': f'auto a = 0.0; for (int i = 0; i < {ITERATIONS}; i++) {{ a += 0.25; }}',
+    'mixed places': f'auto a = 0.0; for (int i = 0; i < {ITERATIONS}; i++) {{ a += 0.1; a -= 0.05; }}',
+    'with integers': f'auto a = 0.5; for (int i = 0; i < {ITERATIONS}; i++) {{ a += 0.125 + i; }}',
+}
+
+
+def new_parser(decimals: type[Value]) -> Parser:
+    """Create a parser with the built in types declared"""
+    parser = Parser(decimals)
+    parser.context.push(builtin_frame())
+    return parser
+
+
+def time_program(code: str, decimals: type[Value]) -> float:
+    """Time how long it takes to run the code, parsing decimals as `decimals`"""
+    parser = new_parser(decimals)
+    parser.parse_code(code)  # exclude parsing from the timings
+    start = time.perf_counter()
+    evaluate(code, parser=parser, collect=False)
+    return time.perf_counter() - start
+
+
+def main():
+    """Run the benchmark"""
+    print(f'{"program":<16}{"rationals":>12}{"floats":>12}')
+    for name, code in PROGRAMS.items():
+        print(f'{name:<16}{time_program(code, Rational) * 1000:>10.1f}ms{time_program(code, Float) * 1000:>10.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""Benchmark how long it takes to import the interpreter with and without the saved parse tables"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+from library.interpreter import _parse_tables
+
+RUNS = 20
+IMPORT = 'import time; start = time.perf_counter(); import library.interpreter; print(time.perf_counter() - start)'
+
+
+def time_import(*, cold: bool) -> float:
+    """Time a fresh interpreter importing the parser, optionally removing the saved tables first"""
+    if cold:
+        _parse_tables.TABLES_FILE.unlink(missing_ok=True)
+    result = subprocess.run(
+        [sys.executable, '-c', IMPORT],
+        cwd=__directory__.parent, check=True, capture_output=True, text=True,
+    )
+    return float(result.stdout)
+
+
+def main():
+    """Run the benchmark"""
+    cold = [time_import(cold=True) for _ in range(RUNS)]
+    warm = [time_import(cold=False) for _ in range(RUNS)]
+    print(f'{"tables":<10}{"median":>10}{"min":>10}')
+    for name, timings in (('built', cold), ('loaded', warm)):
+        print(f'{name:<10}{statistics.median(timings) * 1000:>8.1f}ms{min(timings) * 1000:>8.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,7 @@ __all__ = ['InteractivePromptController']
 
 from client.connect_controller import ConnectController
 from client.robot import Robot
+from library.interpreter.incremental import IncrementalParser
 from library.network.client import Client
 from library.network.message import Message
 from library.ui import GUI
@@ -17,6 +18,8 @@ class InteractivePromptController(GUI):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.client = None
+        # the command is checked as it is typed, so only the lines after the last change are parsed again
+        self.syntax_checker = IncrementalParser()
 
     def connect(self, robot: Robot):
         """Connect to the given robot"""
@@ -107,6 +110,11 @@ class InteractivePromptController(GUI):
     def on_help_clicked(self) -> None:
         """Show the help window"""
 
+    def on_command_changed(self) -> None:
+        """Check the syntax of the command as it is typed"""
+        error = self.syntax_checker.check(self.get_command())
+        self.set_syntax_error('' if error is None else error)
+
     def on_execute_clicked(self) -> None:
         """Send the command to the robot"""
         if self.client is None:
@@ -4,15 +4,44 @@ __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
 __all__ = ['evaluate']
 
-from typing import Optional
+from typing import Optional, Callable, Type as PyType
 
 from .lex import tokenize, Lexer
 from .parse import parse, Parser, default_parser
+from .variables import Value
 
 
-def evaluate(code: str, *, lexer: Optional[Lexer] = None, parser: Optional[Parser] = None):
-    """Evaluate a code string"""
-    t = tokenize if lexer is None else lexer.tokenize
+def evaluate(
+        code: str, *, lexer: Optional[Lexer] = None, parser: Optional[Parser] = None, compiled: bool = True,
+        on_result: Optional[Callable[[Optional[Value]], None]] = None, collect: bool = True,
+        decimals: Optional[PyType[Value]] = None
+):
+    """Evaluate a code string, compiling the tree to closures unless `compiled` is False"""
     if parser is None:
         parser = default_parser
-    return parser.parse(t(code)).evaluate(parser.context)
+    if decimals is not None and decimals is not parser.decimals:
+        # the code is run in the same context, by a parser which parses decimals as the given type of number
+        context, parser = parser.context, Parser(decimals)
+        parser.context = context
+    tree = parser.parse_code(code) if lexer is None else parser.parse(lexer.tokenize(code))
+    if on_result is not None:
+        # the statements of the program are run one at a time, so that each result is handled as soon as it is ready
+        if compiled:
+            return tree.compile_reporting(on_result, collect)(parser.context)
+        results = []
+        for statement in tree.children:
+            result = statement.evaluate(parser.context)
+            on_result(result)
+            if collect:
+                results.append(result)
+        return results if collect else None
+    if not collect:
+        # nothing keeps the result of a statement alive once the next one starts, so large programs use less memory
+        if compiled:
+            tree.compile_execute()(parser.context)
+        else:
+            tree.execute(parser.context)
+        return None
+    if compiled:
+        return tree.compile()(parser.context)
+    return tree.evaluate(parser.context)
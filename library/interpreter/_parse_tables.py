@@ -0,0 +1,117 @@
+"""Persist the LALR tables of the parser so that they only need to be built when the grammar changes"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['ParseTables', 'TABLES_FILE', 'SLY_VERSION', 'build', 'grammar_signature', 'load', 'save']
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple, Optional, Any
+
+from dependencies.sly.sly import __version__ as sly_version
+from dependencies.sly.sly.yacc import YaccError, LRTable
+
+TABLES_FORMAT = 2
+TABLES_FILE = Path(__file__).with_name('parsetab.json')
+# the version of sly whose private helpers `build` calls, which may be renamed or changed in any other version
+SLY_VERSION = '0.5'
+
+
+class ParseTables(NamedTuple):
+    """The parts of a `sly.yacc.LRTable` which are needed to parse, and the number of conflicts it resolved"""
+    lr_action: dict[int, dict[str, int]]
+    lr_goto: dict[int, dict[str, int]]
+    defaulted_states: dict[int, int]
+    sr_conflicts: int = 0
+    rr_conflicts: int = 0
+
+    @classmethod
+    def from_lrtable(cls, tables: LRTable) -> 'ParseTables':
+        """Keep the parts of a newly built table which are needed to parse"""
+        return cls(
+            tables.lr_action, tables.lr_goto, tables.defaulted_states,
+            len(tables.sr_conflicts), len(tables.rr_conflicts),
+        )
+
+
+def grammar_signature(grammar: Any, precedence: tuple) -> str:
+    """Get a hash which changes whenever the tables built from the grammar would change"""
+    h = hashlib.sha256()
+    h.update(f'{TABLES_FORMAT}:{sly_version}\n'.encode())
+    h.update(repr(precedence).encode())
+    h.update(repr(sorted(grammar.Terminals)).encode())
+    for production in grammar.Productions:
+        h.update(f'\n{production}'.encode())
+    return h.hexdigest()
+
+
+def _int_keys(d: dict[str, Any]) -> dict[int, Any]:
+    return {int(k): v for k, v in d.items()}
+
+
+def load(signature: str, path: Path = TABLES_FILE) -> Optional[ParseTables]:
+    """Load the tables from `path` if they were built from a grammar with the given signature"""
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+    if data.get('format') != TABLES_FORMAT or data.get('signature') != signature:
+        return None
+    return ParseTables(
+        _int_keys(data['action']), _int_keys(data['goto']), _int_keys(data['defaulted']),
+        data['sr_conflicts'], data['rr_conflicts'],
+    )
+
+
+def save(signature: str, tables: ParseTables, path: Path = TABLES_FILE) -> None:
+    """Save the tables to `path`, ignoring failures as the tables can always be rebuilt"""
+    data = {
+        'format': TABLES_FORMAT,
+        'signature': signature,
+        'action': tables.lr_action,
+        'goto': tables.lr_goto,
+        'defaulted': tables.defaulted_states,
+        'sr_conflicts': tables.sr_conflicts,
+        'rr_conflicts': tables.rr_conflicts,
+    }
+    temp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    try:
+        temp_path.write_text(json.dumps(data, separators=(',', ':')))
+        os.replace(temp_path, path)
+    except OSError:
+        temp_path.unlink(missing_ok=True)
+
+
+def _report_conflicts(parser: Any, tables: ParseTables) -> None:
+    """Warn about the conflicts in the grammar which the parser does not expect, as sly does when it builds tables"""
+    conflicts = {
+        'shift/reduce': (tables.sr_conflicts, 'expected_shift_reduce'),
+        'reduce/reduce': (tables.rr_conflicts, 'expected_reduce_reduce'),
+    }
+    for kind, (count, expected) in conflicts.items():
+        if count and count != getattr(parser, expected, None):
+            parser.log.warning('%d %s conflict%s', count, kind, '' if count == 1 else 's')
+
+
+# noinspection PyProtectedMember
+def build(parser: Any, definitions: list[tuple[str, Any]]) -> None:
+    """Build the grammar of a sly parser class, loading its tables from disk unless the grammar has changed"""
+    if sly_version != SLY_VERSION:
+        raise YaccError(f'The parser needs sly {SLY_VERSION} to build its grammar, but sly {sly_version} is installed')
+    # sly's helpers are private to its Parser class, so are name mangled to `_Parser__*`
+    rules = parser._Parser__collect_rules(definitions)
+    if not rules and getattr(parser, '_lrtable', None) is not None:
+        # a subclass which only overrides methods shares the grammar of the parser it extends
+        return
+    if not parser._Parser__validate_specification():
+        raise YaccError('Invalid parser specification')
+    parser._Parser__build_grammar(rules)
+    signature = grammar_signature(parser._grammar, parser.precedence)
+    tables = load(signature, TABLES_FILE)
+    if tables is None:
+        tables = ParseTables.from_lrtable(LRTable(parser._grammar))
+        save(signature, tables, TABLES_FILE)
+    _report_conflicts(parser, tables)
+    parser._lrtable = tables
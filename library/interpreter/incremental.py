@@ -0,0 +1,86 @@
+"""Re-parsing of code which is edited a little at a time, such as the command typed into the interactive prompt"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['IncrementalParser']
+
+import bisect
+from typing import NamedTuple, Optional
+
+from dependencies.sly.sly import Parser as _Parser
+
+from .lex import Lexer, Token
+from .nodes import Node
+from .parse import Parser
+
+
+class _Statement(NamedTuple):
+    start: int
+    end: int
+    node: Node
+
+
+def _changed_line_offset(old: str, new: str) -> int:
+    """Get the offset of the start of the first line which differs between two versions of some code"""
+    # the common prefix is found by comparing slices, which is far faster than comparing one character at a time
+    low, high = 0, min(len(old), len(new))
+    while low < high:
+        middle = (low + high + 1) // 2
+        if old[:middle] == new[:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return new.rfind('\n', 0, low) + 1
+
+
+class IncrementalParser(Parser):
+    """Checks the syntax of a buffer as it is edited, reusing the statements which end before the first changed line"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.text = ''
+        self.statements: list[_Statement] = []
+        # how many statements were kept, and how many tokens were lexed, by the last update
+        self.reused = 0
+        self.lexed = 0
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(statements={len(self.statements)}, reused={self.reused}, lexed={self.lexed})'
+
+    def update(self, text: str) -> list[Node]:
+        """Parse the new contents of the buffer, returning its top level statements, which are not resolved"""
+        start = _changed_line_offset(self.text, text)
+        kept = bisect.bisect_right(self.statements, start, key=lambda statement: statement.end)
+        # the last statement before the change is parsed again, as an `else` after it would make it part of an `if`
+        kept = max(kept - 1, 0)
+        offset = self.statements[kept - 1].end if kept else 0
+        self.text = text
+        # what remains is always a complete program, even if the rest of the buffer has a syntax error
+        del self.statements[kept:]
+        self.reused = kept
+        tokens = list(Lexer().tokenize(text, text.count('\n', 0, offset) + 1, offset))
+        self.lexed = len(tokens)
+        if tokens:
+            # sly remembers the position of every value it has parsed, which only the latest parse needs
+            self._line_positions, self._index_positions = {}, {}
+            # the tree is parsed without resolving its names, as they depend on the statements before it
+            tree = _Parser.parse(self, iter(tokens))
+            for statement in tree.children:
+                self.statements.append(_Statement(*self.index_position(statement), statement))
+        return [statement.node for statement in self.statements]
+
+    def check(self, text: str) -> Optional[SyntaxError]:
+        """Get the first syntax error in the new contents of the buffer, if it has one"""
+        try:
+            self.update(text)
+        except SyntaxError as ex:
+            return ex
+        return None
+
+    def error(self, token: Optional[Token]):
+        """When an unexpected token is parsed, throw a syntax error"""
+        if token is None:
+            raise SyntaxError('The code ended before the last statement was complete')
+        # the index of a token is its offset in the buffer, so its column is counted from the start of its line
+        column = token.index - self.text.rfind('\n', 0, token.index)
+        raise SyntaxError(f'An unexpected "{token.value}" was encountered at line {token.lineno}, column {column}')
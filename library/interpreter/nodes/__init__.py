@@ -2,17 +2,51 @@
 
 __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
-__all__ = ['Node']
+__all__ = ['Node', 'CompiledNode', 'Steps']
 
 from abc import ABC, abstractmethod
-from typing import Optional
+from typing import Optional, Callable, Any, Generator
 
+from library.interpreter.scope import Scope
 from library.interpreter.variables import Context, Value
 
 
+CompiledNode = Callable[[Context], Any]
+# yields after each step of the program, then returns the value the node evaluates to
+Steps = Generator[None, None, Any]
+
+
 class Node(ABC):
     """Represents a node in the AST"""
 
+    # nodes are created for every part of every program, so none of them have an instance dictionary
+    __slots__ = ()
+
     @abstractmethod
     def evaluate(self, context: Context) -> Optional[Value]:
         """Evaluate the node"""
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the variables used by the node to the frame slots they are stored in"""
+
+    def execute(self, context: Context) -> None:
+        """Evaluate the node for its effects, discarding its value"""
+        self.evaluate(context)
+
+    def compile(self) -> CompiledNode:
+        """Compile the node to a closure which behaves like `evaluate`"""
+        return self.evaluate
+
+    def compile_execute(self) -> CompiledNode:
+        """Compile the node to a closure which behaves like `execute`"""
+        return self.compile()
+
+    def steps(self, context: Context) -> Steps:
+        """Evaluate the node as a single step, which statements containing other statements split into more steps"""
+        result = self.evaluate(context)
+        yield
+        return result
+
+    def fold(self) -> 'Node':
+        """Fold the constant parts of the node, returning the node which should take its place in the tree"""
+        return self
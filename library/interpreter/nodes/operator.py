@@ -4,11 +4,178 @@ __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
 __all__ = []
 
-from typing import Type as PyType
-
-from library.interpreter.nodes import Node
-from library.interpreter.nodes.variables import VariableAccessNode
-from library.interpreter.variables import Context, Value
+from typing import Type as PyType, Callable, Optional
+
+from library.interpreter.nodes import Node, CompiledNode
+from library.interpreter.nodes.variables import VariableAccessNode, ConstantNode
+from library.interpreter.scope import Binding, Scope, UNRESOLVED
+from library.interpreter.variables import Context, Value, Integer, Rational, Float, true, false
+
+FastPath = Callable[[Value, Value], Value]
+
+
+_FLOAT_OPERANDS = ((Float, Float), (Float, Integer), (Integer, Float))
+
+
+def _float_paths(operation: Callable[[float, float], float]) -> dict[tuple[type, type], FastPath]:
+    """Get the fast paths of an operation on floats, or on a float and an integer, which both hold a Python number"""
+    def fast_path(a: Value, b: Value) -> Value:
+        return Float(operation(a.value, b.value))
+    return dict.fromkeys(_FLOAT_OPERANDS, fast_path)
+
+
+def _float_comparisons(operation: Callable[[float, float], bool]) -> dict[tuple[type, type], FastPath]:
+    """Get the fast paths of a comparison of floats, or of a float and an integer"""
+    def fast_path(a: Value, b: Value) -> Value:
+        return true if operation(a.value, b.value) else false
+    return dict.fromkeys(_FLOAT_OPERANDS, fast_path)
+
+
+# Operations on the built-in number types which give the same results as their handlers, without calling them
+_FAST_PATHS: dict[str, dict[tuple[type, type], FastPath]] = {
+    'plus': {
+        (Integer, Integer): lambda a, b: Integer.from_int(a.value + b.value),
+        (Rational, Integer): lambda a, b: Rational(a.numerator + b.value * a.denominator, a.denominator),
+        (Integer, Rational): lambda a, b: Rational(b.numerator + a.value * b.denominator, b.denominator),
+        **_float_paths(lambda x, y: x + y),
+    },
+    'minus': {
+        (Integer, Integer): lambda a, b: Integer.from_int(a.value - b.value),
+        (Rational, Integer): lambda a, b: Rational(a.numerator - b.value * a.denominator, a.denominator),
+        (Integer, Rational): lambda a, b: Rational(a.value * b.denominator - b.numerator, b.denominator),
+        **_float_paths(lambda x, y: x - y),
+    },
+    'star': {
+        (Integer, Integer): lambda a, b: Integer.from_int(a.value * b.value),
+        (Rational, Integer): lambda a, b: Rational(a.numerator * b.value, a.denominator),
+        (Integer, Rational): lambda a, b: Rational(b.numerator * a.value, b.denominator),
+        **_float_paths(lambda x, y: x * y),
+    },
+    'slash': {
+        (Integer, Integer): lambda a, b: Rational(a.value, b.value),
+        (Rational, Integer): lambda a, b: Rational(a.numerator, a.denominator * b.value),
+        **_float_paths(lambda x, y: x / y),
+    },
+    'less': {
+        (Integer, Integer): lambda a, b: true if a.value < b.value else false,
+        **_float_comparisons(lambda x, y: x < y),
+    },
+    'less_equal': {
+        (Integer, Integer): lambda a, b: true if a.value <= b.value else false,
+        **_float_comparisons(lambda x, y: x <= y),
+    },
+    'greater': {
+        (Integer, Integer): lambda a, b: true if a.value > b.value else false,
+        **_float_comparisons(lambda x, y: x > y),
+    },
+    'greater_equal': {
+        (Integer, Integer): lambda a, b: true if a.value >= b.value else false,
+        **_float_comparisons(lambda x, y: x >= y),
+    },
+    'equality': {
+        (Integer, Integer): lambda a, b: true if a.value == b.value else false,
+        **_float_comparisons(lambda x, y: x == y),
+    },
+    'nonequality': {
+        (Integer, Integer): lambda a, b: true if a.value != b.value else false,
+        **_float_comparisons(lambda x, y: x != y),
+    },
+    'increment': {
+        (Integer,): lambda a: Integer.from_int(a.value + 1),
+    },
+    'decrement': {
+        (Integer,): lambda a: Integer.from_int(a.value - 1),
+    },
+}
+
+# The handlers which the fast paths stand in for, so that a fast path is not used once one of them is replaced
+_NATIVE_HANDLERS = {
+    (typ, name): getattr(typ, name) for typ in (Integer, Rational, Float) for name in dir(typ) if 'operator_' in name
+}
+
+_EXACT_ASSIGNMENT_TYPES = (Rational, Float)
+
+# the assignments which integers give the same results for as the operator, as long as the other operand is an integer
+_EXACT_INTEGER_ASSIGNMENTS = ('plus', 'minus', 'star')
+
+_VALUE_META = type(Value)
+
+
+def _fast_path(name: str, *types: type) -> Optional[FastPath]:
+    """Get the fast path of an operation on the given types, unless any of their handlers have been replaced"""
+    fast_path = _FAST_PATHS.get(name, {}).get(types)
+    if fast_path is None:
+        return None
+    for (typ, handler_name), handler in _NATIVE_HANDLERS.items():
+        if typ in types and getattr(typ, handler_name, None) is not handler:
+            return None
+    return fast_path
+
+
+class _InlineCache:
+    """Remembers how an operation was dispatched for each combination of operand types it has been used with"""
+
+    # the most combinations which are remembered, beyond which the others are dispatched without the cache
+    MAX_ENTRIES = 8
+
+    __slots__ = ('targets', 'version')
+
+    def __init__(self) -> None:
+        self.targets: dict[tuple[type, ...], Callable] = {}
+        self.version = _VALUE_META.handlers_version
+
+    def lookup(self, types: tuple[type, ...], resolve: Callable[..., Callable]) -> Callable:
+        """Get the function which performs the operation on operands of the given types"""
+        if self.version != _VALUE_META.handlers_version:
+            # a handler has been added, replaced or removed since the targets were resolved
+            self.targets.clear()
+            self.version = _VALUE_META.handlers_version
+        if (target := self.targets.get(types)) is None:
+            target = resolve(*types)
+            if len(self.targets) < self.MAX_ENTRIES:
+                self.targets[types] = target
+        return target
+
+
+def _handler(typ: type, handler_name: str, arity: int) -> Optional[Callable]:
+    """Get the handler of an operation on a type, which native handlers can be called without going through `call`"""
+    handler = getattr(typ, handler_name, None)
+    return None if handler is None else handler.direct(arity)
+
+
+def _unary_target(name: str, op: str, a_type: type) -> Callable[[Value], Value]:
+    """Resolve the handler of a unary operation on an operand of the given type"""
+    if (fast_path := _fast_path(name, a_type)) is not None:
+        return fast_path
+    handler = _handler(a_type, f'unary_operator_{name}', 1)
+
+    def _dispatch(a: Value) -> Value:
+        if handler is not None and (result := handler(a)) is not NotImplemented:
+            return result
+        raise TypeError(
+            f'bad operand type for {op}: "{type(a).__name__}"'
+        )
+    return _dispatch
+
+
+def _binary_target(
+        name: str, op: str, handler_name: str, reverse_handler_name: str, a_type: type, b_type: type
+) -> Callable[[Value, Value], Value]:
+    """Resolve the handlers of a binary operation on operands of the given types"""
+    if (fast_path := _fast_path(name, a_type, b_type)) is not None:
+        return fast_path
+    handler = _handler(a_type, handler_name, 2)
+    reverse_handler = _handler(b_type, reverse_handler_name, 2)
+
+    def _dispatch(a: Value, b: Value) -> Value:
+        if handler is not None and (result := handler(a, b)) is not NotImplemented:
+            return result
+        if reverse_handler is not None and (result := reverse_handler(b, a)) is not NotImplemented:
+            return result
+        raise TypeError(
+            f'unsupported operand type(s) for {op}: "{type(a).__name__}" and "{type(b).__name__}"'
+        )
+    return _dispatch
 
 
 class UnaryOperatorNode(Node):
@@ -17,25 +184,43 @@ class UnaryOperatorNode(Node):
     name: str = None
     op: str = None
 
+    __slots__ = ('child', 'cache')
+
     def __init__(self, child: Node) -> None:
         self.child = child
+        self.cache = _InlineCache()
 
     def evaluate(self, context: Context) -> Value:
         """Evaluate the unary operation"""
         a = self.child.evaluate(context)
-        handler_name = f'unary_operator_{self.name}'
-        if hasattr(a, handler_name):
-            handler = getattr(a, handler_name)
-            if (result := handler.call(a)) is not NotImplemented:
-                return result
-        raise TypeError(
-            f'bad operand type for {self.op}: "{type(a).__name__}"'
-        )
+        return self.cache.lookup((type(a),), self._resolve_handler)(a)
+
+    def _resolve_handler(self, a_type: type) -> Callable[[Value], Value]:
+        return _unary_target(self.name, self.op, a_type)
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the operand"""
+        self.child.resolve(scope)
+
+    def fold(self) -> Node:
+        """Fold the operand, then the operation if the operand is constant"""
+        self.child = self.child.fold()
+        return ConstantNode.fold_operation(self, self.child)
+
+    def compile(self) -> CompiledNode:
+        """Compile the unary operation"""
+        child = self.child.compile()
+        lookup, resolve = self.cache.lookup, self._resolve_handler
+
+        def _evaluate(context: Context) -> Value:
+            a = child(context)
+            return lookup((type(a),), resolve)(a)
+        return _evaluate
 
 
 def _make_unary_operator(name: str, op: str) -> PyType[UnaryOperatorNode]:
     typ_name = ''.join(n.capitalize() for n in name.split('_')) + 'OperatorNode'
-    typ = type(typ_name, (UnaryOperatorNode,), {'name': name, 'op': op})
+    typ = type(typ_name, (UnaryOperatorNode,), {'name': name, 'op': op, '__slots__': ()})
     __all__.append(typ)
     # noinspection PyTypeChecker
     return typ
@@ -48,8 +233,12 @@ UnaryMinusOperatorNode = _make_unary_operator('minus', '+')
 class IncrementOperatorNode(Node):
     """Represents the increment operator"""
 
+    __slots__ = ('name', 'binding', 'cache')
+
     def __init__(self, name: str) -> None:
         self.name = name
+        self.binding: Binding = UNRESOLVED
+        self.cache = _InlineCache()
 
     def __repr__(self) -> str:
         return f'{type(self).__name__}({self.name})'
@@ -57,35 +246,65 @@ class IncrementOperatorNode(Node):
     def evaluate(self, context: Context) -> Value:
         """Evaluate the unary operation"""
         a = context[self.name]
-        handler_name = 'unary_operator_increment'
-        if hasattr(a, handler_name):
-            handler = getattr(a, handler_name)
-            if (result := handler.call(a)) is not NotImplemented:
-                context[self.name] = result
-                return result
-        raise TypeError(
-            f'bad operand type for ++: "{type(a).__name__}"'
-        )
+        result = self.cache.lookup((type(a),), self._resolve_handler)(a)
+        context[self.name] = result
+        return result
+
+    def _resolve_handler(self, a_type: type) -> Callable[[Value], Value]:
+        return _unary_target('increment', '++', a_type)
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the variable which is changed"""
+        self.binding = scope.lookup(self.name)
+
+    def compile(self) -> CompiledNode:
+        """Compile the unary operation"""
+        load, store = Context.loader(self.name, self.binding), Context.storer(self.name, self.binding)
+        lookup, resolve = self.cache.lookup, self._resolve_handler
+
+        def _evaluate(context: Context) -> Value:
+            a = load(context)
+            result = lookup((type(a),), resolve)(a)
+            store(context, result)
+            return result
+        return _evaluate
 
 
 class DecrementOperatorNode(Node):
     """Represents the increment operator"""
 
+    __slots__ = ('name', 'binding', 'cache')
+
     def __init__(self, name: str) -> None:
         self.name = name
+        self.binding: Binding = UNRESOLVED
+        self.cache = _InlineCache()
 
     def evaluate(self, context: Context) -> Value:
         """Evaluate the unary operation"""
         a = context[self.name]
-        handler_name = 'unary_operator_decrement'
-        if hasattr(a, handler_name):
-            handler = getattr(a, handler_name)
-            if (result := handler.call(a)) is not NotImplemented:
-                context[self.name] = result
-                return result
-        raise TypeError(
-            f'bad operand type for --: "{type(a).__name__}"'
-        )
+        result = self.cache.lookup((type(a),), self._resolve_handler)(a)
+        context[self.name] = result
+        return result
+
+    def _resolve_handler(self, a_type: type) -> Callable[[Value], Value]:
+        return _unary_target('decrement', '--', a_type)
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the variable which is changed"""
+        self.binding = scope.lookup(self.name)
+
+    def compile(self) -> CompiledNode:
+        """Compile the unary operation"""
+        load, store = Context.loader(self.name, self.binding), Context.storer(self.name, self.binding)
+        lookup, resolve = self.cache.lookup, self._resolve_handler
+
+        def _evaluate(context: Context) -> Value:
+            a = load(context)
+            result = lookup((type(a),), resolve)(a)
+            store(context, result)
+            return result
+        return _evaluate
 
 
 class BinaryOperatorNode(Node):
@@ -94,32 +313,49 @@ class BinaryOperatorNode(Node):
     name: str = None
     op: str = None
 
+    __slots__ = ('left', 'right', 'cache')
+
     def __init__(self, left: Node, right: Node) -> None:
         self.left = left
         self.right = right
+        self.cache = _InlineCache()
 
     def evaluate(self, context: Context) -> Value:
         """Evaluate the binary operation"""
         a = self.left.evaluate(context)
         b = self.right.evaluate(context)
-        handler_name = f'operator_{self.name}'
-        if hasattr(a, handler_name):
-            handler = getattr(a, handler_name)
-            if (result := handler.call(a, b)) is not NotImplemented:
-                return result
-        reverse_handler_name = f'reverse_operator_{self.name}'
-        if hasattr(b, reverse_handler_name):
-            reverse_handler = getattr(b, reverse_handler_name)
-            if (result := reverse_handler.call(b, a)) is not NotImplemented:
-                return result
-        raise TypeError(
-            f'unsupported operand type(s) for {self.op}: "{type(a).__name__}" and "{type(b).__name__}"'
+        return self.cache.lookup((type(a), type(b)), self._resolve_handler)(a, b)
+
+    def _resolve_handler(self, a_type: type, b_type: type) -> Callable[[Value, Value], Value]:
+        return _binary_target(
+            self.name, self.op, f'operator_{self.name}', f'reverse_operator_{self.name}', a_type, b_type
         )
 
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the operands"""
+        self.left.resolve(scope)
+        self.right.resolve(scope)
+
+    def fold(self) -> Node:
+        """Fold the operands, then the operation if both operands are constant"""
+        self.left, self.right = self.left.fold(), self.right.fold()
+        return ConstantNode.fold_operation(self, self.left, self.right)
+
+    def compile(self) -> CompiledNode:
+        """Compile the binary operation"""
+        left, right = self.left.compile(), self.right.compile()
+        lookup, resolve = self.cache.lookup, self._resolve_handler
+
+        def _evaluate(context: Context) -> Value:
+            a = left(context)
+            b = right(context)
+            return lookup((type(a), type(b)), resolve)(a, b)
+        return _evaluate
+
 
 def _make_binary_operator(name: str, op: str) -> PyType[BinaryOperatorNode]:
     typ_name = ''.join(n.capitalize() for n in name.split('_')) + 'OperatorNode'
-    typ = type(typ_name, (BinaryOperatorNode,), {'name': name, 'op': op})
+    typ = type(typ_name, (BinaryOperatorNode,), {'name': name, 'op': op, '__slots__': ()})
     __all__.append(typ)
     # noinspection PyTypeChecker
     return typ
@@ -128,7 +364,28 @@ def _make_binary_operator(name: str, op: str) -> PyType[BinaryOperatorNode]:
 PlusOperatorNode = _make_binary_operator('plus', '+')
 MinusOperatorNode = _make_binary_operator('minus', '-')
 StarOperatorNode = _make_binary_operator('star', '*')
-SlashOperatorNode = _make_binary_operator('slash', '/')
+
+
+class SlashOperatorNode(BinaryOperatorNode):
+    """Represents the division operator, which divides integers into the type of number decimals are parsed as"""
+
+    name = 'slash'
+    op = '/'
+
+    __slots__ = ('decimals',)
+
+    def __init__(self, left: Node, right: Node, decimals: PyType[Value] = Rational) -> None:
+        super().__init__(left, right)
+        self.decimals = decimals
+
+    def _resolve_handler(self, a_type: type, b_type: type) -> Callable[[Value, Value], Value]:
+        if self.decimals is not Rational and a_type is Integer and b_type is Integer:
+            from_fraction = self.decimals.from_fraction
+            return lambda a, b: from_fraction(a.value, b.value)
+        return super()._resolve_handler(a_type, b_type)
+
+
+__all__.append(SlashOperatorNode)
 
 
 class ComparisonOperatorNode(BinaryOperatorNode):
@@ -136,28 +393,18 @@ class ComparisonOperatorNode(BinaryOperatorNode):
 
     back_name: str = None
 
-    def evaluate(self, context: Context):
-        """Evaluate the comparison operation"""
-        a = self.left.evaluate(context)
-        b = self.right.evaluate(context)
-        handler_name = f'operator_{self.name}'
-        if hasattr(a, handler_name):
-            handler = getattr(a, handler_name)
-            if (result := handler.call(a, b)) is not NotImplemented:
-                return result
-        back_handler_name = f'operator_{self.back_name}'
-        if hasattr(b, back_handler_name):
-            back_handler = getattr(b, back_handler_name)
-            if (result := back_handler.call(b, a)) is not NotImplemented:
-                return result
-        raise TypeError(
-            f'unsupported operand type(s) for {self.op}: "{type(a).__name__}" and "{type(b).__name__}"'
+    __slots__ = ()
+
+    def _resolve_handler(self, a_type: type, b_type: type) -> Callable[[Value, Value], Value]:
+        # if the left operand cannot be compared, the comparison is tried the other way around, e.g. `b > a`
+        return _binary_target(
+            self.name, self.op, f'operator_{self.name}', f'operator_{self.back_name}', a_type, b_type
         )
 
 
 def _make_comparison_operator(name: str, back_name: str, op: str) -> PyType[ComparisonOperatorNode]:
     typ_name = ''.join(n.capitalize() for n in name.split('_')) + 'OperatorNode'
-    typ = type(typ_name, (ComparisonOperatorNode,), {'name': name, 'back_name': back_name, 'op': op})
+    typ = type(typ_name, (ComparisonOperatorNode,), {'name': name, 'back_name': back_name, 'op': op, '__slots__': ()})
     __all__.append(typ)
     # noinspection PyTypeChecker
     return typ
@@ -177,28 +424,68 @@ class AssignmentOperatorNode(Node):
     name: str = None
     op: str = None
 
+    __slots__ = ('variable_name', 'child', 'binding', 'cache')
+
     def __init__(self, variable_name: str, child: Node) -> None:
         self.variable_name = variable_name
         self.child = child
+        self.binding: Binding = UNRESOLVED
+        self.cache = _InlineCache()
 
     def evaluate(self, context: Context):
         """Evaluate the operator"""
         a = context[self.variable_name]
         b = self.child.evaluate(context)
-        handler_name = f'assignment_operator_{self.name}'
-        if hasattr(a, handler_name):
-            handler = getattr(a, handler_name)
-            if (result := handler.call(a, b)) is not NotImplemented:
-                context[self.variable_name] = result
-                return result
-        raise TypeError(
-            f'unsupported operand type(s) for {self.op}=: "{type(a).__name__}" and "{type(b).__name__}"'
+        result = self.cache.lookup((type(a), type(b)), self._resolve_handler)(a, b)
+        context[self.variable_name] = result
+        return result
+
+    def _resolve_handler(self, a_type: type, b_type: type) -> Callable[[Value, Value], Value]:
+        # unlike integers, these numbers give the same results for `a += b` as for `a + b`
+        exact = a_type in _EXACT_ASSIGNMENT_TYPES or (
+            a_type is Integer and b_type is Integer and self.name in _EXACT_INTEGER_ASSIGNMENTS
         )
+        if exact and (fast_path := _fast_path(self.name, a_type, b_type)) is not None:
+            return fast_path
+        handler = _handler(a_type, f'assignment_operator_{self.name}', 2)
+        op = self.op
+
+        def _dispatch(a: Value, b: Value) -> Value:
+            if handler is not None and (result := handler(a, b)) is not NotImplemented:
+                return result
+            raise TypeError(
+                f'unsupported operand type(s) for {op}=: "{type(a).__name__}" and "{type(b).__name__}"'
+            )
+        return _dispatch
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the variable and the operand"""
+        self.binding = scope.lookup(self.variable_name)
+        self.child.resolve(scope)
+
+    def fold(self) -> Node:
+        """Fold the operand"""
+        self.child = self.child.fold()
+        return self
+
+    def compile(self) -> CompiledNode:
+        """Compile the operator"""
+        load, store = Context.loader(self.variable_name, self.binding), Context.storer(self.variable_name, self.binding)
+        child = self.child.compile()
+        lookup, resolve = self.cache.lookup, self._resolve_handler
+
+        def _evaluate(context: Context) -> Value:
+            a = load(context)
+            b = child(context)
+            result = lookup((type(a), type(b)), resolve)(a, b)
+            store(context, result)
+            return result
+        return _evaluate
 
 
 def _make_assignment_operator(name: str, op: str) -> PyType[BinaryOperatorNode]:
     typ_name = ''.join(n.capitalize() for n in name.split('_')) + 'OperatorNode'
-    typ = type(typ_name, (AssignmentOperatorNode,), {'name': name, 'op': op})
+    typ = type(typ_name, (AssignmentOperatorNode,), {'name': name, 'op': op, '__slots__': ()})
     __all__.append(typ)
     # noinspection PyTypeChecker
     return typ
@@ -216,10 +503,14 @@ class DotOperatorNode(Node):
     GET = object()
     SET = object()
 
-    def __init__(self, left: Node, right: Node, mode=GET) -> None:
+    __slots__ = ('left', 'right', 'mode', 'decimals')
+
+    def __init__(self, left: Node, right: Node, mode=GET, decimals: PyType[Value] = Rational) -> None:
         self.left = left
         self.right = right
         self.mode = mode
+        # the type of the numbers which decimals, i.e. getting from an integer, are converted to
+        self.decimals = decimals
 
     def evaluate(self, context: Context):
         """Evaluate the node"""
@@ -230,8 +521,57 @@ class DotOperatorNode(Node):
             else:
                 right = self.right.evaluate(context)
             if hasattr(left, 'operator_get'):
-                return left.operator_get.call(left, right)
+                return self._convert_decimal(left, left.operator_get.call(left, right), self.decimals)
             raise NameError(f'Cannot get {right} from {left}')
         if self.mode is self.SET:
             print('Setting', self.left, 'DOT', self.right)
 
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the operands, unless the right is a name to get from the left"""
+        self.left.resolve(scope)
+        if not isinstance(self.right, VariableAccessNode):
+            self.right.resolve(scope)
+
+    def fold(self) -> Node:
+        """Fold the operands, then the operation if it gets a value from a constant"""
+        self.left = self.left.fold()
+        if isinstance(self.right, VariableAccessNode):
+            operands = (self.left,)
+        else:
+            self.right = self.right.fold()
+            operands = (self.left, self.right)
+        if self.mode is not self.GET:
+            return self
+        return ConstantNode.fold_operation(self, *operands)
+
+    def compile(self) -> CompiledNode:
+        """Compile the node"""
+        if self.mode is not self.GET:
+            return self.evaluate
+        left = self.left.compile()
+        if isinstance(self.right, VariableAccessNode):
+            name = self.right.name
+
+            def right(_: Context) -> str:
+                return name
+        else:
+            right = self.right.compile()
+
+        decimals, convert = self.decimals, self._convert_decimal
+
+        def _evaluate(context: Context) -> Value:
+            a = left(context)
+            b = right(context)
+            handler = getattr(a, 'operator_get', None)
+            if handler is not None:
+                return convert(a, handler.call(a, b), decimals)
+            raise NameError(f'Cannot get {b} from {a}')
+        return _evaluate
+
+    @staticmethod
+    def _convert_decimal(left: Value, result: Value, decimals: PyType[Value]) -> Value:
+        # integers give exact decimals, which are converted if the program was parsed with another type of number
+        if decimals is not Rational and type(left) is Integer and type(result) is Rational:
+            return decimals.from_fraction(result.numerator, result.denominator)
+        return result
+
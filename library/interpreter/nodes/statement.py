@@ -4,18 +4,67 @@ __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
 __all__ = ['BlockNode', 'ForLoopNode', 'WhileLoopNode', 'IfNode']
 
-from typing import Optional
+from functools import partial
+from typing import Optional, Callable
 
-from library.interpreter.nodes import Node
-from library.interpreter.variables import Context, Value
+from library.interpreter.nodes import Node, CompiledNode, Steps
+from library.interpreter.nodes.variables import VariableDeclarationNode, NonLocalVariableNode
+from library.interpreter.scope import Scope
+from library.interpreter.variables import Context, Value, Frame, SlotFrame, ProgramFrame, ProgramInterrupted
+
+
+def _declares_names(*statements: Node) -> bool:
+    """Check whether any of the statements declare a name in the frame they are run in"""
+    return any(isinstance(s, (VariableDeclarationNode, NonLocalVariableNode)) for s in statements)
+
+
+def _frame_factory(names: Optional[dict[str, int]]) -> Optional[Callable[[], Frame]]:
+    """Get a function to create the frames of a scope, or None if the scope does not need a frame"""
+    if names is None:
+        return dict  # the scope was never resolved, so its variables are looked up by name
+    if not names:
+        return None
+    return partial(SlotFrame, names)
+
+
+def _run_in_frame(statement: CompiledNode, new_frame: Optional[Callable[[], Frame]]) -> CompiledNode:
+    """Wrap a compiled statement so that it is run in a new frame, if it needs one"""
+    if new_frame is None:
+        return statement
+
+    def _evaluate(context: Context) -> Optional[Value]:
+        context.push(new_frame())
+        try:
+            return statement(context)
+        finally:
+            context.pop()
+    return _evaluate
+
+
+def _run_in_program_frame(statement: CompiledNode, names: dict[str, int]) -> CompiledNode:
+    """Wrap the compiled top level of a program so that it is run in a slotted frame"""
+
+    def _evaluate(context: Context) -> Optional[Value]:
+        frame = ProgramFrame(names, context.peek())
+        context.push(frame)
+        try:
+            return statement(context)
+        finally:
+            context.pop()
+            frame.close()
+    return _evaluate
 
 
 class BlockNode(Node):
     """Represents a block of statements"""
 
+    __slots__ = ('children', 'push_frame', 'names', 'compiled')
+
     def __init__(self, children: list[Node], push_frame: bool = True) -> None:
         self.children = children
         self.push_frame = push_frame
+        self.names: Optional[dict[str, int]] = None
+        self.compiled: dict[bool, list[CompiledNode]] = {}
 
     def evaluate(self, context: Context) -> list[Optional[Value]]:
         """Evaluate the statements in the block"""
@@ -26,57 +75,314 @@ class BlockNode(Node):
             context.pop()
         return res
 
+    def execute(self, context: Context) -> None:
+        """Evaluate the statements in the block without keeping their results"""
+        if self.push_frame:
+            context.push()
+        for c in self.children:
+            c.execute(context)
+        if self.push_frame:
+            context.pop()
+
+    def steps(self, context: Context) -> Steps:
+        """Evaluate the statements in the block one step at a time"""
+        if self.push_frame:
+            context.push()
+        try:
+            res = []
+            for c in self.children:
+                res.append((yield from c.steps(context)))
+            return res
+        finally:
+            if self.push_frame:
+                context.pop()
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the statements in the block"""
+        if self.push_frame:
+            scope = scope.child(frame=_declares_names(*self.children))
+        self.names = scope.names
+        for c in self.children:
+            c.resolve(scope)
+
+    def resolve_inline(self, scope: Scope) -> None:
+        """Resolve the statements in the frame of the statement the block belongs to, rather than a frame of its own"""
+        self.names = {}
+        for c in self.children:
+            c.resolve(scope)
+
+    def fold(self) -> Node:
+        """Fold the statements in the block"""
+        self.children = [c.fold() for c in self.children]
+        self.compiled.clear()
+        return self
+
+    def compile_statements(self, keep_results: bool = True) -> list[CompiledNode]:
+        """Compile each statement in the block, once, so that a cached program is not compiled again when it is rerun"""
+        compiled = self.compiled.get(keep_results)
+        if compiled is None:
+            compiled = [c.compile() if keep_results else c.compile_execute() for c in self.children]
+            self.compiled[keep_results] = compiled
+        return compiled
+
+    def compile(self) -> CompiledNode:
+        """Compile the statements in the block"""
+        children = self.compile_statements()
+
+        def _evaluate(context: Context) -> list[Optional[Value]]:
+            return [c(context) for c in children]
+        return self._run_in_frame(_evaluate)
+
+    def compile_reporting(self, on_result: Callable[[Optional[Value]], None], collect: bool = True) -> CompiledNode:
+        """Compile the statements in the block, passing the result of each one to `on_result` as soon as it is ready"""
+        children = self.compile_statements()
+
+        def _evaluate(context: Context) -> Optional[list[Optional[Value]]]:
+            results = []
+            for c in children:
+                result = c(context)
+                on_result(result)
+                if collect:
+                    results.append(result)
+            return results if collect else None
+        return self._run_in_frame(_evaluate)
+
+    def compile_execute(self) -> CompiledNode:
+        """Compile the statements in the block, without keeping their results"""
+        children = self.compile_statements(keep_results=False)
+        if len(children) == 1:
+            # as with the body of most loops, which would otherwise pay for a loop of its own on every iteration
+            return self._run_in_frame(children[0])
+
+        def _execute(context: Context) -> None:
+            for c in children:
+                c(context)
+        return self._run_in_frame(_execute)
+
+    def _run_in_frame(self, statement: CompiledNode) -> CompiledNode:
+        """Wrap the compiled block so that it is run in its own frame, or in the program's frame at the top level"""
+        if self.push_frame:
+            return _run_in_frame(statement, _frame_factory(self.names))
+        if self.names is None:
+            return statement
+        return _run_in_program_frame(statement, self.names)
+
+
+def _resolve_iteration(body: Node, loop_scope: Scope) -> Scope:
+    """Resolve the body of a loop in the scope of its iterations, whose frame a block body uses as its own"""
+    if isinstance(body, BlockNode) and body.push_frame:
+        scope = loop_scope.child(frame=_declares_names(*body.children))
+        body.resolve_inline(scope)
+    else:
+        scope = loop_scope.child(frame=_declares_names(body))
+        body.resolve(scope)
+    return scope
+
 
 class ForLoopNode(Node):
     """Represents a for loop"""
 
+    __slots__ = ('init', 'check', 'change', 'body', 'loop_names', 'iteration_names')
+
     def __init__(self, init: Node, check: Node, change: Node, body: Node) -> None:
         self.init = init
         self.check = check
         self.change = change
         self.body = body
+        self.loop_names: Optional[dict[str, int]] = None
+        self.iteration_names: Optional[dict[str, int]] = None
 
     def evaluate(self, context: Context) -> Optional[Value]:
         """Evaluate the for loop"""
         with context:
-            self.init.evaluate(context)
+            self.init.execute(context)
+            while self.check.evaluate(context).value:
+                if context.interrupted:
+                    raise ProgramInterrupted
+                with context:
+                    self.body.execute(context)
+                self.change.execute(context)
+        return None
+
+    def steps(self, context: Context) -> Steps:
+        """Evaluate the for loop one step at a time, with at least one step for each iteration"""
+        with context:
+            yield from self.init.steps(context)
             while self.check.evaluate(context).value:
                 with context:
-                    self.body.evaluate(context)
-                self.change.evaluate(context)
+                    yield from self.body.steps(context)
+                self.change.execute(context)
+                yield
         return None
 
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the for loop"""
+        loop_scope = scope.child(frame=_declares_names(self.init, self.check))
+        self.init.resolve(loop_scope)
+        self.check.resolve(loop_scope)
+        iteration_scope = _resolve_iteration(self.body, loop_scope)
+        self.change.resolve(loop_scope)
+        self.loop_names, self.iteration_names = loop_scope.names, iteration_scope.names
+
+    def fold(self) -> Node:
+        """Fold the parts of the for loop"""
+        self.init, self.check, self.change, self.body = (
+            self.init.fold(), self.check.fold(), self.change.fold(), self.body.fold()
+        )
+        return self
+
+    def compile(self) -> CompiledNode:
+        """Compile the for loop"""
+        init, check, change = self.init.compile_execute(), self.check.compile(), self.change.compile_execute()
+        body = self.body.compile_execute()
+        new_iteration_frame = _frame_factory(self.iteration_names)
+
+        def _evaluate(context: Context) -> None:
+            init(context)
+            if new_iteration_frame is None:
+                while check(context).value:
+                    if context.interrupted:
+                        raise ProgramInterrupted
+                    body(context)
+                    change(context)
+                return
+            # one frame is cleared for each iteration, rather than creating a new one
+            frame = new_iteration_frame()
+            height = len(context.stack)
+            try:
+                while check(context).value:
+                    if context.interrupted:
+                        raise ProgramInterrupted
+                    frame.clear()
+                    context.push(frame)
+                    body(context)
+                    context.pop()
+                    change(context)
+            finally:
+                del context.stack[height:]
+        return _run_in_frame(_evaluate, _frame_factory(self.loop_names))
+
 
 class WhileLoopNode(Node):
     """Represents a for loop"""
 
+    __slots__ = ('check', 'body', 'loop_names', 'iteration_names')
+
     def __init__(self, check: Node, body: Node) -> None:
         self.check = check
         self.body = body
+        self.loop_names: Optional[dict[str, int]] = None
+        self.iteration_names: Optional[dict[str, int]] = None
 
     def evaluate(self, context: Context) -> Optional[Value]:
         """Evaluate the while loop"""
+        with context:
+            while self.check.evaluate(context).value:
+                if context.interrupted:
+                    raise ProgramInterrupted
+                with context:
+                    self.body.execute(context)
+        return None
+
+    def steps(self, context: Context) -> Steps:
+        """Evaluate the while loop one step at a time, with at least one step for each iteration"""
         with context:
             while self.check.evaluate(context).value:
                 with context:
-                    self.body.evaluate(context)
+                    yield from self.body.steps(context)
+                yield
         return None
 
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the while loop"""
+        loop_scope = scope.child(frame=False)
+        self.check.resolve(loop_scope)
+        iteration_scope = _resolve_iteration(self.body, loop_scope)
+        self.loop_names, self.iteration_names = loop_scope.names, iteration_scope.names
+
+    def fold(self) -> Node:
+        """Fold the parts of the while loop"""
+        self.check, self.body = self.check.fold(), self.body.fold()
+        return self
+
+    def compile(self) -> CompiledNode:
+        """Compile the while loop"""
+        check, body = self.check.compile(), self.body.compile_execute()
+        new_iteration_frame = _frame_factory(self.iteration_names)
+
+        def _evaluate(context: Context) -> None:
+            if new_iteration_frame is None:
+                while check(context).value:
+                    if context.interrupted:
+                        raise ProgramInterrupted
+                    body(context)
+                return
+            frame = new_iteration_frame()
+            height = len(context.stack)
+            try:
+                while check(context).value:
+                    if context.interrupted:
+                        raise ProgramInterrupted
+                    frame.clear()
+                    context.push(frame)
+                    body(context)
+                    context.pop()
+            finally:
+                del context.stack[height:]
+        return _run_in_frame(_evaluate, _frame_factory(self.loop_names))
+
 
 class IfNode(Node):
     """Represents an if statement"""
 
+    __slots__ = ('check', 'body', 'else_', 'body_names', 'else_names')
+
     def __init__(self, check: Node, body: Node, else_: Node) -> None:
         self.check = check
         self.body = body
         self.else_ = else_
+        self.body_names: Optional[dict[str, int]] = None
+        self.else_names: Optional[dict[str, int]] = None
 
     def evaluate(self, context: Context) -> Optional[Value]:
         """Evaluate the if statements"""
         if self.check.evaluate(context).value:
             with context:
-                self.body.evaluate(context)
+                self.body.execute(context)
         else:
             with context:
-                self.else_.evaluate(context)
+                self.else_.execute(context)
+        return None
+
+    def steps(self, context: Context) -> Steps:
+        """Evaluate the branch of the if statement which is taken one step at a time"""
+        branch = self.body if self.check.evaluate(context).value else self.else_
+        with context:
+            yield from branch.steps(context)
         return None
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the if statement"""
+        self.check.resolve(scope)
+        body_scope, else_scope = scope.child(frame=_declares_names(self.body)), scope.child(frame=_declares_names(self.else_))
+        self.body.resolve(body_scope)
+        self.else_.resolve(else_scope)
+        self.body_names, self.else_names = body_scope.names, else_scope.names
+
+    def fold(self) -> Node:
+        """Fold the parts of the if statement"""
+        self.check, self.body, self.else_ = self.check.fold(), self.body.fold(), self.else_.fold()
+        return self
+
+    def compile(self) -> CompiledNode:
+        """Compile the if statement"""
+        check = self.check.compile()
+        body = _run_in_frame(self.body.compile_execute(), _frame_factory(self.body_names))
+        else_ = _run_in_frame(self.else_.compile_execute(), _frame_factory(self.else_names))
+
+        def _evaluate(context: Context) -> None:
+            if check(context).value:
+                body(context)
+            else:
+                else_(context)
+        return _evaluate
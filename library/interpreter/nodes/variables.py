@@ -2,33 +2,60 @@
 
 __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
-__all__ = ['NonLocalVariableNode', 'VariableDeclarationNode', 'VariableDefinitionNode', 'VariableAccessNode']
+__all__ = ['NonLocalVariableNode', 'VariableDeclarationNode', 'VariableDefinitionNode', 'VariableAccessNode', 'ConstantNode']
 
 from typing import Optional
 
-from library.interpreter.nodes import Node
-from library.interpreter.variables import Type, Context, Value, Integer, true, false, null, undefined
+from library.interpreter.nodes import Node, CompiledNode
+from library.interpreter.scope import Binding, Scope, UNRESOLVED
+from library.interpreter.variables import (
+    Type, Context, Value, Integer, Rational, Float, Boolean, Undefined, Null, true, false, null, undefined
+)
 
 
 class NonLocalVariableNode(Node):
     """Marks a variable as being non-local"""
 
+    __slots__ = ('name', 'slot')
+
     def __init__(self, name: str) -> None:
         self.name = name
+        self.slot: Optional[int] = None
 
     def evaluate(self, context: Context):
         """Make the variable nonlocal"""
         context.declare(self.name, type(Context.NONLOCAL), Context.NONLOCAL)
 
+    def resolve(self, scope: Scope) -> None:
+        """Mark the variable as nonlocal in the scope"""
+        self.slot = scope.declare(self.name, nonlocal_=True)
+
+    def compile(self) -> CompiledNode:
+        """Compile the node"""
+        name, slot = self.name, self.slot
+
+        if slot is not None:
+            def _evaluate_slot(context: Context) -> None:
+                context.declare_slot(slot, type(Context.NONLOCAL), Context.NONLOCAL)
+            return _evaluate_slot
+
+        def _evaluate(context: Context) -> None:
+            context.declare(name, type(Context.NONLOCAL), Context.NONLOCAL)
+        return _evaluate
+
 
 class VariableDeclarationNode(Node):
     """Represents a variable declaration"""
 
+    __slots__ = ('name', 'typ_name', 'child', 'const', 'slot', 'typ_binding')
+
     def __init__(self, name: str, typ_name: str | None, child: Optional[Node] = None, *, const: bool = False) -> None:
         self.name = name
         self.typ_name = typ_name
         self.child = child
         self.const = const
+        self.slot: Optional[int] = None
+        self.typ_binding: Binding = UNRESOLVED
 
     def __repr__(self) -> str:
         typ_name = 'auto' if self.typ_name is None else self.typ_name
@@ -46,13 +73,49 @@ class VariableDeclarationNode(Node):
             return context.declare(self.name, typ, const=self.const)
         context.declare(self.name, typ, value, const=self.const)
 
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the value and type of the variable, then declare it in the scope"""
+        if self.child is not None:
+            self.child.resolve(scope)
+        if self.typ_name is not None:
+            self.typ_binding = scope.lookup(self.typ_name)
+        self.slot = scope.declare(self.name)
+
+    def fold(self) -> Node:
+        """Fold the value of the variable"""
+        if self.child is not None:
+            self.child = self.child.fold()
+        return self
+
+    def compile(self) -> CompiledNode:
+        """Compile the node"""
+        name, typ_name, const, slot = self.name, self.typ_name, self.const, self.slot
+        load_typ = None if typ_name is None else Context.loader(typ_name, self.typ_binding)
+        child = None if self.child is None else self.child.compile()
+
+        def _evaluate(context: Context) -> None:
+            value = undefined if child is None else child(context)
+            if value is undefined and typ_name is None:
+                raise TypeError('Cannot infer the type of "undefined"')
+            typ = value.typ if load_typ is None else load_typ(context)
+            if not (isinstance(typ, Type) or (isinstance(typ, type) and issubclass(typ, Value))):
+                raise TypeError(f'Cannot create a variable of type "{typ}" - it is not a type')
+            if slot is not None:
+                context.declare_slot(slot, typ, value, const=const)
+            else:
+                context.declare(name, typ, value, const=const)
+        return _evaluate
+
 
 class VariableDefinitionNode(Node):
     """Represents a variable definition"""
 
+    __slots__ = ('name', 'child', 'binding')
+
     def __init__(self, name: str, child: Node) -> None:
         self.name = name
         self.child = child
+        self.binding: Binding = UNRESOLVED
 
     def __repr__(self) -> str:
         return f'{type(self).__name__}({self.name}, {self.child})'
@@ -61,12 +124,34 @@ class VariableDefinitionNode(Node):
         """Define the variable"""
         context[self.name] = self.child.evaluate(context)
 
+    def compile(self) -> CompiledNode:
+        """Compile the node"""
+        store, child = Context.storer(self.name, self.binding), self.child.compile()
+
+        def _evaluate(context: Context) -> None:
+            store(context, child(context))
+        return _evaluate
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the value and the variable it is assigned to"""
+        self.child.resolve(scope)
+        self.binding = scope.lookup(self.name)
+
+    def fold(self) -> Node:
+        """Fold the value assigned to the variable"""
+        self.child = self.child.fold()
+        return self
+
 
 class VariableAccessNode(Node):
     """Represents accessing a variable"""
 
+    __slots__ = ('name', 'binding', 'declared_in_frame')
+
     def __init__(self, name: str) -> None:
         self.name = name
+        self.binding: Binding = UNRESOLVED
+        self.declared_in_frame: Optional[bool] = None
 
     def __repr__(self) -> str:
         return f'{type(self).__name__}({self.name})'
@@ -86,3 +171,111 @@ class VariableAccessNode(Node):
         if self.name == 'undefined':
             return undefined
         return context[self.name]
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve where the variable is, and whether the name is declared in the top-most frame"""
+        self.binding = scope.lookup(self.name)
+        self.declared_in_frame = scope.declares(self.name)
+
+    def fold(self) -> Node:
+        """Replace the variable access with a constant if the name is a literal"""
+        name = self.name
+        if self.declared_in_frame or not (name.isdigit() or name in _KEYWORD_LITERALS):
+            return self
+        value = Integer(name) if name.isdigit() else _KEYWORD_LITERALS[name]
+        if self.declared_in_frame is None:
+            # the frame the program is run in may already hold a variable with this name
+            return ConstantNode(value, (name,), self)
+        return ConstantNode(value)
+
+    def compile(self) -> CompiledNode:
+        """Compile the variable access, deciding up front whether the name could be a literal"""
+        name, binding = self.name, self.binding
+        _evaluate_variable = Context.loader(name, binding)
+
+        if name.isdigit():
+            def literal(_: Context) -> Value:
+                return Integer(name)
+        elif name in _KEYWORD_LITERALS:
+            constant = _KEYWORD_LITERALS[name]
+
+            def literal(_: Context) -> Value:
+                return constant
+        else:
+            return _evaluate_variable
+
+        if self.declared_in_frame is not None:
+            return _evaluate_variable if self.declared_in_frame else literal
+
+        def _evaluate(context: Context) -> Value:
+            if name in context.peek():
+                return _evaluate_variable(context)
+            return literal(context)
+        return _evaluate
+
+
+_KEYWORD_LITERALS = {'true': true, 'false': false, 'null': null, 'undefined': undefined}
+
+
+class ConstantNode(Node):
+    """Represents a literal, or an expression of literals, whose value is known before the program is run"""
+
+    # the types whose operators give the same result whenever they are run, so can be evaluated ahead of time
+    FOLDABLE_TYPES = (Integer, Rational, Float, Boolean, Undefined, Null)
+
+    __slots__ = ('value', 'guards', 'fallback')
+
+    def __init__(self, value: Value, guards: tuple[str, ...] = (), fallback: Optional[Node] = None) -> None:
+        self.value = value
+        # if any of the guard names are declared in the top-most frame, `fallback` is evaluated instead
+        self.guards = guards
+        self.fallback = fallback
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.value})'
+
+    @classmethod
+    def fold_operation(cls, node: Node, *operands: Node) -> Node:
+        """Replace an operation with a constant if all of its operands are constants"""
+        if not all(isinstance(o, cls) and type(o.value) in cls.FOLDABLE_TYPES for o in operands):
+            return node
+        try:
+            value = node.evaluate(Context())
+        except Exception:  # the error is raised when the program is run instead
+            return node
+        if type(value) not in cls.FOLDABLE_TYPES:
+            return node
+        guards = tuple(dict.fromkeys(name for o in operands for name in o.guards))
+        return cls(value, guards, node if guards else None)
+
+    def evaluate(self, context: Context) -> Value:
+        """Get the value of the constant"""
+        if self.guards:
+            frame = context.peek()
+            if any(name in frame for name in self.guards):
+                return self.fallback.evaluate(context)
+        return self.value
+
+    def resolve(self, scope: Scope) -> None:
+        """Resolve the node the constant was folded from"""
+        if self.fallback is not None:
+            self.fallback.resolve(scope)
+
+    def compile(self) -> CompiledNode:
+        """Compile the constant"""
+        value, guards = self.value, self.guards
+
+        if not guards:
+            def _evaluate_constant(_: Context) -> Value:
+                return value
+            return _evaluate_constant
+
+        fallback = self.fallback.compile()
+
+        def _evaluate(context: Context) -> Value:
+            frame = context.peek()
+            for name in guards:
+                if name in frame:
+                    return fallback(context)
+            return value
+        return _evaluate
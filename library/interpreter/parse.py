@@ -2,25 +2,75 @@
 
 __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
-__all__ = ['parse', 'Parser', 'default_parser']
+__all__ = ['parse', 'Parser', 'ParseCache', 'default_parser']
 
-from typing import Iterable
+import threading
+from collections import OrderedDict
+from typing import Hashable, Iterable, Optional, Type as PyType
 
 from dependencies.sly.sly import Parser as _Parser
 
-from .lex import Lexer, Token
+from . import _parse_tables
+from .lex import Lexer, Token, tokenize
 from .nodes.operator import DotOperatorNode
 from .nodes.statement import BlockNode, ForLoopNode, WhileLoopNode, IfNode
 from .nodes.variables import VariableDeclarationNode, VariableAccessNode, VariableDefinitionNode, NonLocalVariableNode
-from .variables import Context
+from .scope import Scope
+from .variables import Context, Value, Rational
 from .nodes import operator
 
 
+class ParseCache:
+    """A bounded, least recently used cache of syntax trees keyed by their source code"""
+
+    def __init__(self, max_size: int = 256) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._trees: OrderedDict[Hashable, BlockNode] = OrderedDict()
+        # the cache is shared by every parser, which may be used by different threads
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(hits={self.hits}, misses={self.misses}, size={len(self)}/{self.max_size})'
+
+    def __len__(self) -> int:
+        return len(self._trees)
+
+    def get(self, code: Hashable) -> Optional[BlockNode]:
+        """Get the tree for the given code, if it has been cached"""
+        with self._lock:
+            tree = self._trees.get(code)
+            if tree is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._trees.move_to_end(code)
+            return tree
+
+    def put(self, code: Hashable, tree: BlockNode) -> None:
+        """Cache the tree for the given code, evicting the least recently used tree if the cache is full"""
+        with self._lock:
+            self._trees[code] = tree
+            self._trees.move_to_end(code)
+            while len(self._trees) > self.max_size:
+                self._trees.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove every tree from the cache and reset the counters"""
+        with self._lock:
+            self._trees.clear()
+            self.hits = 0
+            self.misses = 0
+
+
 class Parser(_Parser):
     """The parser to parse and evaluate code"""
 
     tokens = Lexer.tokens
 
+    cache = ParseCache()
+
     precedence = (
         ('left', LESS, LESS_EQUAL, GREATER, GREATER_EQUAL, EQUALITY, NONEQUALITY, IDENTITY),
         ('left', PLUS, MINUS),
@@ -30,8 +80,34 @@ class Parser(_Parser):
         ('left', PERIOD),
     )
 
-    def __init__(self) -> None:
+    def __init__(self, decimals: PyType[Value] = Rational) -> None:
         self.context = Context()
+        # the type of number that decimal literals are parsed as, e.g. `Float` when speed matters more than exactness
+        self.decimals = decimals
+
+    @classmethod
+    def _build(cls, definitions) -> None:
+        """Build the grammar, loading the LALR tables from disk unless the grammar has changed since they were saved"""
+        _parse_tables.build(cls, definitions)
+
+    def parse(self, tokens: Iterable[Token]) -> BlockNode:
+        """Parse a stream of tokens, resolving the variables in the resulting tree and folding its constants"""
+        tree = super().parse(tokens)
+        if tree is not None:
+            tree.resolve(Scope.root())
+            tree = tree.fold()
+        return tree
+
+    def parse_code(self, code: str) -> BlockNode:
+        """Tokenize and parse a code string, reusing the cached tree if the code has been seen before"""
+        # the same code parses to a different tree for each type of decimal
+        key = code if self.decimals is Rational else (self.decimals, code)
+        tree = self.cache.get(key)
+        if tree is None:
+            tree = self.parse(tokenize(code))
+            if tree is not None:
+                self.cache.put(key, tree)
+        return tree
 
     @_('statement')
     def program(self, p):
@@ -143,7 +219,7 @@ class Parser(_Parser):
     @_('expr PERIOD expr')
     def access_expr(self, p):
         """Dot expressions"""
-        return DotOperatorNode(p.expr0, p.expr1)
+        return DotOperatorNode(p.expr0, p.expr1, decimals=self.decimals)
 
     @_('access_expr')
     def expr(self, p):
@@ -208,7 +284,7 @@ class Parser(_Parser):
     @_('expr SLASH expr')
     def expr(self, p):
         """Slash expressions"""
-        return operator.SlashOperatorNode(p.expr0, p.expr1)
+        return operator.SlashOperatorNode(p.expr0, p.expr1, decimals=self.decimals)
 
     @_('IDENTIFIER INCREMENT')
     def expr(self, p):
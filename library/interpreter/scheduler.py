@@ -0,0 +1,113 @@
+"""Cooperative execution of programs, which are run a few steps at a time so that many can share one thread"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['Program', 'Scheduler']
+
+from collections import deque
+from typing import Optional, Any
+
+from .parse import Parser, default_parser
+from .variables import Context, ProgramInterrupted, builtin_frame
+
+
+class Program:
+    """A program which is run a number of steps at a time, and can be paused between any two of them"""
+
+    # a step is one statement, or one iteration of a loop, however much work its expressions do - an expression is
+    # always evaluated in one go, so a budget bounds how many statements run rather than how long they take
+
+    def __init__(
+            self, code: str, context: Optional[Context] = None, *, parser: Optional[Parser] = None,
+            budget: Optional[int] = None
+    ) -> None:
+        if context is None:
+            context = Context()
+            context.push(builtin_frame())
+        self.code = code
+        self.context = context
+        # the most statements the program may run in total, before it is interrupted
+        self.budget = budget
+        self.steps_taken = 0
+        self.finished = False
+        self.result: Optional[list[Any]] = None
+        self.error: Optional[Exception] = None
+        self._steps = (default_parser if parser is None else parser).parse_code(code).steps(context)
+
+    def __repr__(self) -> str:
+        state = 'failed' if self.error is not None else 'finished' if self.finished else 'running'
+        return f'{type(self).__name__}({self.code!r}, {state}, steps={self.steps_taken}/{self.budget})'
+
+    def run(self, steps: Optional[int] = None) -> bool:
+        """Run at most `steps` statements of the program, or all of them, returning whether the program has finished"""
+        while not self.finished and (steps is None or steps > 0):
+            if self.context.interrupted:
+                self.stop(ProgramInterrupted())
+                break
+            if self.budget is not None and self.steps_taken >= self.budget:
+                self.stop(ProgramInterrupted(f'The program used all {self.budget} of its steps'))
+                break
+            try:
+                next(self._steps)
+            except StopIteration as ex:
+                self.result = ex.value
+                self.finished = True
+            except Exception as ex:
+                self.error = ex
+                self.finished = True
+            else:
+                self.steps_taken += 1
+                if steps is not None:
+                    steps -= 1
+        if self.error is not None:
+            raise self.error
+        return self.finished
+
+    def stop(self, error: Optional[Exception] = None) -> None:
+        """Stop the program before its next step, popping the frames it pushed to its context"""
+        if not self.finished:
+            self._steps.close()
+            self.finished = True
+            self.error = error
+
+
+class Scheduler:
+    """Runs many programs on one thread, giving each of them a slice of steps in turn"""
+
+    def __init__(self, time_slice: int = 100) -> None:
+        # the number of statements a program runs before the next program is run
+        self.time_slice = time_slice
+        self.programs: deque[Program] = deque()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(programs={len(self.programs)}, time_slice={self.time_slice})'
+
+    def __len__(self) -> int:
+        return len(self.programs)
+
+    def add(self, program: Program) -> Program:
+        """Add a program to be run after the programs which are already waiting"""
+        self.programs.append(program)
+        return program
+
+    def step(self) -> Optional[Program]:
+        """Run the next program for one slice, returning it if it has finished, whether or not it succeeded"""
+        if not self.programs:
+            return None
+        program = self.programs.popleft()
+        try:
+            finished = program.run(self.time_slice)
+        except Exception:
+            finished = True
+        if finished:
+            return program
+        self.programs.append(program)
+        return None
+
+    def run(self) -> list[Program]:
+        """Run every program until it finishes, returning the programs in the order they finished"""
+        finished = []
+        while self.programs:
+            if (program := self.step()) is not None:
+                finished.append(program)
+        return finished
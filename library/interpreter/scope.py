@@ -0,0 +1,74 @@
+"""Items relating to the static resolution of variables to frame slots"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['Binding', 'Scope', 'UNRESOLVED']
+
+from typing import Optional, NamedTuple
+
+
+class Binding(NamedTuple):
+    """Where a name can be found relative to the top of the stack"""
+    depth: int
+    # if the program has not declared the name, it is looked up by name below the top `depth` frames
+    slot: Optional[int]
+
+
+UNRESOLVED = Binding(0, None)
+
+
+class Scope:
+    """Represents a frame of the program as it is seen by the resolver"""
+
+    def __init__(
+            self, parent: Optional['Scope'] = None, *, slotted: bool = True, frame: bool = True, prefilled: bool = False
+    ) -> None:
+        self.parent = parent
+        self.slotted = slotted
+        self.frame = frame
+        # the frame may already hold variables which were declared before the program was resolved
+        self.prefilled = prefilled
+        self.names: dict[str, int] = {}
+        self.__declared: dict[str, bool] = {}
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.names}, slotted={self.slotted}, frame={self.frame})'
+
+    @classmethod
+    def root(cls) -> 'Scope':
+        """Create a scope for the frame the program is run in, which may already hold variables"""
+        return cls(prefilled=True)
+
+    def child(self, *, frame: bool = True) -> 'Scope':
+        """Create a scope on top of this one, which only has a frame if something can be declared in it"""
+        return type(self)(self, frame=frame)
+
+    def declare(self, name: str, *, nonlocal_: bool = False) -> Optional[int]:
+        """Declare a name in the scope, returning the slot it is stored in"""
+        if not self.slotted:
+            return None
+        if not self.frame:
+            raise RuntimeError(f'"{name}" cannot be declared in a scope without a frame')
+        slot = self.names.setdefault(name, len(self.names))
+        self.__declared[name] = nonlocal_
+        return slot
+
+    def declares(self, name: str) -> Optional[bool]:
+        """Check whether the name has been declared in this scope so far, or None if it cannot be known"""
+        if not self.slotted:
+            return None
+        if name in self.__declared:
+            return True
+        return None if self.prefilled else False
+
+    def lookup(self, name: str) -> Binding:
+        """Find where the value of a name will be at this point of the program"""
+        depth = 0
+        scope = self
+        while scope is not None and scope.slotted:
+            if scope.__declared.get(name) is False:
+                return Binding(depth, scope.names[name])
+            if scope.frame:
+                depth += 1
+            scope = scope.parent
+        return Binding(depth, None)
@@ -0,0 +1,162 @@
+"""Sessions which keep the variables of each client separate, while sharing a pool of parsers between them"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['ParserPool', 'Session', 'SessionBusy', 'SessionManager']
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Hashable, Iterator, Optional, Type as PyType
+
+from .parse import Parser
+from .variables import Context, Rational, Value, builtin_frame
+
+
+class ParserPool:
+    """Lends out parsers to evaluate code in a given context, reusing them rather than creating one for each program"""
+
+    def __init__(self, max_size: int = 8) -> None:
+        # the number of idle parsers which are kept, as any number can be lent out at once
+        self.max_size = max_size
+        self._parsers: list[Parser] = []
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(idle={len(self._parsers)}/{self.max_size})'
+
+    def __len__(self) -> int:
+        return len(self._parsers)
+
+    @contextmanager
+    def parser(self, context: Context, decimals: PyType[Value] = Rational) -> Iterator[Parser]:
+        """Borrow a parser which evaluates code in `context`, returning it to the pool afterwards"""
+        with self._lock:
+            parser = self._parsers.pop() if self._parsers else None
+        if parser is None:
+            parser = Parser()
+        parser.context = context
+        parser.decimals = decimals
+        try:
+            yield parser
+        finally:
+            # the parser must not keep the context of a session alive once it is evicted
+            parser.context = None
+            with self._lock:
+                if len(self._parsers) < self.max_size:
+                    self._parsers.append(parser)
+
+
+class SessionBusy(Exception):
+    """A program could not be run in a session without waiting for the one which is already running in it"""
+
+    def __init__(self, key: Hashable) -> None:
+        super().__init__(f'A program is already running in the session {key}')
+        self.key = key
+
+
+class Session:
+    """The context of one client, whose variables are kept between the programs it runs"""
+
+    def __init__(self, key: Hashable, pool: ParserPool, decimals: PyType[Value] = Rational) -> None:
+        self.key = key
+        self.pool = pool
+        # the type of number that the decimals in the programs of the session are parsed as
+        self.decimals = decimals
+        self.context = Context()
+        self.context.push(builtin_frame())
+        self.last_used = time.monotonic()
+        # programs share the stack of the context, so only one of them can run at a time
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.key}, idle={self.idle_time:.1f}s)'
+
+    @property
+    def idle_time(self) -> float:
+        """Get how long it has been since a program was run in the session"""
+        return 0.0 if self.in_use else time.monotonic() - self.last_used
+
+    @property
+    def in_use(self) -> bool:
+        """Get whether a program is running in the session, which may change as soon as it is returned"""
+        return self._lock.locked()
+
+    @contextmanager
+    def parser(self, blocking: bool = True) -> Iterator[Parser]:
+        """Borrow a parser for the session, waiting for any other program in it to finish unless `blocking` is False"""
+        if not self._lock.acquire(blocking):
+            # rather than waiting, which would hold up a worker that could run the program of another session
+            raise SessionBusy(self.key)
+        try:
+            with self.pool.parser(self.context, self.decimals) as parser:
+                # a program which was interrupted must not stop the next one
+                self.context.interrupted = False
+                try:
+                    yield parser
+                finally:
+                    self.last_used = time.monotonic()
+        finally:
+            self._lock.release()
+
+
+class SessionManager:
+    """Creates a session for each client when it first runs a program, and evicts sessions which sit idle"""
+
+    def __init__(
+            self, idle_timeout: Optional[float] = 600.0, pool: Optional[ParserPool] = None,
+            decimals: PyType[Value] = Rational
+    ) -> None:
+        self.idle_timeout = idle_timeout
+        self.pool = ParserPool() if pool is None else pool
+        self.decimals = decimals
+        self.sessions: dict[Hashable, Session] = {}
+        self._lock = threading.Lock()
+        self._last_eviction = time.monotonic()
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}(sessions={len(self)}, idle_timeout={self.idle_timeout}, pool={self.pool})'
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.sessions
+
+    def get(self, key: Hashable) -> Session:
+        """Get the session of a client, creating it if it does not exist or has been evicted"""
+        now = time.monotonic()
+        # idle sessions are looked for at most twice per timeout, rather than every time a session is used
+        if self.idle_timeout is not None and now - self._last_eviction >= self.idle_timeout / 2:
+            self.evict_idle()
+        with self._lock:
+            if (session := self.sessions.get(key)) is None:
+                session = self.sessions[key] = Session(key, self.pool, self.decimals)
+            session.last_used = now
+            return session
+
+    def remove(self, key: Hashable) -> Optional[Session]:
+        """Remove the session of a client, e.g. when it disconnects"""
+        with self._lock:
+            return self.sessions.pop(key, None)
+
+    def evict_idle(self) -> list[Session]:
+        """Remove the sessions which have been idle for longer than the timeout, returning them"""
+        if self.idle_timeout is None:
+            return []
+        evicted = []
+        with self._lock:
+            self._last_eviction = time.monotonic()
+            for session in list(self.sessions.values()):
+                # the lock of the session is held while it is removed, so that no program can start in it meanwhile.
+                # A caller which keeps a session for longer than the timeout before using it may still find that it
+                # has been evicted, and its variables are then lost to the next program got from the manager
+                if not session._lock.acquire(blocking=False):
+                    continue
+                try:
+                    if time.monotonic() - session.last_used > self.idle_timeout:
+                        del self.sessions[session.key]
+                        evicted.append(session)
+                finally:
+                    session._lock.release()
+        return evicted
@@ -3,20 +3,42 @@
 __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
 __all__ = [
-    'Integer', 'Rational', 'Context',
+    'Integer', 'Rational', 'Float', 'Array', 'Context', 'SlotFrame',
     'Type', 'Value', 'Variable', 'Boolean',
-    'Undefined', 'Null',
+    'Undefined', 'Null', 'ProgramInterrupted',
     'null', 'undefined', 'false', 'true',
+    'builtin_frame',
 ]
 
+import inspect
+import operator
+from array import array
 from dataclasses import dataclass
-from typing import Any, Union, Optional, Callable, Type as PyType
+from itertools import repeat
+from typing import Any, Union, Optional, Callable, Iterable, Type as PyType
 
 from library import maths
+from library.interpreter.scope import Binding
 
 
-@dataclass
-class Value:
+class _ValueMeta(type):
+    """Counts changes to the operator handlers of value types, so that cached lookups of them can be discarded"""
+
+    handlers_version = 0
+
+    def __setattr__(cls, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        if 'operator_' in name:
+            _ValueMeta.handlers_version += 1
+
+    def __delattr__(cls, name: str) -> None:
+        super().__delattr__(name)
+        if 'operator_' in name:
+            _ValueMeta.handlers_version += 1
+
+
+@dataclass(slots=True)
+class Value(metaclass=_ValueMeta):
     """Represents a value"""
     typ: Union[type, 'Type']
     value: Any
@@ -25,6 +47,8 @@ class Value:
 class Type(Value):
     """Represents a type"""
 
+    __slots__ = ()
+
     def __init__(self, value: Any) -> None:
         super().__init__(Type, value)
 
@@ -32,6 +56,8 @@ class Type(Value):
 class Undefined(Value):
     """Used to mark that a name has no value"""
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__(type(self), None)
 
@@ -42,6 +68,8 @@ class Undefined(Value):
 class Null(Value):
     """Used to mark that a name has no value"""
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         super().__init__(type(self), None)
 
@@ -56,41 +84,73 @@ null = Null()
 class Signature:
     """Represents a function signature"""
 
+    __slots__ = ()
+
 
 class Arguments:
     """Represents a collection of arguments passed to a function"""
 
 
+def _native_arity(func: Callable) -> Optional[int]:
+    """Get the fixed number of positional arguments a Python function takes, if it has one"""
+    code = getattr(func, '__code__', None)
+    if code is None or code.co_flags & (inspect.CO_VARARGS | inspect.CO_VARKEYWORDS) or func.__defaults__:
+        return None
+    if code.co_kwonlyargcount and len(func.__kwdefaults__ or ()) < code.co_kwonlyargcount:
+        return None
+    return code.co_argcount
+
+
 class Function(Value):
     """Represents a function in the context"""
 
+    __slots__ = ('signature', 'body', 'native', 'arity')
+
     def __init__(self, signature: Signature, body: list | Callable):
         super().__init__(type(self), None)
         self.signature = signature
         self.body = body
+        # the body is classified once, so calling a native function does not check it again
+        self.native: Optional[Callable] = body if callable(body) else None
+        # the number of arguments a native function takes, or None if it is interpreted or takes a variable number
+        self.arity = _native_arity(body) if self.native is not None else None
 
     def call(self, *arguments):
         """Call the function"""
-        if callable(self.body):
-            return self.body(*arguments)
+        if self.native is not None:
+            return self.native(*arguments)
         raise NotImplementedError
 
+    def direct(self, arity: int) -> Callable:
+        """Get a callable which calls the function with exactly `arity` arguments, skipping `call` if it is native"""
+        if self.native is not None and self.arity == arity:
+            return self.native
+        return self.call
+
     @classmethod
     def from_native(cls, func: Callable):
         """Create a function from a Python function"""
         return cls(Signature(), func)
 
 
+def _reduce(numerator: int, denominator: int) -> tuple[int, int]:
+    """Reduce a fraction to its lowest terms, with a positive denominator"""
+    gcd = abs(maths.gcd(numerator, denominator))
+    if denominator < 0:
+        gcd = -gcd
+    return numerator // gcd, denominator // gcd
+
+
 class Rational(Value):
     """Represents a rational number"""
 
+    __slots__ = ('numerator', 'denominator')
+
     def __init__(self, numerator: int, denominator: int):
         super().__init__(type(self), None)
-        gcd = maths.gcd(numerator, denominator)
-        self.numerator = numerator // gcd
-        self.denominator = denominator // gcd
-        if self.denominator == 0:
+        if denominator == 0:
             raise ZeroDivisionError(f'Attempted to divide {numerator} by 0')
+        self.numerator, self.denominator = _reduce(numerator, denominator)
 
     def __repr__(self):
         return f'{self.numerator} / {self.denominator}'
@@ -102,14 +162,17 @@ class Rational(Value):
     @Function.from_native
     def operator_plus(self, other: 'Integer | Rational') -> 'Rational':
         """Override the addition operator for integers"""
-        if isinstance(other, Rational):
+        if isinstance(other, Rational) and self.denominator == other.denominator:
+            numerator = self.numerator + other.numerator
+            denominator = self.denominator
+        elif isinstance(other, Rational):
             numerator = self.numerator * other.denominator + other.numerator * self.denominator
             denominator = self.denominator * other.denominator
         elif isinstance(other, Integer):
             numerator = self.numerator + other.value * self.denominator
             denominator = self.denominator
         else:
-            raise TypeError(f'Addition between {type(self)} and {type(other)} is not supported')
+            return NotImplemented
         return Rational(numerator, denominator)
 
     @Function.from_native
@@ -120,19 +183,24 @@ class Rational(Value):
     @Function.from_native
     def operator_minus(self, other: 'Integer | Rational') -> 'Rational':
         """Override the subtraction operator for integers"""
-        if isinstance(other, Rational):
+        if isinstance(other, Rational) and self.denominator == other.denominator:
+            numerator = self.numerator - other.numerator
+            denominator = self.denominator
+        elif isinstance(other, Rational):
             numerator = self.numerator * other.denominator - other.numerator * self.denominator
             denominator = self.denominator * other.denominator
         elif isinstance(other, Integer):
             numerator = self.numerator - other.value * self.denominator
             denominator = self.denominator
         else:
-            raise TypeError(f'Subtraction between {type(self)} and {type(other)} is not supported')
+            return NotImplemented
         return Rational(numerator, denominator)
 
     @Function.from_native
     def reverse_operator_minus(self, other: 'Integer | Rational') -> 'Rational':
         """Implement the reverse addition operator"""
+        if not isinstance(other, (Integer, Rational)):
+            return NotImplemented
         return self.operator_plus.call(self.unary_operator_minus.call(self), other)
 
     @Function.from_native
@@ -140,6 +208,8 @@ class Rational(Value):
         """Override the subtraction operator for integers"""
         if isinstance(other, Integer):
             other = Rational(other.value, 1)
+        elif not isinstance(other, Rational):
+            return NotImplemented
         return Rational(self.numerator * other.numerator, self.denominator * other.denominator)
 
     @Function.from_native
@@ -152,11 +222,15 @@ class Rational(Value):
         """Override the subtraction operator for integers"""
         if isinstance(other, Integer):
             other = Rational(other.value, 1)
+        elif not isinstance(other, Rational):
+            return NotImplemented
         return Rational(self.numerator * other.denominator, self.denominator * other.numerator)
 
     @Function.from_native
     def reverse_operator_slash(self, other: 'Integer | Rational') -> 'Rational':
         """Implement the reverse division operator"""
+        if not isinstance(other, (Integer, Rational)):
+            return NotImplemented
         return self.operator_star.call(self.reciprocal.call(self), other)
 
     @Function.from_native
@@ -208,37 +282,54 @@ class Rational(Value):
 class Integer(Value):
     """Represents an integer"""
 
+    _small_integers: list['Integer'] = []
+    _small_integers_start: int = 0
+
+    __slots__ = ('leading_zeros',)
+
     def __init__(self, value: int | str):
-        self.leading_zeros = 0
-        if isinstance(value, str):
-            for c in value:
-                if c != '0':
-                    break
-                self.leading_zeros += 1
+        self.leading_zeros = len(value) - len(value.lstrip('0')) if isinstance(value, str) else 0
         super().__init__(type(self), int(value))
 
     def __repr__(self) -> str:
         return str(self.value)
 
+    @classmethod
+    def from_int(cls, value: int) -> 'Integer':
+        """Get an integer with the given value, reusing a cached instance for small values"""
+        index = value - cls._small_integers_start
+        if 0 <= index < len(cls._small_integers):
+            return cls._small_integers[index]
+        # the fields are set directly, as going through `__init__` for a value which is already an int is far slower
+        integer = object.__new__(cls)
+        integer.typ, integer.value, integer.leading_zeros = cls, value, 0
+        return integer
+
+    @classmethod
+    def cache_small_integers(cls, start: int = -5, stop: int = 257) -> None:
+        """Set the range of values which `from_int` returns cached instances for"""
+        cls._small_integers = [cls(value) for value in range(start, stop)]
+        cls._small_integers_start = start
+
     @Function.from_native
     def operator_plus(self, other: 'Integer') -> 'Integer':
         """Override the addition operator for integers"""
         if isinstance(other, Integer):
-            return Integer(self.value + other.value)
+            return Integer.from_int(self.value + other.value)
         return NotImplemented
 
     @Function.from_native
     def operator_minus(self, other: 'Integer') -> 'Integer':
         """Override the subtraction operator for integers"""
         if isinstance(other, Integer):
-            return Integer(self.value - other.value)
+            return Integer.from_int(self.value - other.value)
         return NotImplemented
 
     @Function.from_native
     def operator_star(self, other: 'Integer') -> 'Integer':
         """Override the subtraction operator for integers"""
         if isinstance(other, Integer):
-            return Integer(self.value * other.value)
+            return Integer.from_int(self.value * other.value)
         return NotImplemented
 
     @Function.from_native
@@ -266,69 +357,418 @@ class Integer(Value):
         return Rational(self.value * (10 ** x) + value, 10 ** x)
 
     @Function.from_native
-    def operator_less(self, other: 'Integer') -> 'Boolean':
+    def operator_less(self, other: 'Integer | Float') -> 'Boolean':
         """Implement the `<` operator"""
+        if not isinstance(other, (Integer, Float)):
+            return NotImplemented
         return Boolean(self.value < other.value)
 
     @Function.from_native
-    def operator_less_equal(self, other: 'Integer') -> 'Boolean':
+    def operator_less_equal(self, other: 'Integer | Float') -> 'Boolean':
         """Implement the `<=` operator"""
+        if not isinstance(other, (Integer, Float)):
+            return NotImplemented
         return Boolean(self.value <= other.value)
 
     @Function.from_native
-    def operator_greater(self, other: 'Integer') -> 'Boolean':
+    def operator_greater(self, other: 'Integer | Float') -> 'Boolean':
         """Implement the `>` operator"""
+        if not isinstance(other, (Integer, Float)):
+            return NotImplemented
         return Boolean(self.value > other.value)
 
     @Function.from_native
-    def operator_greater_equal(self, other: 'Integer') -> 'Boolean':
+    def operator_greater_equal(self, other: 'Integer | Float') -> 'Boolean':
         """Implement the `>=` operator"""
+        if not isinstance(other, (Integer, Float)):
+            return NotImplemented
         return Boolean(self.value >= other.value)
 
     @Function.from_native
-    def operator_equality(self, other: 'Integer') -> 'Boolean':
+    def operator_equality(self, other: 'Integer | Float') -> 'Boolean':
         """Implement the `==` operator"""
+        if not isinstance(other, (Integer, Float)):
+            return NotImplemented
         return Boolean(self.value == other.value)
 
     @Function.from_native
-    def operator_nonequality(self, other: 'Integer') -> 'Boolean':
+    def operator_nonequality(self, other: 'Integer | Float') -> 'Boolean':
         """Implement the `!=` operator"""
+        if not isinstance(other, (Integer, Float)):
+            return NotImplemented
         return Boolean(self.value != other.value)
 
     @Function.from_native
     def unary_operator_increment(self) -> 'Integer':
         """Implement the `++` operator"""
-        return Integer(self.value + 1)
+        return Integer.from_int(self.value + 1)
 
     @Function.from_native
     def unary_operator_decrement(self) -> 'Integer':
         """Implement the `--` operator"""
-        return Integer(self.value - 1)
+        return Integer.from_int(self.value - 1)
 
     @Function.from_native
-    def assignment_operator_plus(self, other: 'Integer | Rational') -> 'Integer':
+    def assignment_operator_plus(self, other: 'Integer') -> 'Integer':
         """Implement the `+=` operator"""
-        return Integer(self.value + other.value)
+        if not isinstance(other, Integer):
+            return NotImplemented
+        return Integer.from_int(self.value + other.value)
 
     @Function.from_native
-    def assignment_operator_minus(self, other: 'Integer | Rational') -> 'Integer':
+    def assignment_operator_minus(self, other: 'Integer') -> 'Integer':
         """Implement the `-=` operator"""
-        return Integer(self.value - other.value)
+        if not isinstance(other, Integer):
+            return NotImplemented
+        return Integer.from_int(self.value - other.value)
 
     @Function.from_native
-    def assignment_operator_star(self, other: 'Integer | Rational') -> 'Integer':
+    def assignment_operator_star(self, other: 'Integer') -> 'Integer':
         """Implement the `*=` operator"""
-        return Integer(self.value * other.value)
+        if not isinstance(other, Integer):
+            return NotImplemented
+        return Integer.from_int(self.value * other.value)
 
     @Function.from_native
-    def assignment_operator_slash(self, other: 'Integer | Rational') -> 'Integer':
+    def assignment_operator_slash(self, other: 'Integer') -> 'Integer':
         """Implement the `/=` operator"""
+        if not isinstance(other, Integer):
+            return NotImplemented
         return Integer(self.value / other.value)
 
 
+def _as_float(value: Value) -> Optional[float]:
+    """Convert a number to a float, or get None if it is not a number"""
+    if isinstance(value, (Float, Integer)):
+        return value.value
+    if isinstance(value, Rational):
+        return value.numerator / value.denominator
+    return None
+
+
+class Float(Value):
+    """Represents a floating point number, which decimals are parsed as when exactness is not needed"""
+
+    __slots__ = ()
+
+    def __init__(self, value: float):
+        super().__init__(type(self), float(value))
+
+    def __repr__(self) -> str:
+        return repr(self.value)
+
+    @classmethod
+    def from_fraction(cls, numerator: int, denominator: int) -> 'Float':
+        """Get the float closest to a fraction"""
+        return cls(numerator / denominator)
+
+    @Function.from_native
+    def operator_plus(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `+` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Float(self.value + value)
+
+    @Function.from_native
+    def reverse_operator_plus(self, other: 'Integer | Rational') -> 'Float':
+        """Implement the reverse addition operator"""
+        return self.operator_plus.call(self, other)
+
+    @Function.from_native
+    def operator_minus(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `-` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Float(self.value - value)
+
+    @Function.from_native
+    def reverse_operator_minus(self, other: 'Integer | Rational') -> 'Float':
+        """Implement the reverse subtraction operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Float(value - self.value)
+
+    @Function.from_native
+    def operator_star(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `*` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Float(self.value * value)
+
+    @Function.from_native
+    def reverse_operator_star(self, other: 'Integer | Rational') -> 'Float':
+        """Implement the reverse multiplication operator"""
+        return self.operator_star.call(self, other)
+
+    @Function.from_native
+    def operator_slash(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `/` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Float(self.value / value)
+
+    @Function.from_native
+    def reverse_operator_slash(self, other: 'Integer | Rational') -> 'Float':
+        """Implement the reverse division operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Float(value / self.value)
+
+    @Function.from_native
+    def operator_less(self, other: 'Float | Integer | Rational') -> 'Boolean':
+        """Implement the `<` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Boolean(self.value < value)
+
+    @Function.from_native
+    def operator_less_equal(self, other: 'Float | Integer | Rational') -> 'Boolean':
+        """Implement the `<=` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Boolean(self.value <= value)
+
+    @Function.from_native
+    def operator_greater(self, other: 'Float | Integer | Rational') -> 'Boolean':
+        """Implement the `>` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Boolean(self.value > value)
+
+    @Function.from_native
+    def operator_greater_equal(self, other: 'Float | Integer | Rational') -> 'Boolean':
+        """Implement the `>=` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Boolean(self.value >= value)
+
+    @Function.from_native
+    def operator_equality(self, other: 'Float | Integer | Rational') -> 'Boolean':
+        """Implement the `==` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Boolean(self.value == value)
+
+    @Function.from_native
+    def operator_nonequality(self, other: 'Float | Integer | Rational') -> 'Boolean':
+        """Implement the `!=` operator"""
+        if (value := _as_float(other)) is None:
+            return NotImplemented
+        return Boolean(self.value != value)
+
+    @Function.from_native
+    def unary_operator_increment(self) -> 'Float':
+        """Implement the `++` operator"""
+        return Float(self.value + 1)
+
+    @Function.from_native
+    def unary_operator_decrement(self) -> 'Float':
+        """Implement the `--` operator"""
+        return Float(self.value - 1)
+
+    @Function.from_native
+    def unary_operator_plus(self) -> 'Float':
+        """Implement unary plus for floats"""
+        return Float(self.value)
+
+    @Function.from_native
+    def unary_operator_minus(self) -> 'Float':
+        """Implement unary minus for floats"""
+        return Float(-self.value)
+
+    @Function.from_native
+    def assignment_operator_plus(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `+=` operator"""
+        return self.operator_plus.call(self, other)
+
+    @Function.from_native
+    def assignment_operator_minus(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `-=` operator"""
+        return self.operator_minus.call(self, other)
+
+    @Function.from_native
+    def assignment_operator_star(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `*=` operator"""
+        return self.operator_star.call(self, other)
+
+    @Function.from_native
+    def assignment_operator_slash(self, other: 'Float | Integer | Rational') -> 'Float':
+        """Implement the `/=` operator"""
+        return self.operator_slash.call(self, other)
+
+
+class _Elements(array):
+    """The elements of an array, which cannot be used as a condition"""
+
+    def __bool__(self) -> bool:
+        # a comparison of arrays gives an array, which would otherwise be true whenever it is not empty
+        raise TypeError('An array cannot be used as a condition - use its `any` or `all` instead')
+
+
+class Array(Value):
+    """Represents an array of numbers, whose operators are applied to every element at once"""
+
+    __slots__ = ()
+
+    def __init__(self, values: Iterable[float]):
+        # the elements are stored as doubles, so that they are not each a value of their own
+        if type(values) is not _Elements:
+            values = _Elements('d', values)
+        super().__init__(type(self), values)
+
+    def __repr__(self) -> str:
+        return f'[{", ".join(map(repr, self.value))}]'
+
+    def _elementwise(self, other: Value, operation: Callable[[float, float], Any], reverse: bool = False) -> 'Array':
+        """Apply an operation to each element and either the matching element of another array, or a number"""
+        if isinstance(other, Array):
+            if len(other.value) != len(self.value):
+                raise ValueError(f'Cannot combine arrays of {len(self.value)} and {len(other.value)} elements')
+            others = other.value
+        elif (number := _as_float(other)) is not None:
+            others = repeat(number)
+        else:
+            return NotImplemented
+        if reverse:
+            return Array(map(operation, others, self.value))
+        return Array(map(operation, self.value, others))
+
+    @Function.from_native
+    def operator_plus(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `+` operator"""
+        return self._elementwise(other, operator.add)
+
+    @Function.from_native
+    def reverse_operator_plus(self, other: 'Float | Integer | Rational') -> 'Array':
+        """Implement the reverse addition operator"""
+        return self._elementwise(other, operator.add, reverse=True)
+
+    @Function.from_native
+    def operator_minus(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `-` operator"""
+        return self._elementwise(other, operator.sub)
+
+    @Function.from_native
+    def reverse_operator_minus(self, other: 'Float | Integer | Rational') -> 'Array':
+        """Implement the reverse subtraction operator"""
+        return self._elementwise(other, operator.sub, reverse=True)
+
+    @Function.from_native
+    def operator_star(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `*` operator"""
+        return self._elementwise(other, operator.mul)
+
+    @Function.from_native
+    def reverse_operator_star(self, other: 'Float | Integer | Rational') -> 'Array':
+        """Implement the reverse multiplication operator"""
+        return self._elementwise(other, operator.mul, reverse=True)
+
+    @Function.from_native
+    def operator_slash(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `/` operator"""
+        return self._elementwise(other, operator.truediv)
+
+    @Function.from_native
+    def reverse_operator_slash(self, other: 'Float | Integer | Rational') -> 'Array':
+        """Implement the reverse division operator"""
+        return self._elementwise(other, operator.truediv, reverse=True)
+
+    # comparisons give an array holding 1 where the comparison is true, and 0 where it is false
+
+    @Function.from_native
+    def operator_less(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `<` operator"""
+        return self._elementwise(other, operator.lt)
+
+    @Function.from_native
+    def operator_less_equal(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `<=` operator"""
+        return self._elementwise(other, operator.le)
+
+    @Function.from_native
+    def operator_greater(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `>` operator"""
+        return self._elementwise(other, operator.gt)
+
+    @Function.from_native
+    def operator_greater_equal(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `>=` operator"""
+        return self._elementwise(other, operator.ge)
+
+    @Function.from_native
+    def operator_equality(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `==` operator"""
+        return self._elementwise(other, operator.eq)
+
+    @Function.from_native
+    def operator_nonequality(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `!=` operator"""
+        return self._elementwise(other, operator.ne)
+
+    @Function.from_native
+    def unary_operator_increment(self) -> 'Array':
+        """Implement the `++` operator"""
+        return self._elementwise(Integer(1), operator.add)
+
+    @Function.from_native
+    def unary_operator_decrement(self) -> 'Array':
+        """Implement the `--` operator"""
+        return self._elementwise(Integer(1), operator.sub)
+
+    @Function.from_native
+    def unary_operator_plus(self) -> 'Array':
+        """Implement unary plus for arrays"""
+        return Array(self.value)
+
+    @Function.from_native
+    def unary_operator_minus(self) -> 'Array':
+        """Implement unary minus for arrays"""
+        return Array(map(operator.neg, self.value))
+
+    @Function.from_native
+    def assignment_operator_plus(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `+=` operator"""
+        return self.operator_plus.call(self, other)
+
+    @Function.from_native
+    def assignment_operator_minus(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `-=` operator"""
+        return self.operator_minus.call(self, other)
+
+    @Function.from_native
+    def assignment_operator_star(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `*=` operator"""
+        return self.operator_star.call(self, other)
+
+    @Function.from_native
+    def assignment_operator_slash(self, other: 'Array | Float | Integer | Rational') -> 'Array':
+        """Implement the `/=` operator"""
+        return self.operator_slash.call(self, other)
+
+    @Function.from_native
+    def operator_get(self, other: 'Integer | str') -> Value:
+        """Get an element, e.g. `samples.0`, or the `length`, `sum`, `min`, `max`, `any` or `all` of the array"""
+        if isinstance(other, str) and not other.isdigit():
+            if other == 'length':
+                return Integer.from_int(len(self.value))
+            if other in ('any', 'all'):
+                # whether any or all of the elements are non-zero, e.g. the elements of a comparison
+                return Boolean({'any': any, 'all': all}[other](self.value))
+            if other == 'sum':
+                return Float(sum(self.value))
+            if other in ('min', 'max'):
+                if not len(self.value):
+                    raise ValueError(f'Cannot get the {other} of an empty array')
+                return Float({'min': min, 'max': max}[other](self.value))
+            raise NameError(f'Cannot get {other} from an array')
+        return Float(self.value[int(other) if isinstance(other, str) else other.value])
+
+
 class Boolean(Value):
     """Represents a boolean value"""
 
+    __slots__ = ()
+
     def __init__(self, value: bool):
         super().__init__(type(self), value)
 
@@ -339,8 +779,10 @@ class Boolean(Value):
 true = Boolean(True)
 false = Boolean(False)
 
+Integer.cache_small_integers()
+
 
-@dataclass
+@dataclass(slots=True)
 class Variable:
     """Represents a variable in the context"""
     value: Value | PyType[Value]
@@ -348,7 +790,88 @@ class Variable:
     const: bool = False
 
 
-Frame = dict[str, Variable]
+class SlotFrame:
+    """A frame whose variables are stored in slots assigned by the resolver"""
+
+    __slots__ = ('names', 'slots', '_empty')
+
+    def __init__(self, names: dict[str, int]) -> None:
+        self.names = names
+        self.slots: list[Optional[Variable]] = [None] * len(names)
+        # copied into the slots to clear them, so that clearing a reused frame does not allocate
+        self._empty = (None,) * len(names)
+
+    def __repr__(self) -> str:
+        return repr({name: self.slots[slot] for name, slot in self.names.items() if self.slots[slot] is not None})
+
+    def __contains__(self, name: str) -> bool:
+        slot = self.names.get(name)
+        return slot is not None and self.slots[slot] is not None
+
+    def __getitem__(self, name: str) -> Variable:
+        slot = self.names.get(name)
+        if slot is None or self.slots[slot] is None:
+            raise KeyError(name)
+        return self.slots[slot]
+
+    def clear(self) -> None:
+        """Empty every slot so the frame can be reused"""
+        self.slots[:] = self._empty
+
+    def __setitem__(self, name: str, variable: Variable) -> None:
+        if name not in self.names:
+            # the names are shared between every frame of a scope, so copy them rather than adding to them
+            self.names = {**self.names, name: len(self.slots)}
+            self.slots.append(None)
+            self._empty += (None,)
+        self.slots[self.names[name]] = variable
+
+
+class ProgramFrame(SlotFrame):
+    """The slotted frame of the top level of a program, on top of the frame earlier programs declared variables in"""
+
+    __slots__ = ('base',)
+
+    def __init__(self, names: dict[str, int], base: 'Frame') -> None:
+        super().__init__(names)
+        self.base = base
+
+    def __contains__(self, name: str) -> bool:
+        return super().__contains__(name) or name in self.base
+
+    def __getitem__(self, name: str) -> Variable:
+        slot = self.names.get(name)
+        if slot is None or self.slots[slot] is None:
+            return self.base[name]
+        return self.slots[slot]
+
+    def close(self) -> None:
+        """Move the variables the program declared into the frame below, for the programs run after it"""
+        for name, slot in self.names.items():
+            if self.slots[slot] is not None:
+                self.base[name] = self.slots[slot]
+
+
+Frame = dict[str, Variable] | SlotFrame
+
+
+def builtin_frame() -> dict[str, Variable]:
+    """Create a frame holding the built-in types, for a program to be run in"""
+    return {
+        'int': Variable(Integer, Type, True),
+        # the names of types do not depend on what decimals are parsed as, so a rational is exact in either mode
+        'rational': Variable(Rational, Type, True),
+        'float': Variable(Float, Type, True),
+        'bool': Variable(Boolean, Type, True),
+        'array': Variable(Array, Type, True),
+    }
+
+
+class ProgramInterrupted(Exception):
+    """The program was stopped before it finished, e.g. because it took too long"""
+
+    def __init__(self, message: str = 'The program was interrupted') -> None:
+        super().__init__(message)
 
 
 class Context:
@@ -359,6 +882,12 @@ class Context:
     def __init__(self) -> None:
         self.stack: list[Frame] = []
         self.__returns: Optional[Value] = None
+        # checked by loops, so that a program can be stopped from another thread
+        self.interrupted = False
+
+    def interrupt(self) -> None:
+        """Stop the program running in the context at the next iteration of a loop"""
+        self.interrupted = True
 
     def __repr__(self) -> str:
         res = f'{type(self).__name__}(\n'
@@ -373,12 +902,7 @@ class Context:
         return self.get_variable(name).value
 
     def __setitem__(self, name: str, value: Value) -> None:
-        for frame in reversed(self.stack):
-            if name in frame:
-                if frame[name].value is not self.NONLOCAL and isinstance(value, frame[name].type) and not frame[name].const:
-                    frame[name].value = value
-                    return
-        raise NameError(f'"{name}" was not declared in the current scope, or it was declared as constant')
+        self.set_variable(name, value)
 
     def __contains__(self, name: str) -> bool:
         for frame in self.stack:
@@ -396,6 +920,10 @@ class Context:
         """Declare a variable in the top-most stack frame"""
         self.stack[-1][name] = Variable(value, typ, const)
 
+    def declare_slot(self, slot: int, typ: type | Type, value: Value = undefined, const: bool = False) -> None:
+        """Declare a variable in a slot of the top-most stack frame"""
+        self.stack[-1].slots[slot] = Variable(value, typ, const)
+
     def push(self, frame: Optional[Frame] = None) -> None:
         """Push a frame to the stack"""
         self.stack.append({} if frame is None else frame)
@@ -410,11 +938,76 @@ class Context:
             return self.stack[-1]
         return {}
 
-    def get_variable(self, name: str, *, allow_undefined: bool = False) -> Variable:
-        """Get the raw variable for the given name"""
-        for frame in reversed(self.stack):
+    def get_variable(self, name: str, *, allow_undefined: bool = False, skip: int = 0) -> Variable:
+        """Get the raw variable for the given name, ignoring the top `skip` frames"""
+        stack = self.stack
+        for i in range(len(stack) - 1 - skip, -1, -1):
+            frame = stack[i]
             if name in frame:
                 if frame[name].value is not self.NONLOCAL:
                     if allow_undefined or frame[name].value is not undefined:
                         return frame[name]
         raise NameError(f'"{name}" was not defined')
+
+    def set_variable(self, name: str, value: Value, *, skip: int = 0) -> None:
+        """Set the value of the variable with the given name, ignoring the top `skip` frames"""
+        stack = self.stack
+        for i in range(len(stack) - 1 - skip, -1, -1):
+            frame = stack[i]
+            if name in frame:
+                if frame[name].value is not self.NONLOCAL and isinstance(value, frame[name].type) and not frame[name].const:
+                    frame[name].value = value
+                    return
+        raise NameError(f'"{name}" was not declared in the current scope, or it was declared as constant')
+
+    def load(self, name: str, binding: Binding) -> Value:
+        """Get the value of a variable from where the resolver found it to be"""
+        depth, slot = binding
+        if slot is None:
+            return self.get_variable(name, skip=depth).value
+        value = self.stack[-1 - depth].slots[slot].value
+        if value is undefined:
+            return self.get_variable(name, skip=depth + 1).value
+        return value
+
+    def store(self, name: str, binding: Binding, value: Value) -> None:
+        """Set the value of a variable where the resolver found it to be"""
+        depth, slot = binding
+        if slot is None:
+            return self.set_variable(name, value, skip=depth)
+        variable = self.stack[-1 - depth].slots[slot]
+        if isinstance(value, variable.type) and not variable.const:
+            variable.value = value
+            return
+        self.set_variable(name, value, skip=depth + 1)
+
+    @staticmethod
+    def loader(name: str, binding: Binding) -> Callable[['Context'], Value]:
+        """Get a function which does what `load` does for one variable, with its binding unpacked ahead of time"""
+        depth, slot = binding
+        if slot is None:
+            return lambda context: context.get_variable(name, skip=depth).value
+        index = -1 - depth
+
+        def _load(context: Context) -> Value:
+            value = context.stack[index].slots[slot].value
+            if value is undefined:
+                return context.get_variable(name, skip=depth + 1).value
+            return value
+        return _load
+
+    @staticmethod
+    def storer(name: str, binding: Binding) -> Callable[['Context', Value], None]:
+        """Get a function which does what `store` does for one variable, with its binding unpacked ahead of time"""
+        depth, slot = binding
+        if slot is None:
+            return lambda context, value: context.set_variable(name, value, skip=depth)
+        index = -1 - depth
+
+        def _store(context: Context, value: Value) -> None:
+            variable = context.stack[index].slots[slot]
+            if isinstance(value, variable.type) and not variable.const:
+                variable.value = value
+            else:
+                context.set_variable(name, value, skip=depth + 1)
+        return _store
@@ -5,13 +5,10 @@ __version__ = '0.1'
 __all__ = ['gcd']
 
 
+import math
+
+
 def gcd(a: int, b: int) -> int:
-    """Find the greatest common divisor of a and b."""
-    x, y = abs(a), abs(b)
-    if x == 0:
-        return y
-    if y == 0:
-        return x
-    if a < 0 and b < 0:
-        return gcd(y, x % y) * -1
-    return gcd(y, x % y)
+    """Find the greatest common divisor of a and b, which is negative if both of them are."""
+    divisor = math.gcd(a, b)
+    return -divisor if a < 0 and b < 0 else divisor
@@ -2,15 +2,25 @@
 
 __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
-__all__ = ['Address', 'Connection', 'Socket']
+__all__ = [
+    'Address', 'Connection', 'Frame', 'FrameReader', 'Socket',
+    'send_buffers', 'disable_nagle', 'encode_frame',
+    'TEXT', 'BINARY', 'FRAME_FORMATS', 'FLAG_CORRELATED', 'MAX_FRAME_SIZE',
+]
 
+import mmap
 import socket
+import struct
+import threading
+import weakref
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from functools import partial
-from typing import Union, Optional, NamedTuple
+from contextlib import suppress
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Union, Optional, NamedTuple, BinaryIO
 
 from . import default_settings
+from .files import CHUNK_SIZE, ProgressCallback, file_messages
 from .message import Message, MessageType
 
 
@@ -23,12 +33,187 @@ class Address(NamedTuple):
         return f'{self.hostname}:{self.port}'
 
 
-@dataclass
+# compared by identity, so that a connection is not mistaken for an earlier one from the same address
+@dataclass(eq=False)
 class Connection:
     """Represents a network connection"""
     address: Address
     connection: socket.socket
     connected: bool = False
+    # held while a frame is sent, as replies may be sent from several threads
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    # the bytes waiting to be written to a non-blocking socket, which is sent them once it is ready to write
+    outgoing: Optional[bytearray] = field(default=None, repr=False)
+
+
+TEXT = 'text'
+BINARY = 'binary'
+FRAME_FORMATS = (BINARY, TEXT)  # in order of preference
+
+# a text frame starts with the length of its header, which is never long enough to start with the marker
+_BINARY_MARKER = 0xFF
+_BINARY_HEADER = struct.Struct('!BBBI')  # marker, type id, flags, body length
+_CORRELATION_ID = struct.Struct('!I')  # follows the header if the frame has the correlated flag
+
+FLAG_CORRELATED = 0x01
+
+# the largest frame a reader accepts, as its buffer grows to hold the whole of a frame before it is handled
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+class Frame(NamedTuple):
+    """A message as it was received, before its body is decoded"""
+    type: Optional[MessageType]
+    flags: int
+    body: bytes
+    correlation_id: Optional[int] = None
+
+
+def encode_frame(
+        message: Message, frame_format: str = TEXT, correlation_id: Optional[int] = None
+) -> list[Union[bytes, memoryview, None]]:
+    """Get the buffers to send a message as a frame of the given format, replying to `correlation_id` if it is given"""
+    if correlation_id is None:
+        correlation_id = message.correlation_id
+    if frame_format == BINARY:
+        body = message.encoded_body
+        body_length = 0 if body is None else len(body)
+        if correlation_id is None:
+            return [_BINARY_HEADER.pack(_BINARY_MARKER, message.type.id, 0, body_length), body]
+        header = _BINARY_HEADER.pack(_BINARY_MARKER, message.type.id, FLAG_CORRELATED, body_length)
+        return [header + _CORRELATION_ID.pack(correlation_id), body]
+    header_bytes, body = message.transmission_bytes
+    if correlation_id is not None:
+        header_bytes += f'\nmessage-id: {correlation_id}'.encode(default_settings.ENCODING)
+    return [len(header_bytes).to_bytes(2, 'big'), header_bytes, body]
+
+
+def send_buffers(sock: socket.socket, buffers: list[Union[bytes, memoryview, None]]) -> None:
+    """Write the buffers to the socket in as few system calls as possible, resending anything left by a partial send"""
+    buffers = [b for b in buffers if b]
+    if not hasattr(sock, 'sendmsg'):  # Windows
+        sock.sendall(b''.join(buffers))
+        return
+    views = [memoryview(b) for b in buffers]
+    while views:
+        sent = sock.sendmsg(views)
+        while views and sent >= len(views[0]):
+            sent -= len(views.pop(0))
+        if sent:
+            views[0] = views[0][sent:]
+
+
+def disable_nagle(sock: socket.socket) -> None:
+    """Send small messages as soon as they are written, rather than waiting to combine them"""
+    with suppress(OSError):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _parse_headers(header_bytes: bytes) -> dict[str, str]:
+    headers = {}
+    for line in header_bytes.decode(default_settings.ENCODING).split('\n'):
+        key, _, value = line.partition(':')
+        headers[key.strip()] = value.strip()
+    return headers
+
+
+class FrameReader:
+    """Reassembles the frames of messages from the bytes received on a socket, however they are split"""
+
+    def __init__(self, size: int = 64 * 1024, max_frame_size: int = MAX_FRAME_SIZE) -> None:
+        self.buffer = bytearray(size)
+        self.size = size
+        self.max_frame_size = max_frame_size
+        self.start = 0
+        self.end = 0
+        # the type, flags, correlation id, header size and body length of a frame whose header has been read
+        self._pending: Optional[tuple[Optional[MessageType], int, Optional[int], int, int]] = None
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def fill(self, sock: socket.socket) -> int:
+        """Receive as many bytes as are available into the buffer, returning 0 if the connection was closed"""
+        if self.end == len(self.buffer):
+            self._make_space()
+        with memoryview(self.buffer) as view:
+            received = sock.recv_into(view[self.end:])
+        self.end += received
+        return received
+
+    def _make_space(self, needed: int = 1) -> None:
+        if len(self.buffer) - self.end >= needed:
+            return
+        length = len(self)
+        if self.start:
+            self.buffer[:length] = self.buffer[self.start:self.end]
+            self.start, self.end = 0, length
+        if len(self.buffer) - self.end < needed:
+            self.buffer.extend(bytes(max(needed, len(self.buffer))))
+
+    def next_frame(self) -> Optional[Frame]:
+        """Take the next complete frame from the buffer, or None if it has not all been received yet"""
+        if self._pending is None and not self._read_header():
+            return None
+        typ, flags, correlation_id, header_size, body_length = self._pending
+        if len(self) < header_size + body_length:
+            self._make_space(header_size + body_length - len(self))
+            return None
+        body_start = self.start + header_size
+        # the body is copied so that the buffer can be reused while the message is handled
+        with memoryview(self.buffer) as view:
+            body = bytes(view[body_start:body_start + body_length])
+        self.start = body_start + body_length
+        if self.start == self.end:
+            self.start = self.end = 0
+        if len(self.buffer) > self.size and len(self) <= self.size:
+            # the buffer grew to hold a large frame, so it is shrunk again rather than holding on to the memory
+            remaining = self.buffer[self.start:self.end]
+            self.buffer = bytearray(self.size)
+            self.buffer[:len(remaining)] = remaining
+            self.start, self.end = 0, len(remaining)
+        self._pending = None
+        return Frame(typ, flags, body, correlation_id)
+
+    def _check_size(self, header_size: int, body_length: int) -> None:
+        """Reject a frame which is too large to buffer, after which the rest of the stream cannot be read"""
+        if body_length < 0:
+            raise ValueError(f'A frame cannot have a body of {body_length} bytes')
+        if header_size + body_length > self.max_frame_size:
+            raise ValueError(f'A frame of {header_size + body_length} bytes is larger than {self.max_frame_size} bytes')
+
+    def _read_header(self) -> bool:
+        """Read the header of the next frame, in whichever format it was sent in"""
+        if len(self) < 2:
+            return False
+        if self.buffer[self.start] == _BINARY_MARKER:
+            if len(self) < _BINARY_HEADER.size:
+                self._make_space(_BINARY_HEADER.size - len(self))
+                return False
+            _, type_id, flags, body_length = _BINARY_HEADER.unpack_from(self.buffer, self.start)
+            header_size = _BINARY_HEADER.size
+            correlation_id = None
+            if flags & FLAG_CORRELATED:
+                header_size += _CORRELATION_ID.size
+                if len(self) < header_size:
+                    self._make_space(header_size - len(self))
+                    return False
+                correlation_id, = _CORRELATION_ID.unpack_from(self.buffer, self.start + _BINARY_HEADER.size)
+            self._check_size(header_size, body_length)
+            self._pending = MessageType.from_id(type_id), flags, correlation_id, header_size, body_length
+            return True
+        header_length = int.from_bytes(self.buffer[self.start:self.start + 2], 'big')
+        if len(self) < 2 + header_length:
+            self._make_space(2 + header_length - len(self))
+            return False
+        header_start = self.start + 2
+        headers = _parse_headers(self.buffer[header_start:header_start + header_length])
+        typ = MessageType.from_name(headers['message-type']) if 'message-type' in headers else None
+        correlation_id = int(headers['message-id']) if 'message-id' in headers else None
+        body_length = int(headers.get('message-length', 0))
+        self._check_size(2 + header_length, body_length)
+        self._pending = typ, 0, correlation_id, 2 + header_length, body_length
+        return True
 
 
 class Socket(ABC):
@@ -38,9 +223,13 @@ class Socket(ABC):
         hostname = default_settings.HOST_NAME if hostname is None else hostname
         port = default_settings.PORT if port is None else port
         self.socket = socket.socket()
+        disable_nagle(self.socket)
         self.address = Address(hostname, port)
         self.encoding = default_settings.ENCODING
         self.is_end_of_transmission = False
+        self.readers: weakref.WeakKeyDictionary[socket.socket, FrameReader] = weakref.WeakKeyDictionary()
+        # the format of the frames sent to each socket, which is text unless another format has been negotiated
+        self.frame_formats: weakref.WeakKeyDictionary[socket.socket, str] = weakref.WeakKeyDictionary()
 
     @abstractmethod
     def connect(self) -> None:
@@ -50,40 +239,75 @@ class Socket(ABC):
     def disconnect(self) -> None:
         """Disconnect from the server"""
 
-    def send(self, message: Message, target: Union[socket.socket, Connection, None] = None) -> bool:
-        """Send a message to either `target` or the current socket"""
+    def send(
+            self, message: Message, target: Union[socket.socket, Connection, None] = None, *,
+            correlation_id: Optional[int] = None
+    ) -> bool:
+        """Send a message to either `target` or the current socket, as a reply to `correlation_id` if it is given"""
         if target is None:
             target = self.socket
         if isinstance(target, Connection):
-            target = target.connection
-        header, body = message.transmission_chunks
-        header_bytes = header.encode(default_settings.ENCODING)
-        header_length = len(header_bytes).to_bytes(2, 'big')
-        target.send(header_length)
-        target.send(header_bytes)
-        if body is not None:
-            target.send(body.encode(default_settings.ENCODING))
+            with target.lock:
+                return self.send(message, target.connection, correlation_id=correlation_id)
+        send_buffers(target, encode_frame(message, self.frame_formats.get(target, TEXT), correlation_id))
         return True
 
+    def send_file(
+            self, file: Union[str, Path, BinaryIO, mmap.mmap, bytes], name: Optional[str] = None, *,
+            target: Union[socket.socket, Connection, None] = None,
+            chunk_size: int = CHUNK_SIZE, progress: Optional[ProgressCallback] = None
+    ) -> bool:
+        """Stream a file, or the file at a path, to either `target` or the current socket in chunks"""
+        if isinstance(file, (str, Path)):
+            with open(file, 'rb') as f:
+                return self.send_file(f, Path(file).name if name is None else name,
+                                      target=target, chunk_size=chunk_size, progress=progress)
+        if name is None:
+            name = Path(getattr(file, 'name', 'file')).name
+        for message in file_messages(file, name, chunk_size=chunk_size, progress=progress):
+            self.send(message, target)
+        return True
+
+    def reader(self, target: socket.socket) -> FrameReader:
+        """Get the reader which buffers the bytes received from `target`"""
+        if (reader := self.readers.get(target)) is None:
+            reader = self.readers[target] = FrameReader()
+        return reader
+
     def receive(self, target: Union[socket.socket, Connection, None] = None) -> Optional[Message]:
         """Receive a message from either `target` or the current socket"""
         if target is None:
             target = self.socket
         if isinstance(target, Connection):
             target = target.connection
-        header_length = int.from_bytes(target.recv(2), 'big')
-        header_bytes = target.recv(header_length)
-        headers = dict(map(
-            lambda x: (x[0].strip(), x[1].strip()),
-            map(partial(str.split, sep=':'), header_bytes.decode(default_settings.ENCODING).split('\n'))
-        ))
-        if 'message-type' not in headers:
+        reader = self.reader(target)
+        while (frame := reader.next_frame()) is None:
+            if not reader.fill(target):
+                return Message.disconnect()  # the other end closed the connection without saying so
+        return self.decode(frame)
+
+    def receive_available(self, target: Union[socket.socket, Connection, None] = None) -> list[Optional[Message]]:
+        """Receive the messages which can be read from `target` without blocking, after it is ready to read"""
+        if target is None:
+            target = self.socket
+        if isinstance(target, Connection):
+            target = target.connection
+        reader = self.reader(target)
+        if not reader.fill(target):
+            return [Message.disconnect()]
+        messages = []
+        while (frame := reader.next_frame()) is not None:
+            messages.append(self.decode(frame))
+        return messages
+
+    @staticmethod
+    def decode(frame: Frame) -> Optional[Message]:
+        """Create the message represented by a received frame"""
+        if frame.type is None:
             return None  # if we don't know what the content type is, we can't handle the message
-        message_type = MessageType.from_name(headers['message-type'])
-        if message_type is MessageType.DISCONNECT:
-            return Message.disconnect()
-        if message_type.has_body:
-            message_length = int(headers['message-length'])
-            body = target.recv(message_length).decode(default_settings.ENCODING)
-            return Message(message_type, body)
-        return None
+        body = None
+        if frame.type.raw:
+            body = frame.body
+        elif frame.type.has_body:
+            body = frame.body.decode(default_settings.ENCODING)
+        return Message(frame.type, body, correlation_id=frame.correlation_id)
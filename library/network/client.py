@@ -4,17 +4,112 @@ __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
 __all__ = ['Client']
 
-from library.network._socket import Socket
-from library.network.message import Message
+import itertools
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Optional, Callable
+
+from library.network._socket import Socket, BINARY, TEXT, FRAME_FORMATS
+from library.network.message import Message, MessageType
 
 
 class Client(Socket):
     """Represents a network client"""
 
+    def __init__(self, hostname: str = None, port: int = None, *, frame_format: str = BINARY) -> None:
+        super().__init__(hostname, port)
+        # servers from before frame formats were negotiated only understand text frames
+        self.frame_format = frame_format
+        # messages received without a request waiting for them, once requests are being made
+        self.messages: queue.Queue[Message] = queue.Queue()
+        self._requests: dict[int, Future] = {}
+        # called with the partial replies to a request, which arrive before the reply resolving its future
+        self._partial_handlers: dict[int, Callable[[Message], None]] = {}
+        # correlation ids are sent as u32, so they wrap around rather than growing forever
+        self._correlation_ids = itertools.cycle(range(1, 2 ** 32))
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._receiver: Optional[threading.Thread] = None
+
     def connect(self) -> None:
         """Connect to the server"""
         self.socket.connect(self.address)
+        if self.frame_format != TEXT:
+            self.negotiate()
+
+    def negotiate(self) -> None:
+        """Agree on the format of the frames sent to and from the server"""
+        self.send(Message.negotiate(self.frame_format, TEXT))
+        reply = self.receive()
+        if reply is not None and reply.type is MessageType.NEGOTIATE and reply.body in FRAME_FORMATS:
+            self.frame_formats[self.socket] = reply.body
 
     def disconnect(self) -> None:
         """Disconnect from the server"""
         self.send(Message.disconnect())
+
+    def request(
+            self, message: Message, *, on_partial: Optional[Callable[[Message], None]] = None
+    ) -> 'Future[Message]':
+        """Send a message without waiting for the reply, which the returned future is resolved with"""
+        future = Future()
+        with self._lock:
+            correlation_id = next(self._correlation_ids)
+            self._requests[correlation_id] = future
+            if on_partial is not None:
+                self._partial_handlers[correlation_id] = on_partial
+            if self._receiver is None:
+                self._receiver = threading.Thread(target=self._receive_replies, daemon=True)
+                self._receiver.start()
+        try:
+            # frames sent from different threads must not be interleaved
+            with self._send_lock:
+                self.send(message, correlation_id=correlation_id)
+        except OSError as ex:
+            with self._lock:
+                self._requests.pop(correlation_id, None)
+                self._partial_handlers.pop(correlation_id, None)
+            future.set_exception(ex)
+        return future
+
+    def cancel(self, future: 'Future[Message]') -> bool:
+        """Ask the server to stop working on a request, returning False if its reply has already arrived"""
+        with self._lock:
+            correlation_id = next((i for i, f in self._requests.items() if f is future), None)
+        if correlation_id is None:
+            return False
+        with self._send_lock:
+            self.send(Message.cancel(correlation_id))
+        return True
+
+    def _receive_replies(self) -> None:
+        """Resolve the futures of requests as their replies arrive, until the connection is closed"""
+        try:
+            while (msg := self.receive()) is None or msg.type is not MessageType.DISCONNECT:
+                if msg is None:
+                    continue
+                if msg.type.partial:
+                    with self._lock:
+                        handler = self._partial_handlers.get(msg.correlation_id)
+                    if handler is None:
+                        self.messages.put(msg)
+                    else:
+                        handler(msg)
+                    continue
+                with self._lock:
+                    future = self._requests.pop(msg.correlation_id, None)
+                    self._partial_handlers.pop(msg.correlation_id, None)
+                if future is None:
+                    self.messages.put(msg)
+                else:
+                    future.set_result(msg)
+            error = ConnectionError('The server closed the connection before replying')
+        except OSError as ex:
+            error = ex
+        with self._lock:
+            requests, self._requests = self._requests, {}
+            self._partial_handlers.clear()
+            self._receiver = None
+        for future in requests.values():
+            future.set_exception(error)
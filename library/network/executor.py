@@ -0,0 +1,237 @@
+"""Runs the code received by a server on a pool of workers, so that a long program does not block its connection"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['CodeExecutor']
+
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Optional
+
+from library.interpreter import evaluate
+from library.interpreter.parse import Parser
+from library.interpreter.session import SessionManager
+from library.interpreter.variables import Context, ProgramInterrupted, Value, builtin_frame
+from ._socket import Connection
+from .message import Message, MessageType
+from .server import Reply
+
+_TIMEOUT_MESSAGE = 'The program timed out after {:g} seconds'
+_CANCELLED_MESSAGE = 'The program was cancelled'
+_DISCONNECTED_MESSAGE = 'The client disconnected'
+
+
+def _new_parser() -> Parser:
+    parser = Parser()
+    parser.context.push(builtin_frame())
+    return parser
+
+
+def _describe(result: Optional[Value]) -> Optional[str]:
+    return None if result is None else repr(result)
+
+
+def _run_in_process(code: str, timeout: Optional[float]) -> list[Optional[str]]:
+    """Run a program in a worker process, returning a description of the result of each statement"""
+    parser = _new_parser()
+    timer = None if timeout is None else threading.Timer(timeout, parser.context.interrupt)
+    if timer is not None:
+        timer.start()
+    try:
+        return [_describe(result) for result in evaluate(code, parser=parser, on_result=lambda _: None)]
+    except ProgramInterrupted:
+        raise ProgramInterrupted(_TIMEOUT_MESSAGE.format(timeout)) from None
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+
+@dataclass
+class _Job:
+    reply: Reply
+    future: Optional[Future] = None
+    # only known while the job is running on a thread
+    context: Optional[Context] = None
+    # why the job was interrupted, which is sent to the client instead of its result
+    reason: Optional[str] = None
+    # the result of the last statement which was run, as the results of the others are not kept
+    last: Optional[Value] = None
+
+
+class CodeExecutor:
+    """Runs programs on a pool of threads or processes, streaming the result of each statement back to the client"""
+
+    def __init__(
+            self, *, workers: int = 4, processes: bool = False, max_jobs: int = 32, timeout: Optional[float] = 10.0,
+            sessions: Optional[SessionManager] = None
+    ) -> None:
+        self.processes = processes
+        # programs run on threads keep the variables of their connection, programs run in processes start afresh.
+        # Sessions are keyed by the connection itself, as a new client may reuse the address of one which has left
+        self.sessions = SessionManager() if sessions is None else sessions
+        self.pool: Executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+        # jobs which are queued or running, beyond which new programs are refused rather than queued
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self.jobs: dict[tuple[Connection, Optional[int]], _Job] = {}
+        # the programs of each client which has one running, waiting for it to finish before they are given a worker,
+        # as a worker which waited for the session of its client would hold up the programs of every other client
+        self.queues: dict[Connection, deque[tuple[_Job, str]]] = {}
+        # reentrant, as the callback of a job which has already finished is run as soon as it is added
+        self._lock = threading.RLock()
+
+    def __repr__(self) -> str:
+        kind = 'processes' if self.processes else 'threads'
+        return f'{type(self).__name__}({kind}, jobs={len(self.jobs)}/{self.max_jobs}, timeout={self.timeout})'
+
+    def handle_message(self, send: Reply, message: Message) -> bool:
+        """Run or cancel a program as the message asks, returning False if it is not a message about programs"""
+        if message.type is MessageType.CODE:
+            self.submit(message.body, send)
+        elif message.type is MessageType.CANCEL:
+            self.cancel(send.connection, int(message.body))
+        else:
+            return False
+        return True
+
+    def submit(self, code: str, reply: Reply) -> bool:
+        """Queue a program to be run, replying with an error instead if too many programs are waiting"""
+        key = (reply.connection, reply.correlation_id)
+        with self._lock:
+            if len(self.jobs) >= self.max_jobs:
+                error = f'The server is busy running {len(self.jobs)} programs'
+            elif key in self.jobs:
+                error = f'A program with the correlation id {reply.correlation_id} is already running'
+            else:
+                job = self.jobs[key] = _Job(reply)
+                if self.processes:
+                    job.future = self.pool.submit(_run_in_process, code, self.timeout)
+                else:
+                    # the future is completed by the worker, so that a program is cancelled while it waits its turn
+                    job.future = Future()
+                    if (queue := self.queues.get(reply.connection)) is None:
+                        self.queues[reply.connection] = deque()
+                        self.pool.submit(self._run_in_turn, job, code)
+                    else:
+                        queue.append((job, code))
+                job.future.add_done_callback(partial(self._finish, key, job))
+                return True
+        self._reply(reply, Message.error(error))
+        return False
+
+    def cancel(self, connection: Connection, correlation_id: Optional[int]) -> bool:
+        """Stop a program, returning False if it is not running or cannot be stopped"""
+        with self._lock:
+            job = self.jobs.get((connection, correlation_id))
+        if job is None:
+            return False
+        if job.future.cancel():
+            return True
+        # a running process cannot be interrupted from here, so the program is left to finish or time out
+        if self.processes:
+            return False
+        self._interrupt(job, _CANCELLED_MESSAGE)
+        return True
+
+    def handle_disconnect(self, connection: Connection) -> None:
+        """Stop the programs of a client which has disconnected, and drop its session"""
+        with self._lock:
+            jobs = [job for (owner, _), job in self.jobs.items() if owner is connection]
+        for job in jobs:
+            if not job.future.cancel() and not self.processes:
+                self._interrupt(job, _DISCONNECTED_MESSAGE)
+        self.sessions.remove(connection)
+
+    def shutdown(self) -> None:
+        """Stop every program, and wait for the workers to exit"""
+        with self._lock:
+            jobs = list(self.jobs.values())
+            self.queues.clear()
+        for job in jobs:
+            if not job.future.cancel() and not self.processes:
+                self._interrupt(job, _CANCELLED_MESSAGE)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+    def _run_in_turn(self, job: _Job, code: str) -> None:
+        """Run a program of a client on a worker, then give a worker to the next program of the client"""
+        try:
+            if job.future.set_running_or_notify_cancel():
+                try:
+                    result = self._run(job, code)
+                except BaseException as ex:
+                    job.future.set_exception(ex)
+                else:
+                    job.future.set_result(result)
+        finally:
+            with self._lock:
+                queue = self.queues.get(job.reply.connection)
+                if not queue:
+                    self.queues.pop(job.reply.connection, None)
+                else:
+                    self.pool.submit(self._run_in_turn, *queue.popleft())
+
+    def _run(self, job: _Job, code: str) -> list[Optional[str]]:
+        # the programs of a client are run one at a time, so its session is never busy unless it is used elsewhere
+        with self.sessions.get(job.reply.connection).parser(blocking=False) as parser:
+            with self._lock:
+                job.context = parser.context
+                if job.reason is not None:
+                    parser.context.interrupt()
+            timer = None
+            if self.timeout is not None:
+                timer = threading.Timer(self.timeout, self._interrupt, (job, _TIMEOUT_MESSAGE.format(self.timeout)))
+                timer.daemon = True
+                timer.start()
+            try:
+                evaluate(code, parser=parser, on_result=partial(self._output, job), collect=False)
+            finally:
+                if timer is not None:
+                    timer.cancel()
+                # the context belongs to the session, so must not be interrupted once the next program is using it
+                with self._lock:
+                    job.context = None
+        return [_describe(job.last)]
+
+    def _interrupt(self, job: _Job, reason: str) -> None:
+        with self._lock:
+            if job.reason is None:
+                job.reason = reason
+            if job.context is not None:
+                job.context.interrupt()
+
+    def _output(self, job: _Job, result: Optional[Value]) -> None:
+        job.last = result
+        if result is not None and not self._reply(job.reply, Message.output(repr(result))):
+            self._interrupt(job, _DISCONNECTED_MESSAGE)
+
+    def _finish(self, key: tuple[Connection, Optional[int]], job: _Job, future: Future) -> None:
+        with self._lock:
+            if self.jobs.get(key) is job:
+                del self.jobs[key]
+        if future.cancelled():
+            self._reply(job.reply, Message.error(_CANCELLED_MESSAGE))
+        elif job.reason is not None:
+            self._reply(job.reply, Message.error(job.reason))
+        elif isinstance(ex := future.exception(), ProgramInterrupted):
+            self._reply(job.reply, Message.error(str(ex)))
+        elif ex is not None:
+            self._reply(job.reply, Message.error(f'{type(ex).__name__}: {ex}'))
+        else:
+            results = future.result()
+            # the results of a program run in another process only arrive once it has finished
+            if self.processes:
+                for result in results:
+                    if result is not None:
+                        self._reply(job.reply, Message.output(result))
+            last = results[-1] if results else None
+            self._reply(job.reply, Message.result('' if last is None else last))
+
+    @staticmethod
+    def _reply(reply: Reply, message: Message) -> bool:
+        try:
+            return reply(message)
+        except OSError:
+            return False
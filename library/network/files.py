@@ -0,0 +1,102 @@
+"""Utilities for streaming files across a connection in fixed size chunks"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = ['CHUNK_SIZE', 'ProgressCallback', 'FileReceiver', 'file_messages']
+
+import mmap
+import os
+from pathlib import Path
+from typing import Callable, Optional, Iterator, BinaryIO, Union
+
+from .message import Message, MessageType
+
+CHUNK_SIZE = 64 * 1024
+
+# called with the number of bytes transferred so far, and the size of the file if it is known
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+
+def _remaining_size(file: BinaryIO) -> Optional[int]:
+    try:
+        return os.fstat(file.fileno()).st_size - file.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def file_messages(
+        file: Union[BinaryIO, mmap.mmap, bytes], name: str, *,
+        chunk_size: int = CHUNK_SIZE, progress: Optional[ProgressCallback] = None
+) -> Iterator[Message]:
+    """Split a file into the messages which stream it, each of which must be sent before the next is taken"""
+    if isinstance(file, (mmap.mmap, bytes, bytearray, memoryview)):
+        with memoryview(file) as view:
+            yield Message.file_start(name, len(view))
+            for start in range(0, len(view), chunk_size):
+                yield Message.file_chunk(view[start:start + chunk_size])
+                if progress is not None:
+                    progress(min(start + chunk_size, len(view)), len(view))
+        yield Message.file_end()
+        return
+    size = _remaining_size(file)
+    yield Message.file_start(name, size)
+    # every chunk is read into the same buffer, so only one chunk of the file is held in memory
+    buffer = bytearray(chunk_size)
+    sent = 0
+    with memoryview(buffer) as view:
+        while read := file.readinto(buffer):
+            yield Message.file_chunk(view[:read])
+            sent += read
+            if progress is not None:
+                progress(sent, size)
+    yield Message.file_end()
+
+
+class FileReceiver:
+    """Writes the chunks of files streamed across a connection straight to disk"""
+
+    def __init__(self, directory: Union[str, Path], progress: Optional[ProgressCallback] = None) -> None:
+        self.directory = Path(directory)
+        self.progress = progress
+        self.file: Optional[BinaryIO] = None
+        self.path: Optional[Path] = None
+        self.size: Optional[int] = None
+        self.received = 0
+
+    def handle(self, message: Message) -> Optional[Path]:
+        """Handle a message of a streamed file, returning where the file was written once it is complete"""
+        if message.type is MessageType.FILE_START:
+            self.close()
+            headers = {}
+            for line in message.body.split('\n'):
+                key, _, value = line.partition(':')
+                headers[key.strip()] = value.strip()
+            # only the name of the file is used, so that it cannot be written outside of the directory
+            self.path = self.directory / Path(headers.get('name', '')).name
+            if self.path == self.directory:
+                raise ValueError('A streamed file must have a name')
+            self.size = int(headers['size']) if 'size' in headers else None
+            self.received = 0
+            self.file = open(self.path, 'wb')
+            return None
+        if self.file is None:
+            raise ValueError(f'Received "{message.type.name}" before the start of a file')
+        if message.type is MessageType.FILE_CHUNK:
+            self.file.write(message.body)
+            self.received += len(message.body)
+            if self.progress is not None:
+                self.progress(self.received, self.size)
+            return None
+        if message.type is MessageType.FILE_END:
+            path = self.path
+            self.file.close()
+            self.file = self.path = None
+            return path
+        raise ValueError(f'"{message.type.name}" is not part of a streamed file')
+
+    def close(self) -> None:
+        """Stop receiving the current file, removing what has been written of it"""
+        if self.file is not None:
+            self.file.close()
+            self.path.unlink(missing_ok=True)
+            self.file = self.path = None
@@ -5,16 +5,22 @@ __version__ = '0.1'
 __all__ = ['Message', 'MessageType']
 
 from dataclasses import dataclass, field
-from typing import Optional, Iterable
+from typing import Optional, Iterable, Union
 
 from library.network.default_settings import ENCODING
 
 
 class _MessageTypeMeta(type):
+    def __init__(cls, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        cls._by_name: dict[str, 'MessageType'] = {}
+        cls._by_id: dict[int, 'MessageType'] = {}
+
     def __iter__(cls) -> Iterable['MessageType']:
-        for k, v in cls.__dict__.items():
-            if k.isupper():
-                yield v
+        return iter(list(cls._by_id.values()))
+
+    def __len__(cls) -> int:
+        return len(cls._by_id)
 
 
 @dataclass
@@ -22,34 +28,99 @@ class MessageType(metaclass=_MessageTypeMeta):
     """Represents the different types of message"""
     name: str
     has_body: bool = True
+    # identifies the type in binary frames, so must fit in a byte
+    id: int = field(default=0, kw_only=True)
+    # the body is sent as bytes, rather than as text
+    raw: bool = field(default=False, kw_only=True)
+    # more replies to the same request follow a message of this type
+    partial: bool = field(default=False, kw_only=True)
 
     CODE: 'MessageType' = field(default=None, init=False, repr=False)
     DISCONNECT: 'MessageType' = field(default=None, init=False, repr=False)
     FILE: 'MessageType' = field(default=None, init=False, repr=False)
+    NEGOTIATE: 'MessageType' = field(default=None, init=False, repr=False)
+    FILE_START: 'MessageType' = field(default=None, init=False, repr=False)
+    FILE_CHUNK: 'MessageType' = field(default=None, init=False, repr=False)
+    FILE_END: 'MessageType' = field(default=None, init=False, repr=False)
+    OUTPUT: 'MessageType' = field(default=None, init=False, repr=False)
+    RESULT: 'MessageType' = field(default=None, init=False, repr=False)
+    ERROR: 'MessageType' = field(default=None, init=False, repr=False)
+    CANCEL: 'MessageType' = field(default=None, init=False, repr=False)
+
+    MAX_ID = 255
+
+    @classmethod
+    def register(
+            cls, name: str, *, has_body: bool = True, raw: bool = False, partial: bool = False,
+            id_: Optional[int] = None
+    ) -> 'MessageType':
+        """Register a type of message which can be sent and received, using the lowest free id unless one is given"""
+        if name in cls._by_name:
+            raise ValueError(f'A message type called "{name}" is already registered')
+        if id_ is None:
+            id_ = next((i for i in range(1, cls.MAX_ID + 1) if i not in cls._by_id), None)
+            if id_ is None:
+                raise ValueError(f'There are no free ids for the message type "{name}"')
+        elif not 0 < id_ <= cls.MAX_ID:
+            raise ValueError(f'The id of a message type must be between 1 and {cls.MAX_ID}, not {id_}')
+        elif id_ in cls._by_id:
+            raise ValueError(f'The id {id_} is already used by the message type "{cls._by_id[id_].name}"')
+        typ = cls(name, has_body, id=id_, raw=raw, partial=partial)
+        cls._by_name[name] = cls._by_id[id_] = typ
+        return typ
+
+    @classmethod
+    def unregister(cls, typ: 'MessageType') -> None:
+        """Remove a type of message, so that its name and id can be reused"""
+        if cls._by_name.get(typ.name) is typ:
+            del cls._by_name[typ.name], cls._by_id[typ.id]
 
     @classmethod
     def from_name(cls, name: str) -> 'MessageType':
         """Get a message type with the given name"""
-        for typ in cls:
-            if typ.name == name:
-                return typ
-        raise NameError(f'{name} was not found in {cls.__name__}')
-
+        try:
+            return cls._by_name[name]
+        except KeyError:
+            raise NameError(f'{name} was not found in {cls.__name__}') from None
 
-MessageType.CODE = MessageType('code')
-MessageType.DISCONNECT = MessageType('disconnect', has_body=False)
-MessageType.FILE = MessageType('file')
+    @classmethod
+    def from_id(cls, id_: int) -> 'MessageType':
+        """Get a message type with the given id"""
+        try:
+            return cls._by_id[id_]
+        except KeyError:
+            raise NameError(f'A type with the id {id_} was not found in {cls.__name__}') from None
+
+
+MessageType.CODE = MessageType.register('code', id_=1)
+MessageType.DISCONNECT = MessageType.register('disconnect', has_body=False, id_=2)
+MessageType.FILE = MessageType.register('file', id_=3)
+MessageType.NEGOTIATE = MessageType.register('negotiate', id_=4)
+MessageType.FILE_START = MessageType.register('file-start', id_=5)
+MessageType.FILE_CHUNK = MessageType.register('file-chunk', raw=True, id_=6)
+MessageType.FILE_END = MessageType.register('file-end', has_body=False, id_=7)
+MessageType.OUTPUT = MessageType.register('output', partial=True, id_=8)
+MessageType.RESULT = MessageType.register('result', id_=9)
+MessageType.ERROR = MessageType.register('error', id_=10)
+MessageType.CANCEL = MessageType.register('cancel', id_=11)
 
 
 class Message:
     """Represents a message"""
 
-    def __init__(self, typ: MessageType, body: Optional[str] = None):
+    def __init__(
+            self, typ: MessageType, body: Union[str, bytes, memoryview, None] = None, *,
+            correlation_id: Optional[int] = None
+    ):
         self.type = typ
         self.body = body
+        # matches a reply to the request it answers, so that several requests can be waiting for replies at once
+        self.correlation_id = correlation_id
 
     def __repr__(self) -> str:
-        return f'{type(self).__name__}({self.type}, body={self.body})'
+        if self.correlation_id is None:
+            return f'{type(self).__name__}({self.type}, body={self.body})'
+        return f'{type(self).__name__}({self.type}, body={self.body}, correlation_id={self.correlation_id})'
 
     @property
     def transmission_chunks(self) -> tuple[str, Optional[str]]:
@@ -62,6 +133,23 @@ class Message:
             return headers, self.body
         return headers, None
 
+    @property
+    def encoded_body(self) -> Union[bytes, memoryview, None]:
+        """Get the body as it is transmitted"""
+        if not self.type.has_body:
+            return None
+        if self.type.raw:
+            return self.body
+        return self.body.encode(ENCODING)
+
+    @property
+    def transmission_bytes(self) -> tuple[bytes, Union[bytes, memoryview, None]]:
+        """Get the encoded chunks to transmit the message in, encoding the body only once"""
+        if not self.type.has_body:
+            return f'message-type: {self.type.name}'.encode(ENCODING), None
+        body = self.encoded_body
+        return f'message-type: {self.type.name}\nmessage-length: {len(body)}'.encode(ENCODING), body
+
     @classmethod
     def code(cls, body: str):
         """A message representing a code string"""
@@ -72,6 +160,49 @@ class Message:
         """A message representing the contents of a file"""
         return cls(MessageType.FILE, body)
 
+    @classmethod
+    def file_start(cls, name: str, size: Optional[int] = None):
+        """A message announcing a file which will be streamed in chunks"""
+        headers = f'name: {name}'
+        if size is not None:
+            headers += f'\nsize: {size}'
+        return cls(MessageType.FILE_START, headers)
+
+    @classmethod
+    def file_chunk(cls, chunk: Union[bytes, memoryview]):
+        """A message holding the next chunk of a streamed file"""
+        return cls(MessageType.FILE_CHUNK, chunk)
+
+    @classmethod
+    def file_end(cls):
+        """A message marking the end of a streamed file"""
+        return cls(MessageType.FILE_END)
+
+    @classmethod
+    def negotiate(cls, *frame_formats: str):
+        """A message offering (or accepting) formats to send frames in, in order of preference"""
+        return cls(MessageType.NEGOTIATE, ','.join(frame_formats))
+
+    @classmethod
+    def output(cls, body: str):
+        """A message holding one result of a program which is still running"""
+        return cls(MessageType.OUTPUT, body)
+
+    @classmethod
+    def result(cls, body: str = ''):
+        """A message holding the final result of a program"""
+        return cls(MessageType.RESULT, body)
+
+    @classmethod
+    def error(cls, body: str):
+        """A message describing why a request failed"""
+        return cls(MessageType.ERROR, body)
+
+    @classmethod
+    def cancel(cls, correlation_id: int):
+        """A message asking the server to stop the request with the given correlation id"""
+        return cls(MessageType.CANCEL, str(correlation_id))
+
     @classmethod
     def disconnect(cls):
         """A message instructing the server to disconnect"""
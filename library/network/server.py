@@ -2,28 +2,69 @@
 
 __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
-__all__ = ['Server', 'MessageHandler']
+__all__ = ['Server', 'Reply', 'MessageHandler', 'DisconnectHandler', 'FileProgressCallback']
 
+import selectors
 import socket
 import sys
 import traceback
+from collections import deque
+from contextlib import suppress
 from functools import partial
-from typing import Callable
+from pathlib import Path
+from typing import Callable, Optional, Union
 
-from ._socket import Address, Connection, Socket
+from ._socket import Address, Connection, Socket, disable_nagle, encode_frame, FRAME_FORMATS, TEXT
+from .files import FileReceiver
 from .message import MessageType, Message
 
 
-MessageHandler = Callable[[Callable, Message], None]
+class Reply:
+    """Sends replies to a message back to the client it came from, with the correlation id of the message"""
+
+    def __init__(self, server: Socket, connection: Connection, correlation_id: Optional[int] = None) -> None:
+        self.server = server
+        self.connection = connection
+        self.correlation_id = correlation_id
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.connection.address}, correlation_id={self.correlation_id})'
+
+    def __call__(self, message: Message) -> bool:
+        return self.server.send(message, target=self.connection, correlation_id=self.correlation_id)
+
+
+MessageHandler = Callable[[Reply, Message], None]
+# called with the connection to a client once it has been closed
+DisconnectHandler = Callable[[Connection], None]
+# called with the address of the client, the number of bytes received so far, and the size of the file if it is known
+FileProgressCallback = Callable[[Address, int, Optional[int]], None]
+
+_FILE_MESSAGE_TYPES = (MessageType.FILE_START, MessageType.FILE_CHUNK, MessageType.FILE_END)
 
 
 class Server(Socket):
     """Represents a network server"""
 
-    def __init__(self, message_handler: MessageHandler, /, *, hostname: str = None, port: int = None) -> None:
+    def __init__(
+            self, message_handler: MessageHandler, /, *, hostname: str = None, port: int = None,
+            file_directory: Union[str, Path, None] = None, file_progress: Optional[FileProgressCallback] = None,
+            disconnect_handler: Optional[DisconnectHandler] = None
+    ) -> None:
         super().__init__(hostname, port)
         self.connections: dict[Address, Connection] = {}
         self.process_message = message_handler
+        # lets whatever keeps state for each client, e.g. the sessions of a `CodeExecutor`, forget about it
+        self.process_disconnect = disconnect_handler
+        # streamed files are written to this directory, then a FILE_END message with their path is handled
+        self.file_directory = None if file_directory is None else Path(file_directory)
+        self.file_progress = file_progress
+        self.file_receivers: dict[Address, FileReceiver] = {}
+        # the most bytes of replies which may wait for a client to read them, before it is disconnected
+        self.max_pending_bytes = 16 * 1024 * 1024
+        # connections served concurrently which have replies waiting, and a socket to wake the selector for them
+        self._pending_writes: deque[Connection] = deque()
+        self._wakeup: Optional[socket.socket] = None
 
     def connect(self) -> None:
         """Connect the server to the appropriate address"""
@@ -33,12 +74,14 @@ class Server(Socket):
         """Disconnect the server from the appropriate address"""
         self.socket.detach()
 
-    def start(self):
-        """Start the server"""
+    def start(self, *, concurrent: bool = False):
+        """Start the server, serving one client at a time unless `concurrent` is set"""
         self.connect()
         print('[STARTING] The server is starting...')
         self.socket.listen()
         print(f'[LISTENING] The server is listening on {self.address}')
+        if concurrent:
+            return self.serve_concurrently()
         while True:
             try:
                 conn, address = self.socket.accept()
@@ -48,21 +91,190 @@ class Server(Socket):
             except Exception as ex:
                 print(*traceback.format_exception(type(ex), ex, ex.__traceback__), sep='', file=sys.stderr)
 
-    def connect_client(self, conn: socket.socket, address: Address) -> None:
-        """Connect a client to the server"""
+    def serve_concurrently(self) -> None:
+        """Serve all the connected clients on this thread, handling each message as it arrives"""
+        wakeup, self._wakeup = socket.socketpair()
+        for s in (wakeup, self._wakeup):
+            s.setblocking(False)
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.socket, selectors.EVENT_READ)
+            selector.register(wakeup, selectors.EVENT_READ)
+            try:
+                while True:
+                    for key, events in selector.select():
+                        if key.fileobj is self.socket:
+                            self._accept_client(selector)
+                        elif key.fileobj is wakeup:
+                            with suppress(BlockingIOError):
+                                while wakeup.recv(4096):
+                                    pass
+                        else:
+                            if events & selectors.EVENT_WRITE:
+                                self._write_client(key.data)
+                            if events & selectors.EVENT_READ:
+                                self._serve_client(key.data)
+                            self._watch_client(selector, key.data)
+                    while self._pending_writes:
+                        self._watch_client(selector, self._pending_writes.popleft())
+            except KeyboardInterrupt:
+                pass
+            finally:
+                for connection in list(self.connections.values()):
+                    self.remove_client(connection)
+                waker, self._wakeup = self._wakeup, None
+                waker.close()
+                wakeup.close()
+
+    def _accept_client(self, selector: selectors.BaseSelector) -> None:
+        try:
+            conn, address = self.socket.accept()
+        except OSError as ex:
+            print(*traceback.format_exception(type(ex), ex, ex.__traceback__), sep='', file=sys.stderr)
+            return
+        # a client which does not read its replies must not stop the others being served
+        conn.setblocking(False)
+        connection = self.add_client(conn, Address(*address))
+        connection.outgoing = bytearray()
+        selector.register(conn, selectors.EVENT_READ, connection)
+
+    def _serve_client(self, connection: Connection) -> None:
+        try:
+            messages = self.receive_available(target=connection)
+        except BlockingIOError:
+            return
+        except OSError:
+            messages = [Message.disconnect()]
+        except Exception as ex:  # the rest of the stream cannot be trusted after a malformed frame
+            print(*traceback.format_exception(type(ex), ex, ex.__traceback__), sep='', file=sys.stderr)
+            messages = [Message.disconnect()]
+        for msg in messages:
+            if not connection.connected:
+                break
+            try:
+                self.handle_message(connection, msg)
+            except OSError:
+                connection.connected = False
+            except Exception as ex:
+                print(*traceback.format_exception(type(ex), ex, ex.__traceback__), sep='', file=sys.stderr)
+
+    def _write_client(self, connection: Connection) -> None:
+        with connection.lock:
+            try:
+                self._flush(connection)
+            except OSError:
+                connection.connected = False
+
+    def _watch_client(self, selector: selectors.BaseSelector, connection: Connection) -> None:
+        """Remove a client which has disconnected, or wait to write to it only while it has replies waiting"""
+        if self.connections.get(connection.address) is not connection:
+            return  # the client has already been removed
+        if not connection.connected:
+            selector.unregister(connection.connection)
+            self.remove_client(connection)
+            return
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if connection.outgoing else 0)
+        if selector.get_key(connection.connection).events != events:
+            selector.modify(connection.connection, events, connection)
+
+    @staticmethod
+    def _flush(connection: Connection) -> None:
+        """Write as many of the waiting bytes as the socket of the connection takes without blocking"""
+        outgoing = connection.outgoing
+        while outgoing:
+            try:
+                sent = connection.connection.send(outgoing)
+            except (BlockingIOError, InterruptedError):
+                return
+            del outgoing[:sent]
+
+    def send(
+            self, message: Message, target: Union[socket.socket, Connection, None] = None, *,
+            correlation_id: Optional[int] = None
+    ) -> bool:
+        """Send a message, queueing it for a client which is served concurrently rather than waiting for it to read"""
+        if not isinstance(target, Connection) or target.outgoing is None:
+            return super().send(message, target, correlation_id=correlation_id)
+        frame = encode_frame(message, self.frame_formats.get(target.connection, TEXT), correlation_id)
+        with target.lock:
+            if not target.connected:
+                raise ConnectionError(f'{target.address} has disconnected')
+            waiting = bool(target.outgoing)
+            for buffer in frame:
+                if buffer:
+                    target.outgoing += buffer
+            overflowed = len(target.outgoing) > self.max_pending_bytes
+            if overflowed:
+                target.outgoing.clear()
+                target.connected = False
+            elif not waiting:
+                self._flush(target)
+            # the selector is already waiting to write to the client if it had replies waiting before
+            wake = overflowed or (not waiting and bool(target.outgoing))
+        if wake:
+            self._pending_writes.append(target)
+            if (wakeup := self._wakeup) is not None:
+                with suppress(OSError):  # a full wakeup socket has already been written to
+                    wakeup.send(b'\0')
+        if overflowed:
+            raise ConnectionError(f'{target.address} has not read {self.max_pending_bytes} bytes of replies')
+        return True
+
+    def add_client(self, conn: socket.socket, address: Address) -> Connection:
+        """Add a newly connected client to the connections of the server"""
         print(f'[NEW CONNECTION] {address} connected to the server')
+        disable_nagle(conn)
         connection = Connection(address, conn, connected=True)
         self.connections[address] = connection
-        while self.connections[address].connected:
-            self.handle_client(connection)
-        conn.close()
+        return connection
+
+    def remove_client(self, connection: Connection) -> None:
+        """Close the connection to a client, and remove it from the connections of the server"""
+        print(f'[DISCONNECTED] {connection.address} disconnected from the server')
+        connection.connected = False
+        self.connections.pop(connection.address, None)
+        if (receiver := self.file_receivers.pop(connection.address, None)) is not None:
+            receiver.close()
+        connection.connection.close()
+        if self.process_disconnect is not None:
+            self.process_disconnect(connection)
+
+    def connect_client(self, conn: socket.socket, address: Address) -> None:
+        """Connect a client to the server, handling its messages until it disconnects"""
+        connection = self.add_client(conn, address)
+        try:
+            while connection.connected:
+                self.handle_client(connection)
+        finally:
+            self.remove_client(connection)
 
     def handle_client(self, connection: Connection) -> None:
         """Handle a client message"""
-        msg = self.receive(target=connection)
+        self.handle_message(connection, self.receive(target=connection))
+
+    def handle_message(self, connection: Connection, msg: Optional[Message]) -> None:
+        """Handle a message received from a client"""
         if msg is None:
             return
         if msg.type is MessageType.DISCONNECT:
-            self.connections[connection.address].connected = False
+            connection.connected = False
+            return
+        if msg.type is MessageType.NEGOTIATE:
+            offered = msg.body.split(',')
+            frame_format = next((f for f in offered if f in FRAME_FORMATS), TEXT)
+            # the reply is sent in the old format, as the client only switches once it is received
+            self.send(Message.negotiate(frame_format), target=connection)
+            self.frame_formats[connection.connection] = frame_format
             return
-        self.process_message(partial(self.send, target=connection), msg)
+        if msg.type in _FILE_MESSAGE_TYPES and self.file_directory is not None:
+            if (path := self.receive_file(connection, msg)) is None:
+                return
+            msg = Message(MessageType.FILE_END, str(path))
+        # replies are sent with the correlation id of the message, so the client can match them to its request
+        self.process_message(Reply(self, connection, msg.correlation_id), msg)
+
+    def receive_file(self, connection: Connection, msg: Message) -> Optional[Path]:
+        """Write part of a file streamed by a client to disk, returning the path of the file once it is complete"""
+        if (receiver := self.file_receivers.get(connection.address)) is None:
+            progress = None if self.file_progress is None else partial(self.file_progress, connection.address)
+            receiver = self.file_receivers[connection.address] = FileReceiver(self.file_directory, progress)
+        return receiver.handle(msg)
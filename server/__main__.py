@@ -12,20 +12,28 @@ __dir__ = Path(__file__).parent
 sys.path.insert(0, os.fspath(__dir__))
 sys.path.insert(1, os.fspath(__dir__.parent))
 
-from library.network.server import Server
+from library.network.executor import CodeExecutor
+from library.network.server import Server, Reply
 from library.network.message import Message, MessageType
 
+# programs are run away from the thread serving the connections, so a long program does not block the others
+executor = CodeExecutor()
 
-def handle_message(send, message: Message) -> None:
+
+def handle_message(send: Reply, message: Message) -> None:
     """Handle a message"""
     if message.type is MessageType.CODE:
         print('Received code:', message.body)
+    executor.handle_message(send, message)
 
 
 def main():
     """Put code here to be run when the module is run"""
-    server = Server(handle_message)
-    server.start()
+    server = Server(handle_message, disconnect_handler=executor.handle_disconnect)
+    try:
+        server.start(concurrent=True)
+    finally:
+        executor.shutdown()
 
 
 if __name__ == '__main__':
@@ -4,10 +4,14 @@ __author__ = 'Jonathan Leeming'
 __version__ = '0.1'
 __all__ = []
 
+import io
 import os
 import sys
+import tempfile
 from functools import partial
+from itertools import product
 from pathlib import Path
+from types import SimpleNamespace
 
 __directory__ = Path(__file__).parent
 sys.path.insert(0, os.fspath(__directory__))
@@ -15,26 +19,46 @@ sys.path.insert(1, os.fspath(__directory__.parent))
 
 import unittest
 
-from library.interpreter import evaluate
-from library.interpreter.parse import Parser
+from dependencies.sly.sly.yacc import SlyLogger
+from library import maths
+from library.interpreter import evaluate, _parse_tables
+from library.interpreter.incremental import IncrementalParser
+from library.interpreter.nodes.variables import ConstantNode
+from library.interpreter.parse import Parser, ParseCache
+from library.interpreter.scheduler import Program, Scheduler
+from library.interpreter.scope import Binding
+from library.interpreter.session import ParserPool, SessionBusy, SessionManager
 from library.interpreter.variables import (
-    Variable,
-    Type, Integer, Rational,
+    Integer, Rational, Float, Array, Function, Signature,
     Undefined, Null, Boolean,
     null, undefined, true, false,
+    ProgramInterrupted, SlotFrame, builtin_frame,
 )
 
 
+def _new_parser(decimals=Rational) -> Parser:
+    parser = Parser(decimals)
+    parser.context.push(builtin_frame())
+    return parser
+
+
+def _unwrap(value):
+    if isinstance(value, list):
+        return [_unwrap(v) for v in value]
+    if isinstance(value, Rational):
+        return type(value), value.as_tuple()
+    if value is None:
+        return None
+    return type(value), value.value
+
+
 class BaseTest(unittest.TestCase):
+    compiled = True
+
     def setUp(self) -> None:
         """Prepare for the test by creating a parser"""
-        self.parser = Parser()
-        self.parser.context.push({
-            'int': Variable(Integer, Type, True),
-            'rational': Variable(Rational, Type, True),
-            'bool': Variable(Boolean, Type, True),
-        })
-        self.evaluate = partial(evaluate, parser=self.parser)
+        self.parser = _new_parser()
+        self.evaluate = partial(evaluate, parser=self.parser, compiled=self.compiled)
 
 
 class NumbersTestCase(BaseTest):
@@ -442,6 +466,598 @@ class FunctionTestCase(BaseTest):
     def test_function_definition(self) -> None:
         pass
 
+    def test_native_functions(self) -> None:
+        handler = Integer.operator_plus
+        self.assertEqual(2, handler.arity)
+        self.assertIs(handler.native, handler.direct(2))
+        self.assertEqual(handler.call, handler.direct(1))
+        self.assertEqual(5, handler.direct(2)(Integer(2), Integer(3)).value)
+        self.assertIsNone(Function.from_native(lambda *values: values).arity)
+        self.assertIsNone(Function.from_native(lambda a, b=1: a).arity)
+
+    def test_interpreted_functions(self) -> None:
+        function = Function(Signature(), [])
+        self.assertIsNone(function.native)
+        self.assertEqual(function.call, function.direct(2))
+        with self.assertRaises(NotImplementedError):
+            function.call()
+
+
+class CompilerTestCase(unittest.TestCase):
+    programs = [
+        '1; 0.5; 105.35; true; false; null; undefined;',
+        '1 + 2 * 3; 1.1 + 2.2; 2 / 3 - 1; 0 < 1; 1 >= 2; 1 == 1; 1 != 1;',
+        'int three = 3; rational pi = three.14; pi;',
+        'int 3 = 0; int x; { nonlocal 3; x = 3; } x; { x = 3; } x;',
+        'auto x = 0; x++; x--; x += 4; x -= 1; x *= 3; x /= 9; x;',
+        'int a = 1; for (int x = 0; x < 10; x++) { a *= 2; } a;',
+        'int a = 1; while (a < 1000) a *= 2; a;',
+        'int x = 0; if (x < 1) x = 1; else x = 2; if (false) x = 3; x;',
+        'int a = 0; for (int i = 0; i < 3; i++) { for (int j = 0; j < 3; j++) { { a += i * j; } } } a;',
+        'int x = 1; int y = 0; { int x; y = x; { x = 5; y += x; } } y; x;',
+        'int y = 0; { int 2 = 7; y = 2; { y += 2; int 2 = 1; y += 2; } } y;',
+        'int n = 0; int 3 = 1; { int 3 = 2; { nonlocal 3; n = 3; } } n;',
+        'int x = 0; { rational x = 0.5; x = 1; x = 0.25; } x;',
+        'int a = 0; while (a < 5) { int b = a; b++; a = b; } a;',
+        'int a = 0; for (int i = 0; i < 4; i++) if (i < 2) { int b = i; a += b; } else a += 10; a;',
+        'int 2 = 4; 2 * 0.5; { 2 * 0.5; { int 1 = 3; 1.5 + 1; 1 == 3; } }',
+    ]
+
+    def test_compiled_matches_tree_walker(self) -> None:
+        for program in self.programs:
+            with self.subTest(program=program):
+                compiled = evaluate(program, parser=_new_parser(), compiled=True)
+                walked = evaluate(program, parser=_new_parser(), compiled=False)
+                self.assertEqual(_unwrap(walked), _unwrap(compiled))
+
+    def test_discarded_results_have_the_same_effects(self) -> None:
+        for program in self.programs:
+            for compiled in (True, False):
+                with self.subTest(program=program, compiled=compiled):
+                    collected, discarded = _new_parser(), _new_parser()
+                    evaluate(program, parser=collected, compiled=compiled)
+                    self.assertIsNone(evaluate(program, parser=discarded, compiled=compiled, collect=False))
+                    self.assertEqual(repr(collected.context.stack), repr(discarded.context.stack))
+
+    def test_compiled_errors_match_tree_walker(self) -> None:
+        for program in ('y;', '2 / 0;', 'auto x = undefined;', 'const int x = 1; x = 2;'):
+            with self.subTest(program=program):
+                for compiled in (True, False):
+                    with self.assertRaises((NameError, TypeError, ZeroDivisionError)) as cm:
+                        evaluate(program, parser=_new_parser(), compiled=compiled)
+                    if compiled:
+                        compiled_error = type(cm.exception)
+                    else:
+                        self.assertIs(compiled_error, type(cm.exception))
+
+
+class ParseCacheTestCase(BaseTest):
+    def test_repeated_code_is_parsed_once(self) -> None:
+        self.parser.cache.clear()
+        self.evaluate('auto x = 1;')
+        self.evaluate('x += 1;')
+        self.evaluate('x += 1;')
+        self.assertEqual(3, self.evaluate('x;')[0].value)
+        self.assertEqual(1, self.parser.cache.hits)
+        self.assertEqual(3, self.parser.cache.misses)
+        self.assertIs(self.parser.parse_code('x += 1;'), self.parser.parse_code('x += 1;'))
+
+    def test_cached_tree_runs_in_fresh_context(self) -> None:
+        code = 'int a = 1; for (int x = 0; x < 3; x++) { a *= 2; } a;'
+        self.assertEqual(8, self.evaluate(code)[-1].value)
+        self.assertEqual(8, evaluate(code, parser=_new_parser(), compiled=self.compiled)[-1].value)
+
+    def test_least_recently_used_tree_is_evicted(self) -> None:
+        cache = ParseCache(max_size=2)
+        a, b, c = (self.parser.parse_code(code) for code in ('1;', '2;', '3;'))
+        cache.put('1;', a)
+        cache.put('2;', b)
+        self.assertIs(a, cache.get('1;'))
+        cache.put('3;', c)
+        self.assertIsNone(cache.get('2;'))
+        self.assertIs(a, cache.get('1;'))
+        self.assertEqual(2, len(cache))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+
+class ResolverTestCase(BaseTest):
+    def test_nested_variables_are_given_slots(self) -> None:
+        tree = self.parser.parse_code('int a = 0; for (int i = 0; i < 3; i++) { int b = i; { a += b * i; } }')
+        loop = tree.children[1]
+        self.assertEqual({'i': 0}, loop.loop_names)
+        block = loop.body
+        self.assertEqual(({'b': 0}, {}), (loop.iteration_names, block.names))
+        plus_equals = block.children[1].children[0]
+        self.assertEqual(Binding(2, 0), plus_equals.binding)
+        self.assertEqual(Binding(0, 0), plus_equals.child.left.binding)
+        self.assertEqual(Binding(1, 0), plus_equals.child.right.binding)
+
+    def test_top_level_variables_are_given_slots(self) -> None:
+        with self.parser.context:
+            self.evaluate('int a = 1;')
+            tree = self.parser.parse_code('a; int b = a + 1; b;')
+            self.assertEqual({'b': 0}, tree.names)
+            self.assertEqual(Binding(1, None), tree.children[0].binding)
+            self.assertEqual(Binding(0, 0), tree.children[2].binding)
+            self.assertEqual(2, self.evaluate('a; int b = a + 1; b;')[-1].value)
+            self.assertEqual(3, self.evaluate('a + b;')[0].value)
+
+    def test_names_are_resolved_in_order(self) -> None:
+        tree = self.parser.parse_code('{ x; int x = 1; x; nonlocal x; x; }')
+        first, _, second, _, third = tree.children[0].children
+        self.assertEqual(Binding(2, None), first.binding)
+        self.assertEqual(Binding(0, 0), second.binding)
+        self.assertEqual(Binding(2, None), third.binding)
+
+    def test_literals_are_resolved(self) -> None:
+        tree = self.parser.parse_code('3; { 3; int 3 = 4; 3; }')
+        self.assertIsNone(tree.children[0].fallback.declared_in_frame)
+        literal, _, variable = tree.children[1].children
+        self.assertEqual(((), None), (literal.guards, literal.fallback))
+        self.assertTrue(variable.declared_in_frame)
+        literal, _, variable = self.evaluate('{ 3; int 3 = 4; 3; }')[0]
+        self.assertEqual((3, 4), (literal.value, variable.value))
+
+
+class ConstantFoldingTestCase(BaseTest):
+    def test_constant_expressions_are_folded(self) -> None:
+        tree = self.parser.parse_code('{ auto x = 2 * 0.5 + 1; x * 2; 2 / 0; }')
+        declaration, variable, error = tree.children[0].children
+        self.assertIsInstance(declaration.child, ConstantNode)
+        self.assertEqual((Rational, (2, 1)), _unwrap(declaration.child.value))
+        self.assertIsInstance(variable.right, ConstantNode)
+        self.assertNotIsInstance(error, ConstantNode)
+        with self.assertRaises(ZeroDivisionError):
+            self.evaluate('2 / 0;')
+
+    def test_constants_are_shared(self) -> None:
+        code = '{ 0.5; 7; }'
+        first, second = self.evaluate(code)[0], self.evaluate(code)[0]
+        self.assertIs(first[0], second[0])
+        self.assertIs(first[1], second[1])
+
+    def test_literals_can_become_variables(self) -> None:
+        with self.parser.context:
+            self.assertEqual((Rational, (1, 1)), _unwrap(self.evaluate('2 * 0.5;')[0]))
+            self.evaluate('int 2 = 4;')
+            self.assertEqual((Rational, (2, 1)), _unwrap(self.evaluate('2 * 0.5;')[0]))
+
+
+class LoopFrameTestCase(BaseTest):
+    def test_frames_are_only_pushed_for_declarations(self) -> None:
+        tree = self.parser.parse_code('for (int i = 0; i < 3; i++) { i; } while (false) { int x = 1; } while (false) { }')
+        for_loop, declaring_while, empty_while = tree.children
+        self.assertEqual({'i': 0}, for_loop.loop_names)
+        self.assertEqual({}, for_loop.iteration_names)
+        self.assertEqual({}, for_loop.body.names)
+        self.assertEqual({}, declaring_while.loop_names)
+        self.assertEqual({'x': 0}, declaring_while.iteration_names)
+        self.assertEqual({}, declaring_while.body.names)
+        self.assertEqual({}, empty_while.body.names)
+
+    def test_reused_frames_are_cleared(self) -> None:
+        with self.parser.context:
+            self.evaluate('int a = 0; int x = 10;')
+            self.evaluate('for (int i = 0; i < 3; i++) { a += x; int x = i; a += x; }')
+            self.assertEqual(33, self.evaluate('a;')[0].value)
+
+    def test_block_bodies_reuse_one_frame(self) -> None:
+        created = []
+        init = SlotFrame.__init__
+
+        def _init(frame: SlotFrame, names: dict[str, int]) -> None:
+            created.append(type(frame))
+            init(frame, names)
+        SlotFrame.__init__ = _init
+        self.addCleanup(setattr, SlotFrame, '__init__', init)
+        # a frame for the variables of the for loop, then one for the iterations of either loop
+        programs = {'for (int i = 0; i < 100; i++) { int y = i; }': 2, 'while (a < 100) { int b = a; a = b + 1; }': 1}
+        with self.parser.context:
+            self.evaluate('int a = 0;')
+            for code, frames in programs.items():
+                with self.subTest(code=code):
+                    created.clear()
+                    self.evaluate(code)
+                    self.assertEqual(frames, created.count(SlotFrame))
+
+    def test_stack_is_restored_after_errors(self) -> None:
+        height = len(self.parser.context.stack)
+        with self.assertRaises(ZeroDivisionError):
+            self.evaluate('for (int i = 0; i < 3; i++) { int x = i; x / 0; }')
+        self.assertEqual(height, len(self.parser.context.stack))
+
+
+class NumberFastPathTestCase(unittest.TestCase):
+    def test_fast_paths_match_handlers(self) -> None:
+        from library.interpreter.nodes.operator import _FAST_PATHS
+        numbers = [Integer(-3), Integer(0), Integer(7), Rational(-5, 2), Rational(1, 3), Float(-0.5), Float(2.25)]
+        for name, fast_paths in _FAST_PATHS.items():
+            for types, fast_path in fast_paths.items():
+                for operands in product(*([n for n in numbers if type(n) is typ] for typ in types)):
+                    with self.subTest(name=name, operands=operands):
+                        expected = self._handle(name, *operands)
+                        self.assertEqual(expected, self._handle(name, *operands, fast_path=fast_path))
+
+    def test_fast_paths_match_assignment_handlers(self) -> None:
+        from library.interpreter.nodes.operator import _FAST_PATHS, _EXACT_ASSIGNMENT_TYPES, _EXACT_INTEGER_ASSIGNMENTS
+        numbers = [Integer(-3), Integer(0), Integer(7), Rational(-5, 2), Rational(1, 3), Float(-0.5), Float(2.25)]
+        for name in ('plus', 'minus', 'star', 'slash'):
+            for (a_type, b_type), fast_path in _FAST_PATHS[name].items():
+                integers = (a_type, b_type) == (Integer, Integer) and name in _EXACT_INTEGER_ASSIGNMENTS
+                if a_type not in _EXACT_ASSIGNMENT_TYPES and not integers:
+                    continue
+                for a, b in ((a, b) for a in numbers for b in numbers if type(a) is a_type and type(b) is b_type):
+                    with self.subTest(name=name, a=a, b=b):
+                        expected = self._handle(name, a, b, prefix='assignment_')
+                        self.assertEqual(expected, self._handle(name, a, b, fast_path=fast_path))
+
+    @staticmethod
+    def _handle(name, *operands, fast_path=None, prefix=''):
+        try:
+            if fast_path is not None:
+                return _unwrap(fast_path(*operands))
+            if len(operands) == 1:
+                return _unwrap(getattr(operands[0], f'unary_operator_{name}').call(*operands))
+            a, b = operands
+            result = getattr(a, f'{prefix}operator_{name}').call(a, b)
+            if result is NotImplemented:
+                result = getattr(b, f'reverse_operator_{name}').call(b, a)
+            return _unwrap(result)
+        except ZeroDivisionError as ex:
+            return type(ex)
+
+    def test_small_integers_are_cached(self) -> None:
+        self.assertIs(Integer.from_int(5), Integer.from_int(5))
+        self.assertIs(Integer.from_int(-5), Integer.from_int(-5))
+        self.assertIsNot(Integer.from_int(1000), Integer.from_int(1000))
+        self.assertEqual(1000, Integer.from_int(1000).value)
+        try:
+            Integer.cache_small_integers(0, 2000)
+            self.assertIs(Integer.from_int(1000), Integer.from_int(1000))
+            self.assertIsNot(Integer.from_int(-1), Integer.from_int(-1))
+        finally:
+            Integer.cache_small_integers()
+
+    def test_gcd(self) -> None:
+        for a, b, expected in ((12, 18, 6), (-12, 18, 6), (12, -18, 6), (-12, -18, -6), (0, 5, 5), (7, 0, 7)):
+            with self.subTest(a=a, b=b):
+                self.assertEqual(expected, maths.gcd(a, b))
+        self.assertEqual(2 ** 4000, maths.gcd(2 ** 4000 * 3, 2 ** 4001 * 5))
+
+    def test_rationals_are_reduced(self) -> None:
+        code = 'rational a = 0.0; for (int i = 0; i < 40; i++) { a += 0.1; a -= 0.05; a *= 1.0; } a;'
+        self.assertEqual((Rational, (2, 1)), _unwrap(evaluate(code, parser=_new_parser()))[-1])
+        self.assertEqual((3, 4), Rational(6, 8).as_tuple())
+        self.assertEqual('3 / 4', repr(Rational(6, 8)))
+        self.assertEqual((-1, 2), Rational(1, -2).as_tuple())
+
+    def test_leading_zeros(self) -> None:
+        self.assertEqual(0, Integer(5).leading_zeros)
+        self.assertEqual(0, Integer('5').leading_zeros)
+        self.assertEqual(2, Integer('005').leading_zeros)
+        self.assertEqual(1, Integer('0').leading_zeros)
+
+
+class DecimalsTestCase(BaseTest):
+    def test_float_decimals(self) -> None:
+        code = 'int three = 3; 1.25 + 2; 7 / 2; 0.5 * 0.5; 1 < 0.5; 0.5 < 1; three.14;'
+        self.assertEqual(
+            [None, (Float, 3.25), (Float, 3.5), (Float, 0.25), (Boolean, False), (Boolean, True), (Float, 3.14)],
+            _unwrap(self.evaluate(code, decimals=Float)),
+        )
+
+    def test_modes_are_cached_separately(self) -> None:
+        code = 'auto a = 0.5; a += 0.25; a -= 1; a *= 2.0; a /= 4; a;'
+        for parser, expected in ((_new_parser(Float), (Float, -0.125)), (_new_parser(), (Rational, (-1, 8)))):
+            with parser.context:
+                self.assertEqual(expected, _unwrap(evaluate(code, parser=parser, compiled=self.compiled)[-1]))
+
+    def test_type_names_do_not_depend_on_the_mode(self) -> None:
+        parser = _new_parser(Float)
+        self.assertEqual((Rational, Float), (parser.context['rational'], parser.context['float']))
+        with parser.context:
+            results = evaluate('float f = 1 / 4; f += 0.5; f;', parser=parser, compiled=self.compiled)
+        self.assertEqual((Float, 0.75), _unwrap(results[-1]))
+
+    def test_mixed_numbers(self) -> None:
+        with self.parser.context:
+            self.evaluate('auto half = 1 / 2;')
+            code = 'half + 0.25; half - 0.25; half * 0.25; half > 0.25; half + half;'
+            self.assertEqual(
+                [(Float, 0.75), (Float, 0.25), (Float, 0.125), (Boolean, True), (Rational, (1, 1))],
+                _unwrap(self.evaluate(code, decimals=Float)),
+            )
+
+    def test_integers_are_not_assigned_other_numbers(self) -> None:
+        with self.parser.context:
+            self.evaluate('int x = 1;')
+            for code in ('x += 0.5;', 'x -= 1 / 2;', 'x *= 0.5;', 'x /= 0.5;'):
+                with self.assertRaises(TypeError):
+                    self.evaluate(code, decimals=Float)
+                with self.assertRaises(TypeError):
+                    self.evaluate(code)
+            self.assertEqual((Integer, 1), _unwrap(self.evaluate('x;')[0]))
+
+    def test_session_decimals(self) -> None:
+        sessions = SessionManager(decimals=Float)
+        with sessions.get('a').parser() as parser:
+            self.assertEqual((Float, 1.5), _unwrap(evaluate('1.5;', parser=parser, compiled=self.compiled)[0]))
+        self.assertIs(Float, sessions.get('b').decimals)
+
+
+class ArrayTestCase(BaseTest):
+    def setUp(self) -> None:
+        super().setUp()
+        self.parser.context.push()
+        self.parser.context.declare('samples', Array, Array([1, 2, 3, 4]))
+        self.parser.context.declare('offsets', Array, Array([0.5, 0.5, -0.5, -0.5]))
+
+    def _values(self, code: str) -> list:
+        return [list(result.value) for result in self.evaluate(code)]
+
+    def test_elementwise_operators(self) -> None:
+        self.assertEqual(
+            [[2, 3, 4, 5], [2, 4, 6, 8], [0.5, 1, 1.5, 2], [9, 8, 7, 6], [1.5, 2.5, 2.5, 3.5], [-1, -2, -3, -4]],
+            self._values('samples + 1; 2 * samples; samples / 2; 10 - samples; samples + offsets; 0 - samples;'),
+        )
+        self.assertEqual([[0.5, 1, 1.5, 2]], self._values('samples * 0.5;'))
+        self.assertEqual(
+            [[1, 1, 0, 0], [0, 0, 1, 1], [0, 1, 0, 0]], self._values('samples < 3; 2 < samples; samples == 2;')
+        )
+
+    def test_assignment_operators(self) -> None:
+        self.evaluate('array scaled = samples; scaled *= 3; scaled -= offsets; scaled++;')
+        self.assertEqual([3.5, 6.5, 10.5, 13.5], list(self.parser.context['scaled'].value))
+        self.assertEqual([1, 2, 3, 4], list(self.parser.context['samples'].value))
+
+    def test_get(self) -> None:
+        results = self.evaluate('samples.0; samples.3; samples.length; samples.sum; samples.min;')
+        self.assertEqual([(Float, 1.0), (Float, 4.0), (Integer, 4), (Float, 10.0), (Float, 1.0)], _unwrap(results))
+        with self.assertRaises(IndexError):
+            self.evaluate('samples.4;')
+
+    def test_conditions(self) -> None:
+        for code in ('if (samples < 3) 1;', 'while (samples > 5) { }', 'for (int i = 0; samples == i; i++) { }'):
+            with self.assertRaisesRegex(TypeError, 'cannot be used as a condition'):
+                self.evaluate(code)
+        results = self.evaluate('(samples < 3).any; (samples < 3).all; (samples > 0).all; (samples > 5).any;')
+        self.assertEqual([(Boolean, True), (Boolean, False), (Boolean, True), (Boolean, False)], _unwrap(results))
+        self.assertEqual(2, self.evaluate('int n = 1; if ((samples > n).any) n = 2; n;')[-1].value)
+
+    def test_empty(self) -> None:
+        self.parser.context.declare('empty', Array, Array([]))
+        self.assertEqual(
+            [(Integer, 0), (Float, 0.0), (Boolean, False), (Boolean, True)],
+            _unwrap(self.evaluate('empty.length; empty.sum; empty.any; empty.all;')),
+        )
+        for code in ('empty.min;', 'empty.max;'):
+            with self.assertRaisesRegex(ValueError, 'empty array'):
+                self.evaluate(code)
+
+    def test_mismatched_lengths(self) -> None:
+        self.parser.context.declare('short', Array, Array([1, 2]))
+        with self.assertRaises(ValueError):
+            self.evaluate('samples + short;')
+        with self.assertRaises(TypeError):
+            self.evaluate('samples + true;')
+
+
+class ParseTablesTestCase(unittest.TestCase):
+    def test_tables_round_trip(self) -> None:
+        signature = _parse_tables.grammar_signature(Parser._grammar, Parser.precedence)
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'parsetab.json'
+            _parse_tables.save(signature, Parser._lrtable, path)
+            tables = _parse_tables.load(signature, path)
+            self.assertEqual(Parser._lrtable.lr_action, tables.lr_action)
+            self.assertEqual(Parser._lrtable.lr_goto, tables.lr_goto)
+            self.assertEqual(Parser._lrtable.defaulted_states, tables.defaulted_states)
+            self.assertEqual((1, 0), (tables.sr_conflicts, tables.rr_conflicts))
+            self.assertIsNone(_parse_tables.load('a different grammar', path))
+
+    def test_loaded_conflicts_are_reported(self) -> None:
+        stream = io.StringIO()
+        parser = SimpleNamespace(log=SlyLogger(stream))
+        _parse_tables._report_conflicts(parser, Parser._lrtable._replace(rr_conflicts=2))
+        self.assertEqual('WARNING: 1 shift/reduce conflict\nWARNING: 2 reduce/reduce conflicts\n', stream.getvalue())
+        parser.expected_shift_reduce, parser.expected_reduce_reduce = 1, 2
+        _parse_tables._report_conflicts(parser, Parser._lrtable._replace(rr_conflicts=2))
+        self.assertEqual(2, stream.getvalue().count('\n'))
+
+    def test_missing_tables(self) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            self.assertIsNone(_parse_tables.load('', Path(directory) / 'parsetab.json'))
+
+
+class InterruptTestCase(BaseTest):
+    def test_loops_stop_when_interrupted(self) -> None:
+        for program in ('while (true) { }', 'for (int i = 0; true; i++) { int j = i; }'):
+            with self.subTest(program=program):
+                self.parser.context.interrupted = False
+                results = []
+                self.parser.context.interrupt()
+                with self.assertRaises(ProgramInterrupted):
+                    self.evaluate('1; ' + program, on_result=results.append)
+                self.assertEqual([1], [result.value for result in results])
+
+
+class InlineCacheTestCase(BaseTest):
+    def test_handlers_replaced_after_caching(self) -> None:
+        code = 'a + 3; a < 3; a *= 1;'
+        with self.parser.context:
+            self.evaluate('int a = 2;')
+            before = [result.value for result in self.evaluate(code)]
+            plus, less, times = Integer.operator_plus, Integer.operator_less, Integer.assignment_operator_star
+            try:
+                Integer.operator_plus = Integer.operator_minus
+                Integer.operator_less = Integer.operator_greater
+                Integer.assignment_operator_star = Integer.assignment_operator_plus
+                after = [result.value for result in self.evaluate(code)]
+            finally:
+                Integer.operator_plus, Integer.operator_less, Integer.assignment_operator_star = plus, less, times
+            self.assertEqual([5, True, 2], before)
+            self.assertEqual([-1, False, 3], after)
+            self.assertEqual([6, False, 3], [result.value for result in self.evaluate(code)])
+
+    def test_operand_types_change(self) -> None:
+        with self.parser.context:
+            self.evaluate('int i = 1; rational r = 0.5; rational s = 0.0;')
+            self.evaluate('for (int n = 0; n < 2; n++) { s += i + i; s += i + r; s += r + i; s += r + r; }')
+            self.assertEqual([(Rational, (12, 1))], _unwrap(self.evaluate('s;')))
+            with self.assertRaises(TypeError):
+                self.evaluate('true + i;')
+
+
+class SessionTestCase(unittest.TestCase):
+    def test_sessions_are_isolated(self) -> None:
+        sessions = SessionManager()
+        for key, code in (('a', 'int x = 1;'), ('b', 'int x = 2;'), ('a', 'x += 10;')):
+            with sessions.get(key).parser() as parser:
+                evaluate(code, parser=parser)
+        self.assertEqual((11, 2), (sessions.get('a').context['x'].value, sessions.get('b').context['x'].value))
+
+    def test_parsers_are_pooled(self) -> None:
+        pool = ParserPool(max_size=1)
+        sessions = SessionManager(pool=pool)
+        with sessions.get('a').parser() as first:
+            with sessions.get('b').parser() as second:
+                self.assertIsNot(first, second)
+        self.assertEqual(1, len(pool))
+        with sessions.get('c').parser() as third:
+            self.assertIs(second, third)
+            self.assertIs(sessions.get('c').context, third.context)
+        self.assertIsNone(third.context)
+
+    def test_idle_sessions_are_evicted(self) -> None:
+        sessions = SessionManager(idle_timeout=60)
+        idle, busy = sessions.get('idle'), sessions.get('busy')
+        idle.last_used -= 120
+        with busy.parser():
+            busy.last_used -= 120
+            self.assertEqual([idle], sessions.evict_idle())
+        self.assertNotIn('idle', sessions)
+        self.assertIsNot(idle, sessions.get('idle'))
+        self.assertIs(busy, sessions.get('busy'))
+
+    def test_busy_sessions_can_be_refused(self) -> None:
+        session = SessionManager().get('a')
+        with session.parser(blocking=False):
+            with self.assertRaises(SessionBusy):
+                with session.parser(blocking=False):
+                    pass
+        with session.parser(blocking=False) as parser:
+            evaluate('int x = 1;', parser=parser)
+        self.assertFalse(session.in_use)
+
+
+class IncrementalParserTestCase(unittest.TestCase):
+    code = 'int x = 1;\nif (x == 1) x = 2;\nwhile (x < 5) { x++; }\nx;\n'
+
+    def setUp(self) -> None:
+        """Prepare for the test by parsing some code"""
+        self.parser = IncrementalParser()
+        self.statements = self.parser.update(self.code)
+
+    def test_statements_before_the_change_are_reused(self) -> None:
+        statements = self.parser.update(self.code + 'x += 1;\n')
+        self.assertEqual(5, len(statements))
+        self.assertEqual(self.statements[:3], statements[:3])
+        self.assertEqual(3, self.parser.reused)
+        statements = self.parser.update('int y = 1;\n' + self.code)
+        self.assertEqual(0, self.parser.reused)
+        self.assertFalse(set(map(id, self.statements)) & set(map(id, statements)))
+
+    def test_else_extends_the_previous_statement(self) -> None:
+        self.parser.update('int x = 1;\nif (x == 1) x = 2;\n')
+        statements = self.parser.update('int x = 1;\nif (x == 1) x = 2;\nelse x = 3;\n')
+        self.assertEqual(2, len(statements))
+        self.assertIsNotNone(statements[1].else_)
+
+    def test_syntax_errors_are_reported(self) -> None:
+        for code in ('int y = ;\n', 'int y = 2', 'int y = 2 $;'):
+            with self.subTest(code=code):
+                self.assertIsInstance(self.parser.check(self.code + code), SyntaxError)
+                self.assertLessEqual(len(self.parser.statements), len(self.statements))
+        self.assertIsNone(self.parser.check(self.code + 'int y = 2;'))
+        self.assertEqual(5, len(self.parser.statements))
+
+    def test_syntax_errors_give_the_column_in_their_line(self) -> None:
+        error = self.parser.check(self.code + 'int y = ;\n')
+        self.assertEqual('An unexpected ";" was encountered at line 5, column 9', str(error))
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def test_stepping_matches_tree_walker(self) -> None:
+        for program in CompilerTestCase.programs:
+            with self.subTest(program=program):
+                stepped = Program(program, _new_parser().context)
+                self.assertTrue(stepped.run())
+                walked = evaluate(program, parser=_new_parser(), compiled=False)
+                self.assertEqual(_unwrap(walked), _unwrap(stepped.result))
+
+    def test_programs_are_run_in_turn(self) -> None:
+        scheduler = Scheduler(time_slice=2)
+        first = scheduler.add(Program('int a = 0; while (a < 3) a++; a;'))
+        second = scheduler.add(Program('int b = 0; b++; b;'))
+        self.assertIsNone(scheduler.step())
+        self.assertEqual(2, first.steps_taken)
+        self.assertIsNone(scheduler.step())
+        self.assertEqual([second, first], scheduler.run())
+        self.assertEqual((3, 1), (first.result[-1].value, second.result[-1].value))
+
+    def test_budgets_preempt_endless_programs(self) -> None:
+        scheduler = Scheduler(time_slice=10)
+        endless = scheduler.add(Program('int a = 0; while (true) { int b = a; a = b + 1; }', budget=100))
+        failing = scheduler.add(Program('1; 2 / 0;'))
+        quick = scheduler.add(Program('1 + 1;'))
+        self.assertEqual([failing, quick, endless], scheduler.run())
+        self.assertIsInstance(endless.error, ProgramInterrupted)
+        self.assertIsInstance(failing.error, ZeroDivisionError)
+        self.assertEqual(100, endless.steps_taken)
+        self.assertEqual(1, len(endless.context.stack))
+        self.assertEqual(33, endless.context['a'].value)
+
+    def test_budgets_count_statements(self) -> None:
+        program = Program('1 + 2 * 3 - 4 * 5 + 6; 7;', budget=3)
+        self.assertTrue(program.run())
+        self.assertEqual((2, [-7, 7]), (program.steps_taken, [r.value for r in program.result]))
+
+
+class TreeWalkerNumbersTestCase(NumbersTestCase):
+    compiled = False
+
+
+class TreeWalkerArithmeticTestCase(ArithmeticTestCase):
+    compiled = False
+
+
+class TreeWalkerVariablesTestCase(VariablesTestCase):
+    compiled = False
+
+
+class TreeWalkerOperatorTestCase(OperatorTestCase):
+    compiled = False
+
+
+class TreeWalkerControlFlowTestCase(ControlFlowTestCase):
+    compiled = False
+
+
+class TreeWalkerInterruptTestCase(InterruptTestCase):
+    compiled = False
+
+
+class TreeWalkerInlineCacheTestCase(InlineCacheTestCase):
+    compiled = False
+
+
+class TreeWalkerDecimalsTestCase(DecimalsTestCase):
+    compiled = False
+
+
+class TreeWalkerArrayTestCase(ArrayTestCase):
+    compiled = False
+
 
 if __name__ == '__main__':
     unittest.main()
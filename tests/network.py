@@ -0,0 +1,471 @@
+"""Tests to ensure the network library works"""
+
+__author__ = 'Jonathan Leeming'
+__version__ = '0.1'
+__all__ = []
+
+import mmap
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from contextlib import suppress
+from pathlib import Path
+
+__directory__ = Path(__file__).parent
+sys.path.insert(0, os.fspath(__directory__))
+sys.path.insert(1, os.fspath(__directory__.parent))
+
+import unittest
+
+from library.network._socket import Address, FrameReader, MAX_FRAME_SIZE, send_buffers, encode_frame, BINARY, TEXT
+from library.network.client import Client
+from library.network.executor import CodeExecutor
+from library.network.files import FileReceiver
+from library.network.message import Message, MessageType
+from library.network.server import Server
+
+
+def _frame(message: Message) -> bytes:
+    header, body = message.transmission_chunks
+    header_bytes = header.encode()
+    return len(header_bytes).to_bytes(2, 'big') + header_bytes + (b'' if body is None else body.encode())
+
+
+def _contents(message: Message) -> tuple[MessageType, str]:
+    return message.type, message.body
+
+
+def _wait_for(predicate, timeout: float = 5) -> bool:
+    end = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+class ConcurrentServerTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """Start a server which replies to code messages with the code in upper case"""
+        self.received: list[str] = []
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+        def handle_message(send, message: Message) -> None:
+            self.received.append(message.body)
+            send(Message.code(message.body.upper()))
+
+        self.server = Server(handle_message, hostname='127.0.0.1', port=0, file_directory=self.directory)
+        self.server.connect()
+        self.server.socket.listen()
+        self.port = self.server.socket.getsockname()[1]
+        threading.Thread(target=self.server.serve_concurrently, daemon=True).start()
+
+    def tearDown(self) -> None:
+        """Close the server socket"""
+        self.server.socket.close()
+
+    def new_client(self, **kwargs) -> Client:
+        client = Client(hostname='127.0.0.1', port=self.port, **kwargs)
+        client.connect()
+        self.addCleanup(client.socket.close)
+        return client
+
+    def test_clients_are_served_concurrently(self) -> None:
+        clients = [self.new_client() for _ in range(5)]
+        for i, client in reversed(list(enumerate(clients))):
+            client.send(Message.code(f'robot {i}'))
+        for i, client in enumerate(clients):
+            reply = client.receive()
+            self.assertIs(MessageType.CODE, reply.type)
+            self.assertEqual(f'ROBOT {i}', reply.body)
+        self.assertEqual(sorted(f'robot {i}' for i in range(5)), sorted(self.received))
+        self.assertEqual(5, len(self.server.connections))
+
+    def test_frame_formats_are_negotiated(self) -> None:
+        for frame_format in (BINARY, TEXT):
+            with self.subTest(frame_format=frame_format):
+                client = self.new_client(frame_format=frame_format)
+                self.assertEqual(frame_format, client.frame_formats.get(client.socket, TEXT))
+                client.send(Message.code('x;'))
+                self.assertEqual('X;', client.receive().body)
+
+    def test_clients_without_negotiation(self) -> None:
+        old_client = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(old_client.close)
+        old_client.sendall(_frame(Message.code('x;')))
+        reply = _frame(Message.code('X;'))
+        self.assertEqual(reply, old_client.recv(len(reply), socket.MSG_WAITALL))
+
+    def test_requests_are_pipelined(self) -> None:
+        for frame_format in (BINARY, TEXT):
+            with self.subTest(frame_format=frame_format):
+                client = self.new_client(frame_format=frame_format)
+                futures = [client.request(Message.code(f'x = {i};')) for i in range(100)]
+                client.send(Message.code('unrequested;'))
+                for i, future in enumerate(futures):
+                    reply = future.result(timeout=5)
+                    self.assertEqual(f'X = {i};', reply.body)
+                    self.assertIsNotNone(reply.correlation_id)
+                self.assertEqual('UNREQUESTED;', client.messages.get(timeout=5).body)
+
+    def test_clients_which_do_not_read_do_not_block_others(self) -> None:
+        stalled = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(stalled.close)
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        # far more replies than the socket buffers hold, none of which are read
+        request = _frame(Message.code('x' * 65536))
+        for _ in range(64):
+            stalled.sendall(request)
+        self.assertTrue(_wait_for(lambda: len(self.received) == 64))
+        client = self.new_client()
+        client.send(Message.code('still served;'))
+        self.assertEqual('STILL SERVED;', client.receive().body)
+        connection = self.server.connections[Address(*stalled.getsockname())]
+        self.assertGreater(len(connection.outgoing), 0)
+
+    def test_clients_with_too_many_unread_replies_are_disconnected(self) -> None:
+        self.server.max_pending_bytes = 1024 * 1024
+        stalled = socket.create_connection(('127.0.0.1', self.port))
+        self.addCleanup(stalled.close)
+        stalled.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.assertTrue(_wait_for(lambda: len(self.server.connections) == 1))
+        request = _frame(Message.code('x' * 65536))
+        with suppress(OSError):  # the server may close the connection before every request is sent
+            for _ in range(256):
+                stalled.sendall(request)
+        self.assertTrue(_wait_for(lambda: not self.server.connections))
+
+    def test_clients_sending_large_frames_are_disconnected(self) -> None:
+        client = self.new_client(frame_format=BINARY)
+        self.assertTrue(_wait_for(lambda: len(self.server.connections) == 1))
+        client.socket.sendall(struct.pack('!BBBI', 0xFF, MessageType.CODE.id, 0, MAX_FRAME_SIZE))
+        self.assertTrue(_wait_for(lambda: not self.server.connections))
+
+    def test_streamed_files_are_written_to_disk(self) -> None:
+        client = self.new_client()
+        data = os.urandom(300_000)
+        client.send_file(data, 'program.txt', chunk_size=4096)
+        reply = client.receive()
+        self.assertEqual(str(self.directory / 'program.txt').upper(), reply.body)
+        self.assertEqual(data, (self.directory / 'program.txt').read_bytes())
+
+    def test_connections_are_removed_on_disconnect(self) -> None:
+        first, second = self.new_client(), self.new_client()
+        self.assertTrue(_wait_for(lambda: len(self.server.connections) == 2))
+        first.disconnect()
+        self.assertTrue(_wait_for(lambda: len(self.server.connections) == 1))
+        second.socket.close()
+        self.assertTrue(_wait_for(lambda: not self.server.connections))
+
+
+class CodeExecutorTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """Start a server which runs the code it receives on a pool of two threads"""
+        self.executor = CodeExecutor(workers=2, max_jobs=3, timeout=0.5)
+        self.addCleanup(self.executor.shutdown)
+        self.server = Server(
+            self.executor.handle_message, hostname='127.0.0.1', port=0,
+            disconnect_handler=self.executor.handle_disconnect,
+        )
+        self.server.connect()
+        self.server.socket.listen()
+        self.addCleanup(self.server.socket.close)
+        threading.Thread(target=self.server.serve_concurrently, daemon=True).start()
+        self.client = Client(hostname='127.0.0.1', port=self.server.socket.getsockname()[1])
+        self.client.connect()
+        self.addCleanup(self.client.socket.close)
+
+    def test_results_are_streamed(self) -> None:
+        outputs = []
+        future = self.client.request(Message.code('int a = 2; a * 3; a + 1;'), on_partial=outputs.append)
+        self.assertEqual((MessageType.RESULT, '3'), _contents(future.result(timeout=5)))
+        self.assertEqual([(MessageType.OUTPUT, '6'), (MessageType.OUTPUT, '3')], [_contents(m) for m in outputs])
+
+    def test_connections_have_their_own_session(self) -> None:
+        self.assertIs(MessageType.RESULT, self.client.request(Message.code('int a = 1;')).result(timeout=5).type)
+        self.assertEqual('2', self.client.request(Message.code('a + 1;')).result(timeout=5).body)
+        other = Client(hostname='127.0.0.1', port=self.server.socket.getsockname()[1])
+        other.connect()
+        self.addCleanup(other.socket.close)
+        self.assertIs(MessageType.ERROR, other.request(Message.code('a;')).result(timeout=5).type)
+        self.assertEqual(2, len(self.executor.sessions))
+
+    def test_sessions_are_dropped_on_disconnect(self) -> None:
+        self.executor.timeout = None
+        self.client.request(Message.code('int a = 1;')).result(timeout=5)
+        self.client.request(Message.code('while (true) { }'))
+        self.assertTrue(_wait_for(lambda: len(self.executor.jobs) == 1))
+        self.assertEqual(1, len(self.executor.sessions))
+        self.client.disconnect()
+        self.assertTrue(_wait_for(lambda: not self.executor.sessions and not self.executor.jobs))
+
+    def test_sessions_survive_interrupted_programs(self) -> None:
+        self.client.request(Message.code('int a = 1;')).result(timeout=5)
+        reply = self.client.request(Message.code('int b = 2; while (true) { int c = b; }')).result(timeout=5)
+        self.assertIs(MessageType.ERROR, reply.type)
+        self.assertEqual('3', self.client.request(Message.code('a + b;')).result(timeout=5).body)
+
+    def test_long_programs_time_out(self) -> None:
+        looping = self.client.request(Message.code('while (true) { }'))
+        quick = self.client.request(Message.code('1 + 1;'))
+        self.assertEqual((MessageType.RESULT, '2'), _contents(quick.result(timeout=5)))
+        self.assertEqual((MessageType.ERROR, 'The program timed out after 0.5 seconds'), _contents(looping.result(5)))
+
+    def test_programs_are_cancelled(self) -> None:
+        self.executor.timeout = None
+        running = [self.client.request(Message.code('while (true) { }')) for _ in range(2)]
+        queued = self.client.request(Message.code('1;'))
+        self.assertTrue(_wait_for(lambda: len(self.executor.jobs) == 3))
+        for future in (queued, *running):
+            self.assertTrue(self.client.cancel(future))
+            self.assertEqual((MessageType.ERROR, 'The program was cancelled'), _contents(future.result(timeout=5)))
+        self.assertTrue(_wait_for(lambda: not self.executor.jobs))
+
+    def test_clients_with_several_programs_do_not_hold_up_others(self) -> None:
+        self.executor.timeout, self.executor.max_jobs = None, 4
+        looping = [self.client.request(Message.code('while (true) { }')) for _ in range(3)]
+        self.assertTrue(_wait_for(lambda: len(self.executor.jobs) == 3))
+        other = Client(hostname='127.0.0.1', port=self.server.socket.getsockname()[1])
+        other.connect()
+        self.addCleanup(other.socket.close)
+        self.assertEqual((MessageType.RESULT, '2'), _contents(other.request(Message.code('1 + 1;')).result(timeout=5)))
+        for future in looping:
+            self.assertTrue(self.client.cancel(future))
+            self.assertEqual((MessageType.ERROR, 'The program was cancelled'), _contents(future.result(timeout=5)))
+
+    def test_queue_depth_is_limited(self) -> None:
+        futures = [self.client.request(Message.code('while (true) { }')) for _ in range(4)]
+        self.assertEqual((MessageType.ERROR, 'The server is busy running 3 programs'), _contents(futures[3].result(5)))
+        for future in futures[:3]:
+            self.assertIs(MessageType.ERROR, future.result(timeout=5).type)
+
+
+class FrameReaderTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """Create a pair of connected sockets to send frames across"""
+        self.client = Client(hostname='127.0.0.1', port=0)
+        self.sender, self.receiver = socket.socketpair()
+        for s in (self.client.socket, self.sender, self.receiver):
+            self.addCleanup(s.close)
+
+    def send_in_pieces(self, data: bytes, size: int) -> threading.Thread:
+        def _send() -> None:
+            for i in range(0, len(data), size):
+                self.sender.sendall(data[i:i + size])
+                time.sleep(0)
+        thread = threading.Thread(target=_send, daemon=True)
+        thread.start()
+        return thread
+
+    def test_several_frames_in_one_read(self) -> None:
+        messages = [Message.code('a = 1;'), Message.file('ŝ' * 10), Message.code('')]
+        self.sender.sendall(b''.join(map(_frame, messages)))
+        received = self.client.receive_available(self.receiver)
+        self.assertEqual(list(map(_contents, messages)), list(map(_contents, received)))
+
+    def test_frame_formats_are_detected(self) -> None:
+        messages = [Message.code('a;'), Message.disconnect(), Message.file('ŝ'), Message.negotiate(BINARY)]
+        frame_formats = [BINARY, TEXT, BINARY, BINARY]
+        self.sender.sendall(b''.join(
+            b''.join(filter(None, encode_frame(m, f))) for m, f in zip(messages, frame_formats)
+        ))
+        received = [self.client.receive(self.receiver) for _ in messages]
+        self.assertEqual(list(map(_contents, messages)), list(map(_contents, received)))
+
+    def test_frames_spanning_reads(self) -> None:
+        small, large = Message.code('int x = 1;'), Message.file('x' * 300_000 + 'ŝ')
+        self.send_in_pieces(_frame(small) * 2, 3).join()
+        self.send_in_pieces(_frame(large) + _frame(small), 1000)
+        received = [self.client.receive(self.receiver) for _ in range(4)]
+        self.assertEqual([small.body, small.body, large.body, small.body], [m.body for m in received])
+
+    def test_large_frames_are_rejected(self) -> None:
+        for frame_format in (BINARY, TEXT):
+            with self.subTest(frame_format=frame_format):
+                reader = FrameReader(max_frame_size=1024)
+                self.sender.sendall(b''.join(filter(None, encode_frame(Message.code('x' * 2048), frame_format))))
+                # the whole frame is read, so that the next one starts at the beginning of the stream
+                while len(reader) < 2048:
+                    reader.fill(self.receiver)
+                with self.assertRaises(ValueError):
+                    reader.next_frame()
+
+    def test_buffer_shrinks_after_large_frames(self) -> None:
+        small, large = Message.code('1;'), Message.file('x' * 300_000)
+        self.send_in_pieces(_frame(large) + _frame(small), 65536)
+        received = [self.client.receive(self.receiver) for _ in range(2)]
+        self.assertEqual([large.body, small.body], [m.body for m in received])
+        reader = self.client.reader(self.receiver)
+        self.assertEqual(reader.size, len(reader.buffer))
+
+    def test_closed_connection_is_a_disconnect(self) -> None:
+        self.sender.sendall(_frame(Message.code('1;'))[:5])
+        self.sender.close()
+        self.assertIs(MessageType.DISCONNECT, self.client.receive(self.receiver).type)
+
+
+class MessageTypeTestCase(unittest.TestCase):
+    def register(self, name: str, **kwargs) -> MessageType:
+        typ = MessageType.register(name, **kwargs)
+        self.addCleanup(MessageType.unregister, typ)
+        return typ
+
+    def test_types_are_found_by_name_and_id(self) -> None:
+        for typ in (MessageType.CODE, MessageType.DISCONNECT, MessageType.FILE, MessageType.NEGOTIATE):
+            self.assertIs(typ, MessageType.from_name(typ.name))
+            self.assertIs(typ, MessageType.from_id(typ.id))
+        with self.assertRaises(NameError):
+            MessageType.from_name('telemetry')
+        with self.assertRaises(NameError):
+            MessageType.from_id(200)
+
+    def test_custom_types(self) -> None:
+        telemetry = self.register('telemetry')
+        heartbeat = self.register('heartbeat', has_body=False, id_=200)
+        self.assertNotIn(telemetry.id, (1, 2, 3, 4))
+        self.assertIs(telemetry, MessageType.from_name('telemetry'))
+        self.assertIs(heartbeat, MessageType.from_id(200))
+        self.assertIn(heartbeat, list(MessageType))
+        client = Client(hostname='127.0.0.1', port=0)
+        sender, receiver = socket.socketpair()
+        for s in (client.socket, sender, receiver):
+            self.addCleanup(s.close)
+        for frame_format in (BINARY, TEXT):
+            client.frame_formats[sender] = frame_format
+            client.send(Message(telemetry, 'speed: 3'), target=sender)
+            client.send(Message(heartbeat), target=sender)
+            self.assertEqual((telemetry, 'speed: 3'), _contents(client.receive(receiver)))
+            self.assertEqual((heartbeat, None), _contents(client.receive(receiver)))
+
+    def test_names_and_ids_are_unique(self) -> None:
+        self.register('ack', id_=100)
+        clashes = (('ack', None), ('code', None), ('acknowledge', 100), ('acknowledge', 0), ('acknowledge', 256))
+        for name, id_ in clashes:
+            with self.subTest(name=name, id_=id_), self.assertRaises(ValueError):
+                MessageType.register(name, id_=id_)
+
+
+class FileStreamTestCase(unittest.TestCase):
+    def setUp(self) -> None:
+        """Create a pair of connected sockets and a directory to stream files into"""
+        self.client = Client(hostname='127.0.0.1', port=0)
+        self.sender, self.receiver = socket.socketpair()
+        for s in (self.client.socket, self.sender, self.receiver):
+            self.addCleanup(s.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.data = os.urandom(1_000_000)
+        self.source = self.directory / 'source.bin'
+        self.source.write_bytes(self.data)
+
+    def stream(self, file, **kwargs) -> threading.Thread:
+        thread = threading.Thread(
+            target=self.client.send_file, args=(file, 'received.bin'),
+            kwargs={'target': self.sender, 'chunk_size': 8192, **kwargs}, daemon=True
+        )
+        thread.start()
+        return thread
+
+    def receive_file(self, progress=None) -> Path:
+        receiver = FileReceiver(self.directory, progress)
+        while (path := receiver.handle(self.client.receive(self.receiver))) is None:
+            pass
+        return path
+
+    def test_files_are_streamed(self) -> None:
+        with open(self.source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for file in (self.source, f, mapped, self.data):
+                with self.subTest(file=type(file).__name__):
+                    self.stream(file)
+                    path = self.receive_file()
+                    self.assertEqual(self.directory / 'received.bin', path)
+                    self.assertEqual(self.data, path.read_bytes())
+
+    def test_memory_is_bounded(self) -> None:
+        sent, received = [], []
+        thread = self.stream(self.source, progress=lambda n, size: sent.append((n, size)))
+        self.receive_file(lambda n, size: received.append((n, size)))
+        thread.join()
+        self.assertEqual((len(self.data), len(self.data)), sent[-1])
+        self.assertEqual(sent, received)
+        self.assertLessEqual(len(self.client.reader(self.receiver).buffer), 64 * 1024)
+
+    def test_incomplete_files_are_removed(self) -> None:
+        receiver = FileReceiver(self.directory)
+        receiver.handle(Message.file_start('../partial.bin'))
+        receiver.handle(Message.file_chunk(b'abc'))
+        self.assertTrue((self.directory / 'partial.bin').exists())
+        receiver.close()
+        self.assertFalse((self.directory / 'partial.bin').exists())
+        with self.assertRaises(ValueError):
+            receiver.handle(Message.file_chunk(b'abc'))
+
+
+class RequestTestCase(unittest.TestCase):
+    def test_correlation_ids_are_sent(self) -> None:
+        client = Client(hostname='127.0.0.1', port=0)
+        sender, receiver = socket.socketpair()
+        for s in (client.socket, sender, receiver):
+            self.addCleanup(s.close)
+        for frame_format in (BINARY, TEXT):
+            client.frame_formats[sender] = frame_format
+            client.send(Message(MessageType.CODE, '1;', correlation_id=7), target=sender)
+            client.send(Message(MessageType.CODE, '2;', correlation_id=7), target=sender, correlation_id=2 ** 32 - 1)
+            client.send(Message.disconnect(), target=sender)
+            ids = [client.receive(receiver).correlation_id for _ in range(3)]
+            self.assertEqual([7, 2 ** 32 - 1, None], ids)
+
+    def test_requests_fail_when_the_connection_closes(self) -> None:
+        client = Client(hostname='127.0.0.1', port=0)
+        client.socket.close()
+        client.socket, server = socket.socketpair()
+        self.addCleanup(client.socket.close)
+        future = client.request(Message.code('1;'))
+        self.assertEqual('1;', client.receive(server).body)
+        server.close()
+        with self.assertRaises(ConnectionError):
+            future.result(timeout=5)
+
+
+class SendTestCase(unittest.TestCase):
+    def test_partial_sends_are_resent(self) -> None:
+        class _Socket:
+            def __init__(self) -> None:
+                self.calls = 0
+                self.sent = b''
+
+            def sendmsg(self, buffers) -> int:
+                self.calls += 1
+                data = b''.join(buffers)[:5]
+                self.sent += data
+                return len(data)
+
+        sock = _Socket()
+        send_buffers(sock, [b'ab', b'', b'cdefgh', None, b'ijklmnopq'])
+        self.assertEqual(b'abcdefghijklmnopq', sock.sent)
+        self.assertEqual(4, sock.calls)
+
+    def test_sent_frames(self) -> None:
+        client = Client(hostname='127.0.0.1', port=0)
+        sender, receiver = socket.socketpair()
+        for s in (client.socket, sender, receiver):
+            self.addCleanup(s.close)
+        message = Message.code('ŝ' * 100)
+        client.send(message, target=sender)
+        self.assertEqual(_frame(message), receiver.recv(1024))
+
+    def test_nagle_is_disabled(self) -> None:
+        client = Client(hostname='127.0.0.1', port=0)
+        self.addCleanup(client.socket.close)
+        self.assertTrue(client.socket.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY))
+
+
+if __name__ == '__main__':
+    unittest.main()